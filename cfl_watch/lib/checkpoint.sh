@@ -0,0 +1,56 @@
+#!/data/data/com.termux/files/usr/bin/bash
+
+# Checkpoint journal for batch runs (tools/batch_trips.sh) and scenario phases.
+# Depends on: nothing (sourced by lib/common.sh and tools/batch_trips.sh, which
+# runs without -e: no shell options are set here).
+#
+# Append-only text file, one event per line (a torn last line is ignored):
+#   <epoch>|<event>|<trip_id>|<attempt>|<detail>
+# Events: run, ok, fail (final), retry (scheduled, detail "rc=N due=<epoch>"),
+#         phase (detail = scenario phase reached: start_set, destination_set, ...)
+#
+# Provides:
+#   ckpt_write <file> <event> <trip_id> <attempt> [detail]
+#   ckpt_phase <name>           scenario side, no-op outside a batch
+#   ckpt_load <file>            fills CKPT_STATE[id] (ok|fail), CKPT_RUNS[id], CKPT_PHASE[id]
+#   ckpt_last_phase <file> <id> last phase reached by a trip (failure reports)
+#
+# Env (exported by batch_trips.sh for the scenario):
+#   CFL_CHECKPOINT_FILE, CFL_CHECKPOINT_TRIP, CFL_CHECKPOINT_ATTEMPT
+
+ckpt_write(){
+  local file="$1" ev="$2" id="$3" att="$4" detail="${5:-}"
+  # '|' and newlines would break the line format
+  detail="${detail//|//}"
+  detail="${detail//$'\n'/ }"
+  printf '%s|%s|%s|%s|%s\n' "$(date +%s)" "$ev" "$id" "$att" "$detail" >> "$file"
+}
+
+ckpt_phase(){
+  # usage: ckpt_phase <name>
+  [ -n "${CFL_CHECKPOINT_FILE:-}" ] && [ -n "${CFL_CHECKPOINT_TRIP:-}" ] || return 0
+  ckpt_write "$CFL_CHECKPOINT_FILE" phase "$CFL_CHECKPOINT_TRIP" "${CFL_CHECKPOINT_ATTEMPT:-0}" "$1" 2>/dev/null || true
+  return 0
+}
+
+ckpt_load(){
+  # usage: ckpt_load <file>
+  declare -gA CKPT_STATE=() CKPT_RUNS=() CKPT_PHASE=()
+  local ts ev id att detail
+  [ -f "$1" ] || return 0
+  while IFS='|' read -r ts ev id att detail; do
+    [ -n "$id" ] || continue
+    case "$ev" in
+      run)   CKPT_RUNS[$id]="$att"; unset 'CKPT_STATE[$id]' ;;
+      ok)    CKPT_STATE[$id]=ok ;;
+      fail)  CKPT_STATE[$id]=fail ;;
+      phase) CKPT_PHASE[$id]="$detail" ;;
+    esac
+  done < "$1"
+}
+
+ckpt_last_phase(){
+  # usage: ckpt_last_phase <file> <trip_id>  -> last phase journaled for the trip
+  [ -f "$1" ] || return 0
+  awk -F'|' -v id="$2" '$2 == "phase" && $3 == id { p = $5 } END { if (p != "") print p }' "$1"
+}
@@ -37,6 +37,12 @@ die(){ printf '[!!] %s\n' "$*" >&2; exit 1; }
 
 need(){ command -v "$1" >/dev/null 2>&1 || die "Missing dependency: $1"; }
 
+# activity / IME / focus sampler shared by all wait helpers (TTL cache)
+. "$COMMON_DIR/device_state.sh"
+
+# checkpoint journal (batch_trips.sh resume, scenario phases)
+. "$COMMON_DIR/checkpoint.sh"
+
 ensure_dirs(){
   mkdir -p "$CFL_CODE_DIR" "$CFL_TMP_DIR" "$CFL_ARTIFACT_DIR" "$CFL_LOG_DIR" "$CFL_RUNS_DIR" "$CFL_SCENARIO_DIR"
 }
@@ -158,11 +164,8 @@ self_check(){
 
 current_activity(){
   # Exemple de sortie: com.package/.MainActivity
-  adb shell dumpsys activity activities 2>/dev/null \
-    | tr -d '\r' \
-    | grep -m1 -E 'mResumedActivity|topResumedActivity' \
-    | sed -E 's/.* ([^ ]+) .*/\1/' \
-    || true
+  # (lu depuis le cache devstate: un seul aller-retour adb par tick)
+  devstate_get activity || true
 }
 
 wait_activity(){
@@ -252,18 +255,8 @@ wait_ui_resid(){
 }
 
 ime_is_shown(){
-  local out vis
-  out="$(adb shell dumpsys input_method 2>/dev/null | tr -d '\r' || true)"
-
-  # Cas fréquents selon version Android
-  if printf '%s' "$out" | grep -Eq 'mInputShown=true|mIsInputViewShown=true'; then
-    return 0
-  fi
-
-  # Fallback: visibilité IME en hex (souvent présent)
-  vis="$(printf '%s' "$out" | grep -Eo 'mImeWindowVis=0x[0-9a-f]+' | head -n1 | cut -d= -f2)"
-  [ -n "$vis" ] || return 1
-  [ "$vis" != "0x0" ]
+  # ime=1 (mInputShown/mIsInputViewShown=true ou mImeWindowVis != 0), voir device_state.sh
+  [ "$(devstate_get ime || true)" = "1" ]
 }
 
 wait_keyboard_shown(){
@@ -0,0 +1,142 @@
+#!/data/data/com.termux/files/usr/bin/bash
+set -euo pipefail
+
+# Cached device state (resumed activity, IME visibility, focused window).
+# Depends on: warn (from lib/common.sh), adb serial setup (CFL_SERIAL).
+#
+# One filtered device-side command samples everything in a single adb round
+# trip; the parsed result is cached in a local file with a short TTL. Every
+# wait helper (current_activity, ime_is_shown, _ui_wait_ime_*, snap_watch meta)
+# reads the cache, so N concurrent waits (even from different processes)
+# cost one adb call per tick instead of N full dumpsys.
+#
+# Provides:
+#   devstate_refresh [max_age_ms]   ensure the cache is at most max_age_ms old
+#   devstate_get <key> [max_age_ms] print activity | ime (1/0/empty) | focus | focused_app
+#
+# Env knobs:
+#   DEVSTATE_TTL_MS        (default 150)  cache lifetime
+#   DEVSTATE_LOCK_WAIT_MS  (default 3000) max wait on another sampler
+#   DEVSTATE_CACHE         (default ${TMPDIR:-/tmp}/cfl_devstate_<serial>)
+#   DEVSTATE_DEBUG=1       log each adb sample on stderr
+
+: "${DEVSTATE_TTL_MS:=150}"
+: "${DEVSTATE_LOCK_WAIT_MS:=3000}"
+: "${DEVSTATE_DEBUG:=0}"
+DEVSTATE_CACHE="${DEVSTATE_CACHE:-${TMPDIR:-/tmp}/cfl_devstate_$(printf '%s' "${CFL_SERIAL:-default}" | tr -c 'A-Za-z0-9._-' '_')}"
+
+# grep runs on the device: only a handful of lines cross adb
+_DEVSTATE_REMOTE='echo @activity; dumpsys activity activities | grep -m1 -E "mResumedActivity|topResumedActivity";
+echo @ime; dumpsys input_method | grep -E "mInputShown|mIsInputShown|mIsInputViewShown|mImeWindowVis" | head -n 6;
+echo @window; dumpsys window | grep -E "mCurrentFocus|mFocusedApp" | head -n 2'
+
+_devstate_now_ms(){
+  if [ -n "${EPOCHREALTIME:-}" ]; then
+    local t="${EPOCHREALTIME/[.,]/}"
+    printf '%s' "${t:0:${#t}-3}"
+  else
+    printf '%s' $(( $(date +%s%N) / 1000000 ))
+  fi
+}
+
+_devstate_fresh(){
+  # cache file first line is ts=<ms>
+  local max_age="$1" line ts
+  [ -s "$DEVSTATE_CACHE" ] || return 1
+  IFS= read -r line < "$DEVSTATE_CACHE" || return 1
+  ts="${line#ts=}"
+  [[ "$ts" =~ ^[0-9]+$ ]] || return 1
+  [ $(( $(_devstate_now_ms) - ts )) -le "$max_age" ]
+}
+
+_devstate_parse(){
+  # stdin: raw output of $_DEVSTATE_REMOTE -> key=value lines
+  local section="" line activity="" ime_raw="" focus="" focused_app="" ime=""
+  local -a words
+  while IFS= read -r line; do
+    line="${line%$'\r'}"
+    case "$line" in
+      @activity|@ime|@window) section="${line#@}"; continue ;;
+    esac
+    case "$section" in
+      activity)
+        # "  mResumedActivity: ActivityRecord{abc u0 com.pkg/.Main t12}"
+        read -ra words <<<"$line"
+        [ "${#words[@]}" -ge 2 ] && activity="${words[${#words[@]}-2]}"
+        ;;
+      ime) ime_raw+="$line"$'\n' ;;
+      window)
+        line="${line#"${line%%[![:space:]]*}"}"
+        case "$line" in
+          mCurrentFocus=*) focus="${line#mCurrentFocus=}" ;;
+          mFocusedApp=*) focused_app="${line#mFocusedApp=}" ;;
+        esac
+        ;;
+    esac
+  done
+
+  # same precedence as the former dumpsys-per-call ime_is_shown: a *Shown=true
+  # flag, else a non-zero mImeWindowVis (it wins over mInputShown=false, which
+  # some builds keep stale while the keyboard is up); the explicit false flag
+  # only decides on builds without an mImeWindowVis line
+  if [[ "$ime_raw" =~ m(InputShown|IsInputShown|IsInputViewShown)=true ]]; then
+    ime=1
+  elif [[ "$ime_raw" =~ mImeWindowVis=(0x)?([0-9a-fA-F]+) ]]; then
+    [[ "${BASH_REMATCH[2]}" =~ ^0+$ ]] && ime=0 || ime=1
+  elif [[ "$ime_raw" =~ m(InputShown|IsInputShown|IsInputViewShown)=false ]]; then
+    ime=0
+  fi
+
+  printf 'activity=%s\nime=%s\nfocus=%s\nfocused_app=%s\n' "$activity" "$ime" "$focus" "$focused_app"
+}
+
+_devstate_sample(){
+  local raw body tmp t0
+  t0="$(_devstate_now_ms)"
+  raw="$(adb -s "$CFL_SERIAL" shell "$_DEVSTATE_REMOTE" 2>/dev/null)" || {
+    [ -n "$raw" ] || return 1
+  }
+  body="$(_devstate_parse <<<"$raw")"
+  tmp="$DEVSTATE_CACHE.$$"
+  printf 'ts=%s\n%s\n' "$(_devstate_now_ms)" "$body" > "$tmp" && mv -f "$tmp" "$DEVSTATE_CACHE"
+  if [ "$DEVSTATE_DEBUG" = "1" ]; then
+    printf '[D] devstate sample %sms: %s\n' $(( $(_devstate_now_ms) - t0 )) "${body//$'\n'/ }" >&2
+  fi
+}
+
+devstate_refresh(){
+  local max_age="${1:-$DEVSTATE_TTL_MS}"
+  local lock="$DEVSTATE_CACHE.lock"
+  local rc=0 waited=0
+
+  _devstate_fresh "$max_age" && return 0
+
+  if ! mkdir "$lock" 2>/dev/null; then
+    # another waiter is sampling: share its round trip
+    while [ "$waited" -lt "$DEVSTATE_LOCK_WAIT_MS" ]; do
+      sleep 0.02
+      waited=$((waited + 20))
+      _devstate_fresh "$max_age" && return 0
+      [ -d "$lock" ] || break
+    done
+    # sampler died (or was too slow): take over the lock
+    rm -rf "$lock" 2>/dev/null || true
+    mkdir "$lock" 2>/dev/null || true
+  fi
+
+  _devstate_sample || rc=$?
+  rmdir "$lock" 2>/dev/null || true
+  return "$rc"
+}
+
+devstate_get(){
+  local want="$1" max_age="${2:-$DEVSTATE_TTL_MS}" k v
+  devstate_refresh "$max_age" || return 1
+  while IFS='=' read -r k v; do
+    if [ "$k" = "$want" ]; then
+      printf '%s' "$v"
+      return 0
+    fi
+  done < "$DEVSTATE_CACHE"
+  return 1
+}
@@ -0,0 +1,157 @@
+#!/data/data/com.termux/files/usr/bin/bash
+set -euo pipefail
+
+# Flight recorder: keep the last N snapshots in a local ring instead of writing
+# every step to the run directory.
+# Depends on: log, warn, snap_ts, _snap_do, SNAP_DIR/PNG_DIR/XML_DIR (lib/snap.sh).
+#
+# With FLIGHT_RECORDER=1, snapshots (snap, snap_from_dump, ui_snap) copy the dump
+# the step already has into a ring under FLIGHT_RECORDER_DIR (app-private tmp,
+# not /sdcard) and drop the oldest beyond FLIGHT_RECORDER_N: no extra
+# uiautomator dump, no screencap, nothing written to the run dir on the happy
+# path. The ring reaches the run dir only through flight_finish on failure,
+# timeout (TERM/INT) or a flight_mark (loop breaker, step limit), together with
+# one dump + screencap of the screen at that moment; the caller then builds the
+# viewer. A successful run only gets summary.txt.
+#
+# Provides:
+#   flight_enabled
+#   flight_record <base> [xml_src]   add a snapshot to the ring
+#   flight_mark <reason>             persist at exit even if rc=0
+#   flight_trap_signals              TERM/INT/PIPE -> exit 124/130/141 (EXIT trap sees a failure)
+#   flight_finish <rc>               0 = ring persisted (build the viewer), 1 = summary only / off
+#
+# Env knobs:
+#   FLIGHT_RECORDER       (default 0)  1 = ring instead of per-step artifacts
+#   FLIGHT_RECORDER_N     (default 12) snapshots kept
+#   FLIGHT_RECORDER_PNG   (default 0)  1 = also screencap each snapshot into the ring (adb exec-out)
+#   FLIGHT_RECORDER_DIR   (default ${TMPDIR:-/tmp}/cfl_flight.$$)
+
+: "${FLIGHT_RECORDER:=0}"
+: "${FLIGHT_RECORDER_N:=12}"
+: "${FLIGHT_RECORDER_PNG:=0}"
+
+# $$ is the top-level script (same in subshells): one ring per run
+FLIGHT_RECORDER_DIR="${FLIGHT_RECORDER_DIR:-${TMPDIR:-/tmp}/cfl_flight.$$}"
+
+flight_enabled(){ [ "$FLIGHT_RECORDER" = "1" ]; }
+
+flight_record(){
+  # usage: flight_record <base> [xml_src]
+  local base="$1" xml="${2:-}"
+  local dir="$FLIGHT_RECORDER_DIR" total old
+  mkdir -p "$dir" || return 0
+
+  if [ -n "$xml" ] && [ -s "$xml" ]; then
+    cp -f "$xml" "$dir/${base}.xml" 2>/dev/null || warn "flight: copy xml failed: $base"
+  fi
+  if [ "$FLIGHT_RECORDER_PNG" = "1" ]; then
+    adb -s "$SERIAL" exec-out screencap -p > "$dir/${base}.png" 2>/dev/null || rm -f "$dir/${base}.png"
+  fi
+
+  # index keeps every base (for the summary); files only for the last N
+  printf '%s\n' "$base" >> "$dir/index"
+  total="$(wc -l < "$dir/index")"
+  if [ "$total" -gt "$FLIGHT_RECORDER_N" ]; then
+    old="$(sed -n "$((total - FLIGHT_RECORDER_N))p" "$dir/index")"
+    [ -n "$old" ] && rm -f "$dir/${old}.xml" "$dir/${old}.png"
+  fi
+  log "flight: $base ($total)"
+}
+
+flight_mark(){
+  # usage: flight_mark <reason>
+  flight_enabled || return 0
+  mkdir -p "$FLIGHT_RECORDER_DIR" || return 0
+  grep -qxF "$1" "$FLIGHT_RECORDER_DIR/marks" 2>/dev/null && return 0
+  printf '%s\n' "$1" >> "$FLIGHT_RECORDER_DIR/marks"
+  warn "flight: marked ($1) -> snapshots kept at exit"
+}
+
+_flight_on_signal(){
+  # timeout signals the whole process group: further signals must not cut the
+  # EXIT trap, and the attach_log tee may be gone (write to the log file directly)
+  trap '' TERM INT PIPE
+  if [ -n "${CFL_LOG_FILE:-}" ]; then
+    exec >>"$CFL_LOG_FILE" 2>&1
+  else
+    exec >/dev/null 2>&1
+  fi
+  exit "$1"
+}
+
+flight_trap_signals(){
+  # bash runs the EXIT trap with rc=0 when killed: make timeouts look like failures
+  trap '_flight_on_signal 124' TERM
+  trap '_flight_on_signal 130' INT
+  # timeout kills the attach_log tee too: the next log line would SIGPIPE the
+  # script before any EXIT trap runs
+  trap '_flight_on_signal 141' PIPE
+}
+
+_flight_count(){
+  [ -s "$FLIGHT_RECORDER_DIR/index" ] && wc -l < "$FLIGHT_RECORDER_DIR/index" || echo 0
+}
+
+_flight_persist(){
+  # usage: _flight_persist <reason> <rc>
+  local reason="$1" rc="${2:-1}" f base kept=0
+  mkdir -p "$XML_DIR" "$PNG_DIR"
+  for f in "$FLIGHT_RECORDER_DIR"/*.xml "$FLIGHT_RECORDER_DIR"/*.png; do
+    [ -e "$f" ] || continue
+    case "$f" in
+      *.xml) mv -f "$f" "$XML_DIR/" ;;
+      *.png) mv -f "$f" "$PNG_DIR/" ;;
+    esac
+    kept=$((kept + 1))
+  done
+
+  # the screen as it was when the run stopped
+  base="$(snap_ts)__flight_$(safe_tag "$reason")"
+  _snap_do "$base" 3
+
+  {
+    # marked: the run exited 0 but hit a mark (loop_breaker, step_limit...)
+    [ "$rc" -eq 0 ] && echo "status=marked" || echo "status=failed"
+    echo "rc=$rc"
+    echo "reason=$reason"
+    echo "snapshots=$(_flight_count)"
+    echo "kept_files=$kept"
+    echo "ring_size=$FLIGHT_RECORDER_N"
+    [ -s "$FLIGHT_RECORDER_DIR/marks" ] && echo "marks=$(paste -sd, "$FLIGHT_RECORDER_DIR/marks")"
+  } > "$SNAP_DIR/flight.txt"
+  log "flight: persisted ($reason) -> $SNAP_DIR"
+}
+
+_flight_summary(){
+  local rc="$1" last=""
+  [ -s "$FLIGHT_RECORDER_DIR/index" ] && last="$(tail -n 1 "$FLIGHT_RECORDER_DIR/index")"
+  {
+    echo "status=ok"
+    echo "rc=$rc"
+    echo "snapshots=$(_flight_count)"
+    echo "last=$last"
+    echo "ended=$(date +%Y-%m-%dT%H:%M:%S)"
+  } > "$SNAP_DIR/summary.txt"
+}
+
+flight_finish(){
+  # usage: flight_finish <rc>  (from the EXIT trap)
+  local rc="$1" reason=""
+  flight_enabled || return 1
+  [ -n "${SNAP_DIR:-}" ] || return 1
+
+  case "$rc" in
+    0) [ -s "$FLIGHT_RECORDER_DIR/marks" ] && reason="$(head -n 1 "$FLIGHT_RECORDER_DIR/marks")" ;;
+    124|130|143) reason="timeout" ;;
+    *) reason="failed_rc$rc" ;;
+  esac
+
+  if [ -n "$reason" ]; then
+    _flight_persist "$reason" "$rc" || warn "flight: persist failed"
+  else
+    _flight_summary "$rc" || warn "flight: summary failed"
+  fi
+  rm -rf "$FLIGHT_RECORDER_DIR" 2>/dev/null || true
+  [ -n "$reason" ]
+}
@@ -16,6 +16,9 @@ snap_ts() {
 
 safe_tag(){ printf '%s' "$1" | tr ' /' '__' | tr -cd 'A-Za-z0-9._-'; }
 
+# FLIGHT_RECORDER=1: snapshots go to a local ring, persisted on failure only
+. "$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)/flight_recorder.sh"
+
 snap_init(){
   local name="${1:-run}"
   local ts
@@ -25,7 +28,12 @@ snap_init(){
   PNG_DIR="$SNAP_DIR/png"
   XML_DIR="$SNAP_DIR/xml"
 
-  mkdir -p "$PNG_DIR" "$XML_DIR"
+  if flight_enabled; then
+    # png/ and xml/ are created only if the ring gets persisted
+    mkdir -p "$SNAP_DIR"
+  else
+    mkdir -p "$PNG_DIR" "$XML_DIR"
+  fi
 
   log "SNAP_DIR=$SNAP_DIR"
   export SNAP_DIR PNG_DIR XML_DIR
@@ -74,11 +82,16 @@ snap_from_dump(){
   local dump_xml="${2:-}"
   local mode="${3:-$SNAP_MODE}"
 
-  mkdir -p "$PNG_DIR" "$XML_DIR"
-
   local base
   base="$(snap_ts)__$(safe_tag "$tag")"
 
+  if flight_enabled; then
+    [ "$mode" = "0" ] || flight_record "$base" "$dump_xml"
+    return 0
+  fi
+
+  mkdir -p "$PNG_DIR" "$XML_DIR"
+
   case "$mode" in
     2|3)
       if [ -n "$dump_xml" ] && [ -s "$dump_xml" ]; then
@@ -100,11 +113,16 @@ snap(){
   local tag="${1:-snap}"
   local mode="${2:-$SNAP_MODE}"
 
-  mkdir -p "$PNG_DIR" "$XML_DIR"
-
   local base
   base="$(snap_ts)__$(safe_tag "$tag")"
 
+  if flight_enabled; then
+    # no dump of its own in the ring: reuse the last ui_refresh dump if any
+    [ "$mode" = "0" ] || flight_record "$base" "${UI_DUMP_CACHE:-}"
+    return 0
+  fi
+
+  mkdir -p "$PNG_DIR" "$XML_DIR"
   _snap_do "$base" "$mode"
   log "snap: $base (mode=$mode)"
 }
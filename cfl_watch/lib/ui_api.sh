@@ -6,7 +6,8 @@ set -euo pipefail
 # Depends on:
 #   - lib/common.sh: log, warn, maybe, type_text, key, sleep_s
 #   - lib/snap.sh:   snap_init, safe_tag, SNAP_DIR, SNAP_MODE, SERIAL
-#   - lib/ui_core.sh: dump_ui, wait_dump_grep, wait_results_ready, resid_regex, regex_escape_ere
+#   - lib/ui_core.sh: dump_ui, wait_dump_grep, wait_results_ready, resid_regex, regex_escape_ere,
+#                     ui_wait_change (+ ui_events_seq from lib/ui_events.sh)
 #   - lib/ui_select.sh: tap_by_selector, tap_first_result
 #
 # Provides:
@@ -325,6 +326,11 @@ ui_snap(){
   local base
   base="$(date +"%Y%m%d_%H%M%S_%3N")__$(safe_tag "$tag")"
 
+  if [ "$mode" != "0" ] && declare -F flight_enabled >/dev/null && flight_enabled; then
+    flight_record "$base" "${UI_DUMP_CACHE:-}"
+    return 0
+  fi
+
   case "$mode" in
     0) return 0 ;;
 
@@ -367,7 +373,10 @@ ui_snap(){
 ui_snap_here(){
   local tag="$1"
   local mode="${2:-${SNAP_MODE:-3}}"
-  ui_refresh
+  # flight recorder: the ring takes the last dump, no extra uiautomator dump on the happy path
+  if ! { [ "$mode" != "0" ] && declare -F flight_enabled >/dev/null && flight_enabled; }; then
+    ui_refresh
+  fi
   ui_snap "$tag" "$mode"
 }
 
@@ -479,6 +488,7 @@ ui_wait_element_has_text() {
   start=$(date +%s)
 
   while true; do
+    local seq; seq="$(ui_events_seq)"
     ui_refresh
     if ui_element_has_text "$sel" "$text"; then
       log "wait ok: $label"
@@ -491,7 +501,7 @@ ui_wait_element_has_text() {
       return 1
     fi
 
-    sleep_s "${WAIT_POLL:-0.5}"
+    ui_wait_change "$seq" "${WAIT_POLL:-0.5}" $(( start + timeout )) || true
   done
 }
 
@@ -727,6 +737,7 @@ ui_wait_element_gone() {
   start="$(date +%s)"
 
   while true; do
+    local seq; seq="$(ui_events_seq)"
     ui_refresh
 
     if ! grep -Eq "$re" "$UI_DUMP_CACHE"; then
@@ -735,7 +746,7 @@ ui_wait_element_gone() {
     fi
 
     (( $(date +%s) - start >= timeout )) && break
-    sleep_s "$WAIT_POLL"
+    ui_wait_change "$seq" "$WAIT_POLL" $(( start + timeout )) || true
   done
 
   warn "wait gone timeout: $label"
@@ -11,10 +11,12 @@ set -euo pipefail
 #   wait_resid_present
 #   wait_resid_absent
 #   wait_results_ready
+#   ui_wait_change
 #
 # Env knobs:
 #   CFL_TMP_DIR, CFL_REMOTE_TMP_DIR, CFL_DUMP_TIMING
 #   WAIT_POLL, WAIT_SHORT, WAIT_LONG
+#   UI_EVENTS (see lib/ui_events.sh)
 
 : "${CFL_TMP_DIR:=$HOME/.cache/cfl_watch}"
 : "${CFL_REMOTE_TMP_DIR:=/data/local/tmp/cfl_watch}"
@@ -24,6 +26,8 @@ set -euo pipefail
 : "${WAIT_SHORT:=20}"
 : "${WAIT_LONG:=30}"
 
+. "$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)/ui_events.sh"
+
 # --------
 # helpers
 # --------
@@ -37,6 +41,19 @@ _sleep_if_needed(){
   sleep "$s"
 }
 
+ui_wait_change(){
+  # usage: ui_wait_change <seq_before_dump> <interval_s> <end_epoch_s> [idle_cap_ms]
+  # With UI_EVENTS=1: block until an event burst newer than the dump settles
+  # (or idle cap); otherwise (or if the watcher died) plain WAIT_POLL sleep.
+  local seq="$1" interval_s="$2" end="$3" cap="${4:-$UI_EVENTS_IDLE_MS}"
+  if [ -n "$seq" ]; then
+    local rc=0
+    ui_events_wait "$seq" $(( end * 1000 )) "$cap" || rc=$?
+    [ "$rc" -ne 2 ] && return "$rc"
+  fi
+  _sleep_if_needed "$interval_s"
+}
+
 regex_escape_ere(){
   # Escape a string so it can be safely injected into grep -E patterns.
   # (ERE special chars: . ^ $ * + ? ( ) [ ] { } | \ )
@@ -92,6 +109,8 @@ dump_ui(){
 
   if ! inject test -s "$remote_path" >/dev/null 2>&1; then
     warn "dump_ui: remote dump absent/vide: $remote_path"
+    # uiautomator events may hold the UiAutomation connection: drop it
+    ui_events_disable "dump failed while watching events"
   fi
 
   # Pull to Termux: tmp + mv
@@ -156,13 +175,14 @@ wait_dump_grep(){
   local end=$(( $(date +%s) + timeout_s ))
 
   while [ "$(date +%s)" -lt "$end" ]; do
-    local d
+    local d seq
+    seq="$(ui_events_seq)"
     d="$(dump_ui)"
     if grep -Eq "$regex" "$d" 2>/dev/null; then
       printf '%s' "$d"
       return 0
     fi
-    _sleep_if_needed "$interval_s"
+    ui_wait_change "$seq" "$interval_s" "$end" || true
   done
 
   warn "wait_dump_grep timeout: regex=$regex"
@@ -186,14 +206,21 @@ wait_resid_absent(){
 
   local ok=0
   while [ "$(date +%s)" -lt "$end" ]; do
+    local seq; seq="$(ui_events_seq)"
     local d; d="$(dump_ui)"
     if grep -Eq "$pat" "$d" 2>/dev/null; then
       ok=0
     else
       ok=$((ok+1))
       [ "$ok" -ge "$stable_n" ] && return 0
+      # events only pace the confirming re-dumps (settle window instead of
+      # the idle cap); absence still needs stable_n consecutive dumps
+      if [ -n "$seq" ]; then
+        ui_wait_change "$seq" "$interval_s" "$end" "$UI_EVENTS_SETTLE_MS" || true
+        continue
+      fi
     fi
-    _sleep_if_needed "$interval_s"
+    ui_wait_change "$seq" "$interval_s" "$end" || true
   done
 
   warn "wait_resid_absent timeout: resid=$resid"
@@ -212,6 +239,7 @@ wait_results_ready(){
   local iter=0 last_state="" m=""
   while [ "$(date +%s)" -lt "$end" ]; do
     iter=$((iter+1))
+    local seq; seq="$(ui_events_seq)"
     local d; d="$(dump_ui)"
 
     m="$(grep -Eo "$re_list|$re_loader" "$d" 2>/dev/null | tr '\n' ' ' || true)"
@@ -233,7 +261,7 @@ wait_results_ready(){
       return 0
     fi
 
-    _sleep_if_needed "$interval_s"
+    ui_wait_change "$seq" "$interval_s" "$end" || true
   done
 
   warn "wait_results_ready timeout ($timeout_s s) last=$last_state"
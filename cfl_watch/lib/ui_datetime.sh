@@ -142,16 +142,26 @@ _adb_text_escape() {
 }
 
 _ui_ime_dump() {
+  # Fallback quand ce fichier est utilisé seul (sans lib/common.sh / device_state.sh).
   # dumpsys peut échouer / être vide -> jamais de crash
   _maybe adb shell dumpsys input_method 2>/dev/null | tr -d '\r' || true
 }
 
 _ui_ime_is_shown() {
+  # Avec lib/common.sh: cache devstate partagé (un seul dumpsys filtré par tick)
+  if declare -F devstate_get >/dev/null 2>&1; then
+    [[ "$(devstate_get ime || true)" == "1" ]]
+    return
+  fi
   local s="$(_ui_ime_dump)"
   grep -Eq 'm(InputShown|IsInputShown)=true|InputShown=true' <<<"$s"
 }
 
 _ui_ime_is_hidden() {
+  if declare -F devstate_get >/dev/null 2>&1; then
+    [[ "$(devstate_get ime || true)" == "0" ]]
+    return
+  fi
   local s="$(_ui_ime_dump)"
   grep -Eq 'm(InputShown|IsInputShown)=false|InputShown=false|mImeWindowVis=0x0\b|mImeWindowVis=0\b' <<<"$s"
 }
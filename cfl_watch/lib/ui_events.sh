@@ -0,0 +1,175 @@
+#!/data/data/com.termux/files/usr/bin/bash
+set -euo pipefail
+
+# Accessibility-event wakeups for the UI wait helpers.
+# Depends on: warn, log (from lib/common.sh), adb serial setup (CFL_SERIAL).
+#
+# A background `uiautomator events` session streams window/content changes;
+# a pump bumps a sequence number (+ timestamp of the last event) in a local
+# state file. Wait helpers block on that file (local reads, no adb) until a
+# change burst has settled, and only then re-dump. All state lives in files
+# so helpers called from $(...) subshells share the same watcher.
+#
+# Opt-in (UI_EVENTS=1): on several Android builds a running `uiautomator
+# events` session and `uiautomator dump` fight over the UiAutomation
+# connection. dump_ui disables the watcher on the first failed dump and the
+# helpers fall back to plain polling (WAIT_POLL).
+#
+# Provides:
+#   ui_events_start / ui_events_stop / ui_events_active
+#   ui_events_seq                      current sequence (empty if no watcher)
+#   ui_events_wait <seq> <deadline_ms> [idle_cap_ms]
+#
+# Env knobs:
+#   UI_EVENTS            (default 0)    1 = start the watcher on first wait
+#   UI_EVENTS_SETTLE_MS  (default 150)  quiet time that ends a burst
+#   UI_EVENTS_BURST_MS   (default 1500) dump anyway if a burst never settles
+#   UI_EVENTS_IDLE_MS    (default 3000) re-dump after this long without events
+#   UI_EVENTS_TICK       (default 0.02) local poll of the state file
+#   UI_EVENTS_DEBUG=1    log wakeups on stderr
+
+: "${UI_EVENTS:=0}"
+: "${UI_EVENTS_SETTLE_MS:=150}"
+: "${UI_EVENTS_BURST_MS:=1500}"
+: "${UI_EVENTS_IDLE_MS:=3000}"
+: "${UI_EVENTS_TICK:=0.02}"
+: "${UI_EVENTS_DEBUG:=0}"
+
+# $$ is the top-level script (same in subshells): one watcher per scenario
+UI_EVENTS_DIR="${UI_EVENTS_DIR:-${CFL_TMP_DIR:-$HOME/.cache/cfl_watch}/events.$$}"
+UI_EVENTS_OWNER="$$"
+
+# Event types that can change what a dump would show
+UI_EVENTS_TYPES_RE='TYPE_WINDOW_STATE_CHANGED|TYPE_WINDOW_CONTENT_CHANGED|TYPE_WINDOWS_CHANGED|TYPE_VIEW_SCROLLED|TYPE_VIEW_TEXT_CHANGED'
+
+_ui_events_now_ms(){
+  if [ -n "${EPOCHREALTIME:-}" ]; then
+    local t="${EPOCHREALTIME/[.,]/}"
+    printf '%s' "${t:0:${#t}-3}"
+  else
+    printf '%s' $(( $(date +%s%N) / 1000000 ))
+  fi
+}
+
+_ui_events_pump(){
+  # stdin: `uiautomator events` lines -> state file "<seq> <last_event_ms>"
+  local seq=0 line
+  local state="$UI_EVENTS_DIR/state"
+  printf '0 0\n' > "$state"
+  while true; do
+    if IFS= read -r -t 1 line; then
+      if [[ "$line" =~ $UI_EVENTS_TYPES_RE ]]; then
+        seq=$((seq + 1))
+        printf '%s %s\n' "$seq" "$(_ui_events_now_ms)" > "$state"
+      fi
+    else
+      # EOF (stream died) vs read timeout (check the scenario is still alive)
+      [ $? -gt 128 ] || break
+      kill -0 "$UI_EVENTS_OWNER" 2>/dev/null || break
+    fi
+  done
+}
+
+ui_events_active(){
+  local pid
+  [ -s "$UI_EVENTS_DIR/pump.pid" ] || return 1
+  read -r pid < "$UI_EVENTS_DIR/pump.pid" || return 1
+  kill -0 "$pid" 2>/dev/null
+}
+
+ui_events_start(){
+  ui_events_active && return 0
+  [ -e "$UI_EVENTS_DIR/disabled" ] && return 1
+  mkdir -p "$UI_EVENTS_DIR" || return 1
+
+  (
+    # the device shell prints its pid before exec'ing uiautomator, so stop
+    # can kill this session's stream and not the other scenarios' ones
+    exec 3< <(exec adb -s "$CFL_SERIAL" shell 'echo "pid=$$"; exec uiautomator events' 2>/dev/null)
+    echo "$!" > "$UI_EVENTS_DIR/stream.pid"
+    trap 'kill "$(cat "$UI_EVENTS_DIR/stream.pid" 2>/dev/null)" 2>/dev/null || true' EXIT
+    trap 'exit 0' TERM INT
+    first=""
+    IFS= read -r -t 5 first <&3 || true
+    first="${first%$'\r'}"
+    [[ "$first" =~ ^pid=([0-9]+)$ ]] && echo "${BASH_REMATCH[1]}" > "$UI_EVENTS_DIR/remote.pid"
+    _ui_events_pump <&3
+  ) >/dev/null 2>&1 &
+  # stdout/stderr detached: callers may run inside $(...)
+  echo "$!" > "$UI_EVENTS_DIR/pump.pid"
+
+  sleep 0.2
+  if ! ui_events_active; then
+    warn "ui_events: 'uiautomator events' indisponible -> polling"
+    : > "$UI_EVENTS_DIR/disabled"
+    return 1
+  fi
+  [ "$UI_EVENTS_DEBUG" = "1" ] && log "ui_events: watcher started (pid=$(cat "$UI_EVENTS_DIR/pump.pid"))" >&2
+  return 0
+}
+
+ui_events_stop(){
+  local f pid
+  for f in pump stream; do
+    if [ -s "$UI_EVENTS_DIR/$f.pid" ]; then
+      read -r pid < "$UI_EVENTS_DIR/$f.pid" || pid=""
+      [ -n "$pid" ] && kill "$pid" 2>/dev/null || true
+      rm -f "$UI_EVENTS_DIR/$f.pid"
+    fi
+  done
+  # the remote session may outlive the local adb client: kill our own only
+  # (other scenarios / batch workers may have a stream on the same device)
+  [ -s "$UI_EVENTS_DIR/remote.pid" ] || return 0
+  read -r pid < "$UI_EVENTS_DIR/remote.pid" || pid=""
+  rm -f "$UI_EVENTS_DIR/remote.pid"
+  [[ "$pid" =~ ^[0-9]+$ ]] || return 0
+  adb -s "$CFL_SERIAL" shell "kill $pid" >/dev/null 2>&1 || true
+}
+
+ui_events_disable(){
+  # usage: ui_events_disable "<reason>"  (sticky for this scenario)
+  ui_events_active || return 0
+  warn "ui_events: ${1:-disabled} -> polling"
+  ui_events_stop
+  mkdir -p "$UI_EVENTS_DIR" && : > "$UI_EVENTS_DIR/disabled"
+}
+
+ui_events_cleanup(){
+  ui_events_stop
+  rm -rf "$UI_EVENTS_DIR" 2>/dev/null || true
+}
+
+ui_events_seq(){
+  # Empty when events are off: callers then poll.
+  [ "$UI_EVENTS" = "1" ] || return 0
+  ui_events_active || ui_events_start || return 0
+  local seq ts
+  read -r seq ts < "$UI_EVENTS_DIR/state" 2>/dev/null || seq=0
+  printf '%s' "${seq:-0}"
+}
+
+ui_events_wait(){
+  # usage: ui_events_wait <seq> <deadline_ms> [idle_cap_ms]
+  # 0 = a change burst newer than <seq> has settled (or burst cap hit)
+  # 1 = deadline / idle cap reached without change
+  # 2 = watcher gone (caller falls back to polling)
+  local since="$1" deadline="$2" cap="${3:-$UI_EVENTS_IDLE_MS}"
+  local start now seq ts first=0
+  start="$(_ui_events_now_ms)"
+
+  while true; do
+    ui_events_active || return 2
+    read -r seq ts < "$UI_EVENTS_DIR/state" 2>/dev/null || { seq="$since"; ts=0; }
+    now="$(_ui_events_now_ms)"
+    if [ "${seq:-0}" -gt "$since" ]; then
+      [ "$first" -eq 0 ] && first="$now"
+      if [ $((now - ts)) -ge "$UI_EVENTS_SETTLE_MS" ] || [ $((now - first)) -ge "$UI_EVENTS_BURST_MS" ]; then
+        [ "$UI_EVENTS_DEBUG" = "1" ] && log "ui_events: wake seq=$since->$seq after $((now - start))ms" >&2
+        return 0
+      fi
+    fi
+    [ "$now" -ge "$deadline" ] && return 1
+    [ $((now - start)) -ge "$cap" ] && return 1
+    sleep "$UI_EVENTS_TICK"
+  done
+}
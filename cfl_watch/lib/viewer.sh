@@ -8,13 +8,20 @@ RUN_DIR="${1:-}"
 OUT="$RUN_DIR/viewers"
 mkdir -p "$OUT"
 
-python - "$RUN_DIR" "$OUT" <<'PY'
+TOOLS_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")/../tools" && pwd)"
+
+python - "$RUN_DIR" "$OUT" "$TOOLS_DIR" <<'PY'
 import html, re, sys
 from pathlib import Path
 import xml.etree.ElementTree as ET
 
 run_dir = Path(sys.argv[1])
 out_dir = Path(sys.argv[2])
+sys.path.insert(0, sys.argv[3])
+try:
+    import tree_diff  # packed runs: xml/frames.jsonl instead of xml/*.xml
+except ImportError:
+    tree_diff = None
 
 def esc(s): 
     return html.escape(str(s), quote=True)
@@ -30,9 +37,9 @@ def parse_bounds(b):
         return None
     return x1, y1, x2, y2
 
-def overlay_from_xml(xml_path):
+def overlay_from_xml(xml_text):
     try:
-        root = ET.parse(xml_path).getroot()
+        root = ET.fromstring(xml_text)
     except Exception:
         return ""
 
@@ -77,12 +84,24 @@ def overlay_from_xml(xml_path):
         + "</svg>"
     )
 
-# Collect png/xml by base name
+# Collect png/xml by base name (run dir, png/, xml/)
 snap = {}
-for f in run_dir.glob("*"):
-    if f.suffix.lower() not in {".png", ".xml"}:
+for d in (run_dir, run_dir / "png", run_dir / "xml"):
+    if not d.is_dir():
         continue
-    snap.setdefault(f.stem, {})[f.suffix.lower()] = f.name
+    for f in d.glob("*"):
+        if f.suffix.lower() not in {".png", ".xml"}:
+            continue
+        snap.setdefault(f.stem, {})[f.suffix.lower()] = f.relative_to(run_dir).as_posix()
+
+# dumps only present as frames of a packed run
+packed = {}
+if tree_diff and (run_dir / "xml" / tree_diff.FRAMES_NAME).is_file():
+    for name, root_attrs, recs in tree_diff.iter_frames(str(run_dir)):
+        info = snap.setdefault(Path(name).stem, {})
+        if ".xml" not in info:
+            info[".xml"] = name
+            packed[Path(name).stem] = tree_diff.to_xml(root_attrs, recs)
 
 bases = sorted(snap.keys())
 pages = []
@@ -96,9 +115,13 @@ for i, base in enumerate(bases):
     next_page = f"{bases[i+1]}.html" if i + 1 < len(bases) else ""
     page = f"{base}.html"
 
+    xml_text = ""
+    if xml:
+        xml_text = packed.get(base) or (run_dir / xml).read_text(errors="replace")
+
     overlay = ""
     if png and xml:
-        overlay = overlay_from_xml(run_dir / xml)
+        overlay = overlay_from_xml(xml_text)
 
     body = []
     body.append(f"<h2>{esc(base)}</h2>")
@@ -120,7 +143,6 @@ for i, base in enumerate(bases):
         body.append("<p><b>PNG:</b> —</p>")
 
     if xml:
-        xml_text = (run_dir / xml).read_text(errors="replace")
         if len(xml_text) > 600_000:
             xml_text = xml_text[:600_000] + "\n<!-- TRUNCATED -->\n"
         body.append("<details><summary>UI XML</summary>")
@@ -147,13 +147,18 @@ snap_here() {
 }
 
 snap_init "$run_name"
+# raw args: the run dir name is safe_name'd (accents dropped), tools/trip_ingest.py reads these
+printf 'start=%s\ntarget=%s\nvia=%s\ndate=%s\ntime=%s\n' \
+  "$START_TEXT" "$TARGET_TEXT" "$VIA_TEXT_TRIM" "$DATE_YMD_TRIM" "$TIME_HM_TRIM" > "$SNAP_DIR/trip.txt" 2>/dev/null || true
 
 rc_open_viewer=0
 
 finish() {
   local rc=$?
   trap - EXIT
-  if [ "$rc" -ne 0 ]; then
+  ui_events_cleanup
+  # FLIGHT_RECORDER=1: the snapshot ring reaches $SNAP_DIR only here (failure / timeout)
+  if flight_finish "$rc" || [ "$rc" -ne 0 ]; then
     warn "Phase: finish | Action: exit_trap | Target: run | Result: failed rc=${rc_open_viewer:-0}"
     "$CFL_CODE_DIR/lib/viewer.sh" "$SNAP_DIR" >/dev/null 2>&1 || true
     log "Phase: finish | Action: viewer | Target: snapshot_dir | Result: $SNAP_DIR/viewers/index.html"
@@ -161,6 +166,7 @@ finish() {
   exit "$rc"
 }
 trap finish EXIT
+flight_trap_signals
 
 # -------------------------
 # Scenario
@@ -235,6 +241,7 @@ if [[ -n "$DATE_YMD_TRIM" || -n "$TIME_HM_TRIM" ]]; then
       if ui_has_element "resid::id/button1"; then
         snap "datetime" "set_datetime" "filled" "$SNAP_MODE"
         ui_tap_any "ok_button_tap" "resid:android:id/button1"
+        ckpt_phase date_set
       else
         _ui_key 4 || true
         warn "Phase: datetime | Action: validate | Target: dialog | Result: ok_button_missing_back_fallback"
@@ -285,6 +292,7 @@ if ! ui_pick_suggestion "start suggestion" "$START_TEXT"; then
 fi
 
 snap "planner" "set_start" "selected" "$SNAP_MODE"
+ckpt_phase start_set
 
 # -------------------------
 # Destination station
@@ -324,6 +332,7 @@ if ! ui_pick_suggestion "destination suggestion" "$TARGET_TEXT"; then
 fi
 
 snap "planner" "set_destination" "selected" "$SNAP_MODE"
+ckpt_phase destination_set
 
 # -------------------------
 # VIA (optional)
@@ -359,6 +368,7 @@ if [[ -n "$VIA_TEXT_TRIM" ]]; then
 
       ui_pick_suggestion "via suggestion" "$VIA_TEXT_TRIM" || true
       snap "planner" "set_via" "selected" "$SNAP_MODE"
+      ckpt_phase via_set
 
       ui_tap_any "back from via" "desc:Navigate up" || true
       snap_here "planner" "exit_options" "after" "$SNAP_MODE"
@@ -383,6 +393,7 @@ if ! ui_tap_any "search button" \
 fi
 
 snap_here "results" "search" "after" 3
+ckpt_phase search_done
 
 # -------------------------
 # Drill all visible connections
@@ -546,6 +557,8 @@ while true; do
   sleep_s 0.4
 done
 
+ckpt_phase results_done
+
 # -------------------------
 # End heuristic (soft)
 # -------------------------
@@ -147,13 +147,18 @@ snap_here() {
 }
 
 snap_init "$run_name"
+# raw args: the run dir name is safe_name'd (accents dropped), tools/trip_ingest.py reads these
+printf 'start=%s\ntarget=%s\nvia=%s\ndate=%s\ntime=%s\n' \
+  "$START_TEXT" "$TARGET_TEXT" "$VIA_TEXT_TRIM" "$DATE_YMD_TRIM" "$TIME_HM_TRIM" > "$SNAP_DIR/trip.txt" 2>/dev/null || true
 
 rc_open_viewer=0
 
 finish() {
   local rc=$?
   trap - EXIT
-  if [ "$rc" -ne 0 ]; then
+  ui_events_cleanup
+  # FLIGHT_RECORDER=1: the snapshot ring reaches $SNAP_DIR only here (failure / timeout)
+  if flight_finish "$rc" || [ "$rc" -ne 0 ]; then
     warn "Phase: finish | Action: exit_trap | Target: run | Result: failed rc=${rc_open_viewer:-0}"
     "$CFL_CODE_DIR/lib/viewer.sh" "$SNAP_DIR" >/dev/null 2>&1 || true
     log "Phase: finish | Action: viewer | Target: snapshot_dir | Result: $SNAP_DIR/viewers/index.html"
@@ -161,6 +166,7 @@ finish() {
   exit "$rc"
 }
 trap finish EXIT
+flight_trap_signals
 
 # -------------------------
 # Scenario
@@ -309,6 +315,7 @@ if ! ui_tap_desc "start suggestion" "$START_TEXT"; then
 fi
 
 snap "planner" "set_start" "selected" "$SNAP_MODE"
+ckpt_phase start_set
 
 log "Phase: planner | Action: set_start | Target: from | Result: done"
 
@@ -413,6 +420,7 @@ if ! ui_tap_desc "destination suggestion" "$TARGET_TEXT"; then
 fi
 
 snap "planner" "set_destination" "selected" "$SNAP_MODE"
+ckpt_phase destination_set
 
 log "Phase: planner | Action: set_destination | Target: to | Result: done"
 
@@ -641,7 +649,7 @@ if [[ -n "$DATE_YMD_TRIM" || -n "$TIME_HM_TRIM" ]]; then
     snap "datetime" "apply" "before" "$SNAP_MODE"
 
     if ui_tap_any "apply" "desc:Apply"; then
-      :
+      ckpt_phase date_set
     else
       rc=$?
       warn "Phase: datetime | Action: apply | Target: cfl | Result: failed"
@@ -688,7 +696,7 @@ else
     snap "datetime" "apply" "before" "$SNAP_MODE"
 
     if ui_tap_any "apply" "desc:Apply"; then
-      :
+      ckpt_phase date_set
     else
       rc=$?
       warn "Phase: datetime | Action: apply | Target: cfl | Result: failed"
@@ -726,6 +734,7 @@ else
 fi
 
 snap_here "results" "search" "after" 3
+ckpt_phase search_done
 
 # -------------------------
 # VIA (optional)
@@ -787,6 +796,7 @@ if [[ -n "$VIA_TEXT_TRIM" ]]; then
       fi
 
       snap "planner" "set_via" "selected" "$SNAP_MODE"
+      ckpt_phase via_set
 
       log "Phase: planner | Action: set_via | Target: via | Result: done"
 
@@ -961,6 +971,8 @@ while true; do
   sleep_s 0.4
 done
 
+ckpt_phase results_done
+
 # -------------------------
 # End heuristic (soft)
 # -------------------------
@@ -14,9 +14,22 @@ set -u
 # - VIA is treated as free text
 # - App & scenario selection handled by runner.sh
 #
+# Checkpoint / resume:
+# - every run, phase reached by the scenario (lib/checkpoint.sh) and final
+#   outcome is appended to a journal; re-running the same trips file skips the
+#   trips already ok/failed and restarts at the first unfinished one
+#   (an interrupted trip is replayed from its start: runner.sh force-stops the
+#   app between runs, so there is no in-app state to resume)
+# - transient failures (timeout/kill rc, or device unreachable after the run)
+#   are retried with exponential backoff, queued at the end of the batch so the
+#   other trips keep the device busy meanwhile
+# - once every trip has a final outcome the journal is renamed *.done
+#
 # Usage:
 #   CFL_PKG=de.hafas.android.cfl bash batch_trips.sh
 #   CFL_MULTI_RUN=1 bash batch_trips.sh
+#   CFL_INGEST=1 bash batch_trips.sh   # ingest results into SQLite after each trip
+#   BATCH_RESUME=0 bash batch_trips.sh # ignore (and reset) the journal
 
 TRIPS_FILE="${TRIPS_FILE:-$HOME/termux-scripts/cfl_watch/trips.txt}"
 RUNNER="${RUNNER:-$HOME/termux-scripts/cfl_watch/runner.sh}"
@@ -27,6 +40,21 @@ CFL_REMOTE_TMP_DIR="${CFL_REMOTE_TMP_DIR:-/data/local/tmp/cfl_watch}"
 CFL_TMP_DIR="${CFL_TMP_DIR:-$HOME/.cache/cfl_watch}"
 DEFAULT_SNAP_MODE="${DEFAULT_SNAP_MODE:-3}"
 NO_ANIM="${NO_ANIM:-1}"
+CFL_INGEST="${CFL_INGEST:-0}"
+INGEST="${INGEST:-$(dirname "$RUNNER")/tools/trip_ingest.py}"
+# ingest reads the run dumps (xml/*.xml, frames.jsonl): with the flight recorder a
+# successful run only leaves summary.txt, so it is turned off for ingested batches
+if [ "$CFL_INGEST" = "1" ]; then
+  [ "${FLIGHT_RECORDER:-0}" = "1" ] && echo "[!] CFL_INGEST=1: FLIGHT_RECORDER=0 (successful runs would leave nothing to ingest)" >&2
+  export FLIGHT_RECORDER=0
+fi
+
+BATCH_RESUME="${BATCH_RESUME:-1}"
+BATCH_RETRIES="${BATCH_RETRIES:-2}"             # extra attempts per trip (transient failures only)
+BATCH_BACKOFF_S="${BATCH_BACKOFF_S:-10}"        # first retry delay, doubled per attempt
+BATCH_BACKOFF_MAX_S="${BATCH_BACKOFF_MAX_S:-300}"
+BATCH_RETRY_RC="${BATCH_RETRY_RC:-124 137 143 255}"  # transient exit codes ("any" = every failure)
+BATCH_JOURNAL="${BATCH_JOURNAL:-}"              # default: $CFL_TMP_DIR/batch_<hash of TRIPS_FILE>.journal
 
 # ------------------------------------------------------------
 # Helpers
@@ -42,6 +70,36 @@ _is_number() {
   [[ "$1" =~ ^[0-9]+$ ]]
 }
 
+_hash() {
+  printf '%s' "$1" | sha1sum | cut -c1-"$2"
+}
+
+_device_ok() {
+  command -v adb >/dev/null 2>&1 || return 0
+  adb -s "${ANDROID_SERIAL:-127.0.0.1:$ADB_TCP_PORT}" get-state >/dev/null 2>&1
+}
+
+_is_transient() {
+  local rc="$1" c
+  [ "$BATCH_RETRY_RC" = "any" ] && return 0
+  for c in $BATCH_RETRY_RC; do
+    [ "$rc" = "$c" ] && return 0
+  done
+  # adb link dropped mid-run: the trip itself is probably fine
+  ! _device_ok
+}
+
+_backoff() {
+  # delay before attempt n+1, n = attempts already made
+  local n="$1" d="$BATCH_BACKOFF_S"
+  while [ "$n" -gt 1 ] && [ "$d" -lt "$BATCH_BACKOFF_MAX_S" ]; do
+    d=$((d * 2))
+    n=$((n - 1))
+  done
+  [ "$d" -gt "$BATCH_BACKOFF_MAX_S" ] && d="$BATCH_BACKOFF_MAX_S"
+  echo "$d"
+}
+
 # ------------------------------------------------------------
 # Sanity checks
 # ------------------------------------------------------------
@@ -55,13 +113,33 @@ if [ ! -x "$RUNNER" ]; then
   exit 1
 fi
 
+. "$(dirname "$RUNNER")/lib/checkpoint.sh"
+
+if [ -z "$BATCH_JOURNAL" ]; then
+  mkdir -p "$CFL_TMP_DIR"
+  BATCH_JOURNAL="$CFL_TMP_DIR/batch_$(_hash "$(readlink -f "$TRIPS_FILE")" 8).journal"
+fi
+if [ "$BATCH_RESUME" != "1" ]; then
+  rm -f "$BATCH_JOURNAL"
+fi
+ckpt_load "$BATCH_JOURNAL"
+
 # ------------------------------------------------------------
-# Main loop
+# Parse trips
 # ------------------------------------------------------------
 ok=0
 fail=0
+skipped=0
 i=0
 
+T_START=()
+T_TARGET=()
+T_VIA=()
+T_SNAP=()
+T_ID=()
+T_LINE=()
+declare -A SEEN=()
+
 while IFS= read -r line || [ -n "${line:-}" ]; do
   line="$(_trim "$line")"
   [ -z "$line" ] && continue
@@ -102,7 +180,82 @@ while IFS= read -r line || [ -n "${line:-}" ]; do
     continue
   fi
 
-  echo "[*] ($i) RUN: $start -> $target${via:+ via $via} | snap=$snap"
+  # id = content + occurrence: stable when trips are added/reordered
+  key="$start|$target|$via|$snap"
+  SEEN[$key]=$(( ${SEEN[$key]:-0} + 1 ))
+  T_START+=("$start")
+  T_TARGET+=("$target")
+  T_VIA+=("$via")
+  T_SNAP+=("$snap")
+  T_ID+=("$(_hash "$key" 12)_${SEEN[$key]}")
+  T_LINE+=("$i")
+done < "$TRIPS_FILE"
+
+# ------------------------------------------------------------
+# Main loop
+# ------------------------------------------------------------
+QUEUE=()
+declare -A DUE=() ATT=()
+
+for k in "${!T_ID[@]}"; do
+  id="${T_ID[$k]}"
+  case "${CKPT_STATE[$id]:-}" in
+    ok)   ok=$((ok+1)); skipped=$((skipped+1)); continue ;;
+    fail) fail=$((fail+1)); skipped=$((skipped+1)); continue ;;
+  esac
+  ATT[$k]="${CKPT_RUNS[$id]:-0}"
+  DUE[$k]=0
+  QUEUE+=("$k")
+  if [ "${ATT[$k]}" -gt 0 ]; then
+    echo "[*] (${T_LINE[$k]}) resume: ${ATT[$k]} attempt(s) so far, last phase=${CKPT_PHASE[$id]:-none}"
+  fi
+done
+
+[ "$skipped" -gt 0 ] && echo "[*] journal $BATCH_JOURNAL: $skipped trip(s) already done, ${#QUEUE[@]} left"
+
+t0="$(date +%s)"
+ran_ok=0
+retries=0
+interrupted=0
+
+while [ "${#QUEUE[@]}" -gt 0 ]; do
+  # first trip due now (retries wait at the end of the queue)
+  now="$(date +%s)"
+  pick=-1
+  next_due=""
+  for q in "${!QUEUE[@]}"; do
+    k="${QUEUE[$q]}"
+    if [ "${DUE[$k]}" -le "$now" ]; then
+      pick="$q"
+      break
+    fi
+    if [ -z "$next_due" ] || [ "${DUE[$k]}" -lt "$next_due" ]; then
+      next_due="${DUE[$k]}"
+    fi
+  done
+  if [ "$pick" -lt 0 ]; then
+    echo "[*] waiting $((next_due - now))s for the next retry"
+    sleep "$((next_due - now))"
+    continue
+  fi
+
+  k="${QUEUE[$pick]}"
+  unset 'QUEUE[$pick]'
+  QUEUE=("${QUEUE[@]}")
+
+  id="${T_ID[$k]}"
+  start="${T_START[$k]}"
+  target="${T_TARGET[$k]}"
+  via="${T_VIA[$k]}"
+  snap="${T_SNAP[$k]}"
+  n="${T_LINE[$k]}"
+  ATT[$k]=$(( ATT[$k] + 1 ))
+  attempt="${ATT[$k]}"
+
+  tag=""
+  [ "$attempt" -gt 1 ] && tag=" | attempt=$attempt"
+  echo "[*] ($n) RUN: $start -> $target${via:+ via $via} | snap=$snap$tag"
+  ckpt_write "$BATCH_JOURNAL" run "$id" "$attempt" "$start -> $target"
 
   args=()
   [ "$NO_ANIM" = "1" ] && args+=(--no-anim)
@@ -112,17 +265,52 @@ while IFS= read -r line || [ -n "${line:-}" ]; do
   ADB_TCP_PORT="$ADB_TCP_PORT" \
   CFL_REMOTE_TMP_DIR="$CFL_REMOTE_TMP_DIR" \
   CFL_TMP_DIR="$CFL_TMP_DIR" \
+  CFL_CHECKPOINT_FILE="$BATCH_JOURNAL" \
+  CFL_CHECKPOINT_TRIP="$id" \
+  CFL_CHECKPOINT_ATTEMPT="$attempt" \
   bash "$RUNNER" "${args[@]}"
   rc=$?
 
   if [ "$rc" -eq 0 ]; then
     ok=$((ok+1))
+    ran_ok=$((ran_ok+1))
+    ckpt_write "$BATCH_JOURNAL" ok "$id" "$attempt"
+  elif [ "$rc" -eq 130 ]; then
+    # Ctrl-C: leave the trip unfinished, the next batch run resumes here
+    echo "[!] ($n) interrupted: stopping batch (journal: $BATCH_JOURNAL)" >&2
+    interrupted=1
+    break
   else
-    fail=$((fail+1))
-    echo "[!] ($i) FAILED rc=$rc : $start -> $target" >&2
+    phase="$(ckpt_last_phase "$BATCH_JOURNAL" "$id")"
+    if [ "$attempt" -le "$BATCH_RETRIES" ] && _is_transient "$rc"; then
+      delay="$(_backoff "$attempt")"
+      DUE[$k]=$(( $(date +%s) + delay ))
+      QUEUE+=("$k")
+      retries=$((retries+1))
+      ckpt_write "$BATCH_JOURNAL" retry "$id" "$attempt" "rc=$rc due=${DUE[$k]}"
+      echo "[!] ($n) transient failure rc=$rc (phase=${phase:-none}) : retry in ${delay}s" >&2
+    else
+      fail=$((fail+1))
+      ckpt_write "$BATCH_JOURNAL" fail "$id" "$attempt" "rc=$rc phase=${phase:-none}"
+      echo "[!] ($n) FAILED rc=$rc (phase=${phase:-none}, attempt=$attempt) : $start -> $target" >&2
+    fi
   fi
 
-done < "$TRIPS_FILE"
+  if [ "$CFL_INGEST" = "1" ]; then
+    python "$INGEST" ingest --root "${CFL_ARTIFACT_DIR:-/sdcard/cfl_watch}" \
+      || echo "[!] ($n) ingest failed (ignored)" >&2
+  fi
+
+done
+
+elapsed=$(( $(date +%s) - t0 ))
+tph="$(awk -v n="$ran_ok" -v s="$elapsed" 'BEGIN { if (s > 0) printf "%.1f", n * 3600 / s; else print "n/a" }')"
+
+if [ "$interrupted" -eq 1 ]; then
+  echo "[*] STOPPED: ok=$ok fail=$fail left=$(( ${#QUEUE[@]} + 1 )) retries=$retries elapsed=${elapsed}s trips/h=$tph"
+  exit 130
+fi
 
-echo "[*] DONE: ok=$ok fail=$fail total=$((ok+fail))"
+mv -f "$BATCH_JOURNAL" "$BATCH_JOURNAL.done" 2>/dev/null || true
+echo "[*] DONE: ok=$ok fail=$fail total=$((ok+fail)) retries=$retries elapsed=${elapsed}s trips/h=$tph"
 [ "$fail" -eq 0 ] || exit 1
@@ -126,7 +126,8 @@ capture_pair_from_live() {
     echo "ts=$ts"
     echo "tag=$tag"
     echo "stable_secs=$STABLE_SECS"
-    adb -s "$SERIAL" shell "dumpsys window | grep -E 'mCurrentFocus|mFocusedApp' | head -n 2" 2>/dev/null || true
+    echo "mCurrentFocus=$(devstate_get focus || true)"
+    echo "mFocusedApp=$(devstate_get focused_app || true)"
   } > "${base}.meta" 2>/dev/null || true
 
   log "Captured: ${base}.{ui.xml,png,meta}"
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+Columnar archive of uiautomator dumps (runs/*/xml) opened via mmap.
+
+One file holds many dumps:
+- interned string pools (packages, classes, resource-ids, text/desc/label, dump names)
+- one int32 column per node attribute (string ids, bounds, flags, tree shape)
+- per-dump node offsets (dump i = nodes [off[i], off[i+1]))
+
+Reading never parses XML: columns are memoryviews over the mmap (no copy),
+strings are decoded once per archive and shared.
+
+Usage:
+  python tools/dump_archive.py pack --out corpus.cfla /sdcard/cfl_watch/runs [more paths...]
+  python tools/dump_archive.py ls corpus.cfla
+  python tools/dump_archive.py scan corpus.cfla [--resid haf_connection_view] [--package de.hafas.android.cfl]
+
+extract_candidates() in llm_explore.py accepts "corpus.cfla::<dump name or index>".
+"""
+
+from __future__ import annotations
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+MAGIC = b"CFLDUMPS"
+VERSION = 1
+ARCHIVE_SEP = "::"
+
+HEADER = struct.Struct("<8sIIII")  # magic, version, n_dumps, n_nodes, n_sections
+SECTION = struct.Struct("<16sQQ")  # name, offset, length (bytes)
+
+POOLS = ("pkg", "cls", "rid", "str", "name")
+
+# Node columns (int32, one entry per node) and the pool their ids point into
+COLUMNS: Tuple[Tuple[str, Optional[str]], ...] = (
+    ("pkg", "pkg"),
+    ("cls", "cls"),
+    ("rid", "rid"),
+    ("text", "str"),
+    ("desc", "str"),
+    ("label", "str"),
+    ("x1", None),
+    ("y1", None),
+    ("x2", None),
+    ("y2", None),
+    ("flags", None),
+    ("subtree_end", None),  # relative to the dump's first node
+    ("window", None),
+)
+
+F_CLICKABLE = 1 << 0
+F_DISABLED = 1 << 1
+F_FOCUSABLE = 1 << 2
+F_FOCUSED = 1 << 3
+F_SCROLLABLE = 1 << 4
+F_BOUNDS = 1 << 5  # bounds attribute present and well-formed (x1..y2 valid)
+
+
+def log(msg: str) -> None:
+    print(f"[*] {msg}", file=sys.stderr)
+
+
+def warn(msg: str) -> None:
+    print(f"[!] {msg}", file=sys.stderr)
+
+
+# ---------------- writer ----------------
+
+class _Pool:
+    def __init__(self) -> None:
+        self.ids: Dict[str, int] = {"": 0}
+        self.items: List[str] = [""]
+
+    def intern(self, s: str) -> int:
+        i = self.ids.get(s)
+        if i is None:
+            i = self.ids[s] = len(self.items)
+            self.items.append(s)
+        return i
+
+    def encode(self) -> Tuple[bytes, bytes]:
+        offsets = array("I", [0])
+        data = bytearray()
+        for s in self.items:
+            data += s.encode("utf-8")
+            offsets.append(len(data))
+        return offsets.tobytes(), bytes(data)
+
+
+def iter_xml(paths: List[str]) -> Iterator[Tuple[str, Optional[str]]]:
+    """(path, None) for XML files, (xml/<name>, text) for frames of packed runs (xml/frames.jsonl)."""
+    from tree_diff import FRAMES_NAME, iter_run_xml
+
+    for p in paths:
+        if os.path.isdir(p):
+            for dirpath, dirnames, filenames in os.walk(p):
+                dirnames.sort()
+                if FRAMES_NAME in filenames and os.path.basename(dirpath) == "xml":
+                    # packed run: frames + any dump added after packing
+                    for name, text in iter_run_xml(os.path.dirname(dirpath)):
+                        yield os.path.join(dirpath, name), text
+                    continue
+                for fn in sorted(filenames):
+                    if fn.endswith(".xml"):
+                        yield os.path.join(dirpath, fn), None
+        elif p.endswith(".xml"):
+            yield p, None
+
+
+def pack(paths: List[str], out: str, root: Optional[str] = None) -> Tuple[int, int]:
+    from llm_explore import BOUNDS_RE, extract_candidates, extract_candidates_text
+
+    pools = {name: _Pool() for name in POOLS}
+    cols = {name: array("i") for name, _ in COLUMNS}
+    dump_off = array("I", [0])
+    dump_name = array("i")
+    dump_pkg = array("i")
+
+    for path, text in iter_xml(paths):
+        try:
+            nodes, _, dominant = extract_candidates(path) if text is None else extract_candidates_text(text)
+        except Exception as e:
+            warn(f"skip {path}: {e}")
+            continue
+        name = os.path.relpath(path, root) if root else path
+        dump_name.append(pools["name"].intern(name))
+        dump_pkg.append(pools["pkg"].intern(dominant))
+        for c in nodes:
+            cols["pkg"].append(pools["pkg"].intern(c.package))
+            cols["cls"].append(pools["cls"].intern(c.class_name))
+            cols["rid"].append(pools["rid"].intern(c.resource_id))
+            cols["text"].append(pools["str"].intern(c.text))
+            cols["desc"].append(pools["str"].intern(c.content_desc))
+            cols["label"].append(pools["str"].intern(c.label))
+            m = BOUNDS_RE.match(c.bounds.strip()) if c.bounds else None
+            x1, y1, x2, y2 = map(int, m.groups()) if m else (0, 0, 0, 0)
+            cols["x1"].append(x1)
+            cols["y1"].append(y1)
+            cols["x2"].append(x2)
+            cols["y2"].append(y2)
+            cols["flags"].append(
+                (F_CLICKABLE if c.clickable else 0)
+                | (0 if c.enabled else F_DISABLED)
+                | (F_FOCUSABLE if c.focusable else 0)
+                | (F_FOCUSED if c.focused else 0)
+                | (F_SCROLLABLE if c.scrollable else 0)
+                | (F_BOUNDS if m else 0)
+            )
+            cols["subtree_end"].append(c.subtree_end)
+            cols["window"].append(c.window)
+        dump_off.append(len(cols["flags"]))
+
+    sections: List[Tuple[str, bytes]] = []
+    for name in POOLS:
+        offsets, data = pools[name].encode()
+        sections.append((f"{name}.off", offsets))
+        sections.append((f"{name}.dat", data))
+    for name, _ in COLUMNS:
+        sections.append((f"col.{name}", cols[name].tobytes()))
+    sections.append(("dump.off", dump_off.tobytes()))
+    sections.append(("dump.name", dump_name.tobytes()))
+    sections.append(("dump.pkg", dump_pkg.tobytes()))
+
+    n_dumps, n_nodes = len(dump_name), len(cols["flags"])
+    tmp = f"{out}.tmp"
+    with open(tmp, "wb") as f:
+        pos = HEADER.size + SECTION.size * len(sections)
+        directory = []
+        for name, blob in sections:
+            pos = (pos + 7) & ~7  # 8-byte aligned sections
+            directory.append((name, pos, len(blob)))
+            pos += len(blob)
+        f.write(HEADER.pack(MAGIC, VERSION, n_dumps, n_nodes, len(sections)))
+        for name, off, length in directory:
+            f.write(SECTION.pack(name.encode("ascii"), off, length))
+        for (name, blob), (_, off, _) in zip(sections, directory):
+            f.write(b"\0" * (off - f.tell()))
+            f.write(blob)
+    os.replace(tmp, out)
+    return n_dumps, n_nodes
+
+
+# ---------------- reader ----------------
+
+class StringPool:
+    def __init__(self, offsets: memoryview, data: memoryview):
+        self.offsets = offsets
+        self.data = data
+        self._cache: Dict[int, str] = {0: ""}
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def get(self, i: int) -> str:
+        s = self._cache.get(i)
+        if s is None:
+            s = self._cache[i] = str(self.data[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+        return s
+
+    def index(self, s: str) -> int:
+        # linear, but only once per query (pools are small: a few thousand entries)
+        raw = s.encode("utf-8")
+        off, data = self.offsets, self.data
+        for i in range(len(self)):
+            if off[i + 1] - off[i] == len(raw) and data[off[i]:off[i + 1]] == raw:
+                return i
+        return -1
+
+
+class DumpArchive:
+    """Read-only view over a .cfla file. Columns are memoryviews on the mmap."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fh = open(path, "rb")
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mm)
+        magic, version, self.n_dumps, self.n_nodes, n_sections = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: not a v{VERSION} dump archive")
+        if sys.byteorder != "little":
+            raise ValueError("dump archives are little-endian")
+        self._sections: Dict[str, memoryview] = {}
+        self._offsets: Dict[str, int] = {}
+        for k in range(n_sections):
+            raw, off, length = SECTION.unpack_from(buf, HEADER.size + k * SECTION.size)
+            name = raw.rstrip(b"\0").decode("ascii")
+            self._sections[name] = buf[off:off + length]
+            self._offsets[name] = off
+
+        self.pools = {
+            name: StringPool(self._sections[f"{name}.off"].cast("I"), self._sections[f"{name}.dat"])
+            for name in POOLS
+        }
+        self.cols = {name: self._sections[f"col.{name}"].cast("i") for name, _ in COLUMNS}
+        self.dump_off = self._sections["dump.off"].cast("I")
+        self.dump_name = self._sections["dump.name"].cast("i")
+        self.dump_pkg = self._sections["dump.pkg"].cast("i")
+        self._by_name: Optional[Dict[str, int]] = None
+
+    def close(self) -> None:
+        # release exported views before closing the map
+        self.cols.clear()
+        self.pools.clear()
+        self._sections.clear()
+        self.dump_off = self.dump_name = self.dump_pkg = None  # type: ignore[assignment]
+        try:
+            self._mm.close()
+        except BufferError:
+            pass  # a caller still holds a view; the map goes away with it
+        self._fh.close()
+
+    def __enter__(self) -> "DumpArchive":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.n_dumps
+
+    def name(self, i: int) -> str:
+        return self.pools["name"].get(self.dump_name[i])
+
+    def lookup(self, key: str) -> int:
+        """Dump index from a name (as packed) or a decimal index."""
+        if key.isdigit():
+            i = int(key)
+            if i >= self.n_dumps:
+                raise KeyError(key)
+            return i
+        if self._by_name is None:
+            self._by_name = {self.name(i): i for i in range(self.n_dumps)}
+        return self._by_name[key]
+
+    def node_range(self, i: int) -> Tuple[int, int]:
+        return self.dump_off[i], self.dump_off[i + 1]
+
+    def candidates(self, i: int):
+        """Same (candidates, size, dominant_pkg) tuple as extract_candidates()."""
+        from llm_explore import Candidate
+
+        lo, hi = self.node_range(i)
+        col = self.cols
+        pkg, cls, rid = self.pools["pkg"], self.pools["cls"], self.pools["rid"]
+        strs = self.pools["str"]
+        cpkg, ccls, crid = col["pkg"][lo:hi], col["cls"][lo:hi], col["rid"][lo:hi]
+        ctext, cdesc, clabel = col["text"][lo:hi], col["desc"][lo:hi], col["label"][lo:hi]
+        cx1, cy1, cx2, cy2 = col["x1"][lo:hi], col["y1"][lo:hi], col["x2"][lo:hi], col["y2"][lo:hi]
+        cflags, cend, cwin = col["flags"][lo:hi], col["subtree_end"][lo:hi], col["window"][lo:hi]
+
+        out = []
+        max_x, max_y, clickable = 0, 0, 0
+        for k in range(hi - lo):
+            fl = cflags[k]
+            bounds, center = "", None
+            if fl & F_BOUNDS:
+                x1, y1, x2, y2 = cx1[k], cy1[k], cx2[k], cy2[k]
+                bounds = f"[{x1},{y1}][{x2},{y2}]"
+                if x2 > x1 and y2 > y1:
+                    center = ((x1 + x2) // 2, (y1 + y2) // 2)
+                    max_x, max_y = max(max_x, x2), max(max_y, y2)
+            if fl & F_CLICKABLE:
+                clickable += 1
+            out.append(
+                Candidate(
+                    idx=k,
+                    package=pkg.get(cpkg[k]),
+                    class_name=cls.get(ccls[k]),
+                    resource_id=rid.get(crid[k]),
+                    text=strs.get(ctext[k]),
+                    content_desc=strs.get(cdesc[k]),
+                    label=strs.get(clabel[k]),
+                    clickable=bool(fl & F_CLICKABLE),
+                    enabled=not fl & F_DISABLED,
+                    focusable=bool(fl & F_FOCUSABLE),
+                    focused=bool(fl & F_FOCUSED),
+                    bounds=bounds,
+                    center=center,
+                    scrollable=bool(fl & F_SCROLLABLE),
+                    subtree_end=cend[k],
+                    window=cwin[k],
+                )
+            )
+        size = {
+            "width": max(max_x, 1080),
+            "height": max(max_y, 2400),
+            "total_nodes": len(out),
+            "clickable_nodes": clickable,
+        }
+        return out, size, pkg.get(self.dump_pkg[i])
+
+    def dumps_with(self, column: str, value: str) -> List[int]:
+        """Dumps having at least one node whose <column> string equals <value>.
+
+        Runs on the raw column bytes (bytes.find), no per-node Python loop.
+        """
+        pool = self.pools[dict(COLUMNS)[column]]
+        sid = pool.index(value)
+        if sid <= 0:
+            return []
+        base = self._offsets[f"col.{column}"]
+        end = base + self._sections[f"col.{column}"].nbytes
+        needle = struct.pack("<i", sid)
+        hits: List[int] = []
+        pos = base
+        off = self.dump_off
+        d = 0
+        while True:
+            pos = self._mm.find(needle, pos, end)
+            if pos < 0:
+                break
+            if (pos - base) % 4:
+                pos += 1
+                continue
+            node = (pos - base) // 4
+            while off[d + 1] <= node:
+                d += 1
+            hits.append(d)
+            pos = base + off[d + 1] * 4  # next dump
+        return hits
+
+
+# ---------------- path helpers (used by llm_explore) ----------------
+
+_OPEN: Dict[str, DumpArchive] = {}
+
+
+def is_archive_ref(path: str) -> bool:
+    return ARCHIVE_SEP in path and path.split(ARCHIVE_SEP, 1)[0].endswith(".cfla")
+
+
+def load_ref(ref: str):
+    """'corpus.cfla::<name|index>' -> extract_candidates() tuple (archive kept open)."""
+    path, key = ref.split(ARCHIVE_SEP, 1)
+    arc = _OPEN.get(path)
+    if arc is None:
+        arc = _OPEN[path] = DumpArchive(path)
+    return arc.candidates(arc.lookup(key))
+
+
+# ---------------- cli ----------------
+
+def cmd_pack(args: argparse.Namespace) -> int:
+    t0 = time.perf_counter()
+    n_dumps, n_nodes = pack(args.paths, args.out, root=args.root)
+    size = os.path.getsize(args.out)
+    log(f"packed dumps={n_dumps} nodes={n_nodes} -> {args.out} ({size / 1e6:.1f} MB) in {time.perf_counter() - t0:.1f}s")
+    return 0 if n_dumps else 1
+
+
+def cmd_ls(args: argparse.Namespace) -> int:
+    with DumpArchive(args.archive) as arc:
+        for i in range(len(arc)):
+            lo, hi = arc.node_range(i)
+            print(f"{i}\t{hi - lo}\t{arc.pools['pkg'].get(arc.dump_pkg[i])}\t{arc.name(i)}")
+    return 0
+
+
+def cmd_scan(args: argparse.Namespace) -> int:
+    t0 = time.perf_counter()
+    with DumpArchive(args.archive) as arc:
+        if args.resid or args.package:
+            col, value = ("rid", args.resid) if args.resid else ("pkg", args.package)
+            if col == "rid" and ":id/" not in value:
+                # accept bare suffixes: match every packed resid ending with it
+                pool = arc.pools["rid"]
+                values = [pool.get(k) for k in range(1, len(pool)) if pool.get(k).endswith(f":id/{value}")]
+            else:
+                values = [value]
+            hits = sorted({d for v in values for d in arc.dumps_with(col, v)})
+            for d in hits:
+                print(arc.name(d))
+            log(f"matches={len(hits)}/{len(arc)} in {(time.perf_counter() - t0) * 1000:.0f}ms")
+            return 0 if hits else 1
+
+        pkgs = Counter(arc.dump_pkg.tolist())
+        log(f"dumps={len(arc)} nodes={arc.n_nodes} strings="
+            + " ".join(f"{k}={len(p)}" for k, p in arc.pools.items()))
+        for pid, n in pkgs.most_common(10):
+            print(f"{n}\t{arc.pools['pkg'].get(pid) or '-'}")
+        log(f"scan {(time.perf_counter() - t0) * 1000:.0f}ms")
+    return 0
+
+
+def main() -> int:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Columnar mmap archive of uiautomator dumps")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("pack", help="Convert XML dumps (files or directories) into one archive")
+    p.add_argument("paths", nargs="+")
+    p.add_argument("--out", required=True)
+    p.add_argument("--root", default=None, help="Store dump names relative to this directory")
+    p.set_defaults(func=cmd_pack)
+
+    p = sub.add_parser("ls", help="List dumps (index, nodes, package, name)")
+    p.add_argument("archive")
+    p.set_defaults(func=cmd_ls)
+
+    p = sub.add_parser("scan", help="Corpus stats, or dumps containing a resource-id / package")
+    p.add_argument("archive")
+    p.add_argument("--resid", default="", help="Full resource-id or ':id/' suffix")
+    p.add_argument("--package", default="")
+    p.set_defaults(func=cmd_scan)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
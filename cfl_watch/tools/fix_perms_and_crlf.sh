@@ -28,9 +28,11 @@ find "$TARGET_DIR" -type f \( -name "*.sh" -o -name "*.py" -o -name "*.md" -o -n
 | while IFS= read -r -d '' file; do
     sed -i 's/\r$//' "$file" || true
   done
+[ -f "$TARGET_DIR/tools/fake_adb/adb" ] && sed -i 's/\r$//' "$TARGET_DIR/tools/fake_adb/adb" || true
 
 chmod +x "$TARGET_DIR/runner.sh" 2>/dev/null || true
 chmod +x "$TARGET_DIR/console.sh" 2>/dev/null || true
 chmod +x "$TARGET_DIR"/lib/*.sh "$TARGET_DIR"/scenarios/*.sh "$TARGET_DIR"/tools/*.sh 2>/dev/null || true
+chmod +x "$TARGET_DIR/tools/fake_adb/adb" 2>/dev/null || true
 
 log "Done"
@@ -18,11 +18,14 @@ import argparse
 import ast
 import hashlib
 import json
+import marshal
 import os
 import re
 import sys
 import textwrap
+import zlib
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from typing import Dict, List, Optional, Tuple
@@ -32,6 +35,10 @@ import xml.etree.ElementTree as ET
 
 BOUNDS_RE = re.compile(r"\[(\d+),(\d+)\]\[(\d+),(\d+)\]")
 
+# Bump when build_trip_plan output changes (invalidates plan cache).
+# The prompt version is derived from the prompt text (see PLAN_PROMPT_VERSION below).
+PLAN_PARSER_VERSION = 3
+
 
 # ---------------- logging ----------------
 
@@ -54,11 +61,26 @@ def _norm_base(url: str) -> str:
     return url
 
 
-def _chat_completions_url() -> str:
-    base = _norm_base(os.getenv("OPENAI_BASE_URL", "http://127.0.0.1:8001"))
+def _chat_completions_url(direct: bool = False) -> str:
+    # LLM_GATEWAY_URL: shared coalescing/batching gateway (tools/llm_gateway.py) in front of OPENAI_BASE_URL
+    gateway = "" if direct else os.getenv("LLM_GATEWAY_URL", "")
+    base = _norm_base(gateway or os.getenv("OPENAI_BASE_URL", "http://127.0.0.1:8001"))
     return f"{base}/v1/chat/completions"
 
 
+def _post_chat(payload: Dict, api_key: str, timeout: float) -> "requests.Response":
+    """POST a chat completion; if the gateway is gone (it exits when idle), call OPENAI_BASE_URL directly."""
+    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
+    with requests.Session() as sess:
+        try:
+            return sess.post(_chat_completions_url(), headers=headers, json=payload, timeout=timeout)
+        except requests.ConnectionError as e:
+            if not os.getenv("LLM_GATEWAY_URL"):
+                raise
+            warn(f"LLM gateway unreachable ({e.__class__.__name__}), calling OPENAI_BASE_URL directly")
+            return sess.post(_chat_completions_url(direct=True), headers=headers, json=payload, timeout=timeout)
+
+
 # ---------------- helpers ----------------
 
 
@@ -148,20 +170,43 @@ def is_repeat_loop(hist: List[Dict], sig: str, action: Dict) -> bool:
 # ---------------- trip plan (intent) ----------------
 
 
+# words that end a place name: time / date, "at"/"on" ("demain à 8h", "tomorrow at 8")
+PLACE_END = r"(?:demain|tomorrow|aujourd'hui|today|ce\s+soir|tonight|maintenant|now|à|at|le|on|\d+)\b"
+PLACE_END_RE = re.compile(r"\s+" + PLACE_END, re.IGNORECASE)
+VIA_RE = re.compile(
+    r"\s+via\s+([A-Za-zÀ-ÿ0-9' -]{2,}?)(?=\s*(?:->|→|,|;|$)|\s+" + PLACE_END + ")", re.IGNORECASE
+)
+# "sans via" / "without via X": a constraint (parse_constraints_from_instruction), not a stopover
+NO_VIA_RE = re.compile(r"\s*\b(?:sans|without|no)\s+via\b(?:(?!->|→)[^,;])*", re.IGNORECASE)
+START_PREFIX_RE = re.compile(r"^(?:(?:go|aller|partir)\s+)?(?:from|de|depuis)\s+", re.IGNORECASE)
+
+
+def _place(s: str) -> str:
+    m = PLACE_END_RE.search(s)
+    if m:
+        s = s[: m.start()]
+    return s.strip(" -\t\n")
+
+
 def parse_targets_from_instruction(instruction: str) -> Dict[str, str]:
-    s = instruction or ""
+    s = NO_VIA_RE.sub("", instruction or "")
+    m_via = VIA_RE.search(s)
+    via = _place(m_via.group(1)) if m_via else ""
+    if m_via:
+        s = s[: m_via.start()] + s[m_via.end():]
     patterns = [
         r"([A-Za-zÀ-ÿ0-9' -]{2,})\s*(?:->|→)\s*([A-Za-zÀ-ÿ0-9' -]{2,})",
-        r"([A-Za-zÀ-ÿ0-9' -]{2,})\s*(?:à|to)\s*([A-Za-zÀ-ÿ0-9' -]{2,})",
+        # first " à " / " to ": the destination is cut at the next time word
+        r"([A-Za-zÀ-ÿ0-9' -]{2,}?)\s+(?:à|to)\s+([A-Za-zÀ-ÿ0-9' -]{2,})",
     ]
     for pat in patterns:
         m_all = list(re.finditer(pat, s, flags=re.IGNORECASE))
         if m_all:
             m = m_all[-1]
-            start = m.group(1).strip(" -\t\n")
-            dest = m.group(2).strip(" -\t\n")
-            return {"start": start, "destination": dest}
-    return {"start": "", "destination": ""}
+            start = START_PREFIX_RE.sub("", m.group(1).strip(" -\t\n"))
+            dest = _place(m.group(2))
+            return {"start": start, "destination": dest, "via": via}
+    return {"start": "", "destination": "", "via": via}
 
 
 def parse_constraints_from_instruction(instruction: str) -> Dict:
@@ -199,6 +244,7 @@ def build_trip_plan(instruction: str) -> Dict:
     return {
         "start": t.get("start", ""),
         "destination": t.get("destination", ""),
+        "via": t.get("via", ""),
         "when": c.get("when", "now"),
         "no_via": bool(c.get("no_via")),
         "train_only": bool(c.get("train_only")),
@@ -208,50 +254,65 @@ def build_trip_plan(instruction: str) -> Dict:
     }
 
 
+PLAN_SYSTEM_PROMPT = "Return ONLY one JSON object. No markdown."
+
+PLAN_SCHEMA_HINT = {
+    "start": "Luxembourg",
+    "destination": "Arlon",
+    "via": "",
+    "when": "now",
+    "no_via": True,
+    "train_only": True,
+    "exclude_modes": ["bus", "tram"],
+    "allowed_services": ["TGV", "IC", "TER", "RE", "RB"],
+}
+
+PLAN_PROMPT_TEMPLATE = textwrap.dedent(
+    """
+    Extract a Trip Planner plan from the instruction.
+    Return ONLY JSON.
+
+    Instruction:
+    {instruction}
+
+    JSON schema (example values):
+    {schema}
+
+    Rules:
+    - via: stopover station when the instruction says "via X", otherwise "".
+    - when: "now" unless a specific date/time is clearly stated (then still return "now" if unsure).
+    - train_only true if user says train only / excludes bus/tram.
+    - allowed_services: include any of [TGV,IC,TER,RE,RB] mentioned; otherwise default to all of them.
+    """
+).strip()
+
+# Derived from the prompt itself: editing it invalidates cached LLM plans, no manual bump.
+PLAN_PROMPT_VERSION = hashlib.sha1(
+    "\0".join(
+        [PLAN_SYSTEM_PROMPT, PLAN_PROMPT_TEMPLATE, json.dumps(PLAN_SCHEMA_HINT, sort_keys=True)]
+    ).encode("utf-8")
+).hexdigest()[:12]
+
+
 def call_llm_trip_plan(instruction: str, model: str) -> Dict:
     """
     Optional: let the LLM extract a plan from text.
     If it fails, caller should fallback to heuristic.
     """
-    url = _chat_completions_url()
     api_key = os.getenv("OPENAI_API_KEY", "dummy")
 
     timeout = float(os.getenv("OPENAI_TIMEOUT", "60"))
     temperature = float(os.getenv("LLM_TEMPERATURE", "0"))
     max_tokens = int(os.getenv("LLM_PLAN_MAX_TOKENS", "256"))
 
-    schema_hint = {
-        "start": "Luxembourg",
-        "destination": "Arlon",
-        "when": "now",
-        "no_via": True,
-        "train_only": True,
-        "exclude_modes": ["bus", "tram"],
-        "allowed_services": ["TGV", "IC", "TER", "RE", "RB"],
-    }
-
-    prompt = textwrap.dedent(
-        f"""
-        Extract a Trip Planner plan from the instruction.
-        Return ONLY JSON.
-
-        Instruction:
-        {instruction}
-
-        JSON schema (example values):
-        {json.dumps(schema_hint, ensure_ascii=False)}
-
-        Rules:
-        - when: "now" unless a specific date/time is clearly stated (then still return "now" if unsure).
-        - train_only true if user says train only / excludes bus/tram.
-        - allowed_services: include any of [TGV,IC,TER,RE,RB] mentioned; otherwise default to all of them.
-        """
-    ).strip()
+    prompt = PLAN_PROMPT_TEMPLATE.format(
+        instruction=instruction, schema=json.dumps(PLAN_SCHEMA_HINT, ensure_ascii=False)
+    )
 
     payload = {
         "model": model,
         "messages": [
-            {"role": "system", "content": "Return ONLY one JSON object. No markdown."},
+            {"role": "system", "content": PLAN_SYSTEM_PROMPT},
             {"role": "user", "content": prompt},
         ],
         "temperature": temperature,
@@ -260,13 +321,7 @@ def call_llm_trip_plan(instruction: str, model: str) -> Dict:
         "response_format": {"type": "json_object"},
     }
 
-    with requests.Session() as sess:
-        r = sess.post(
-            url,
-            headers={"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"},
-            json=payload,
-            timeout=timeout,
-        )
+    r = _post_chat(payload, api_key, timeout)
     if not r.ok:
         raise RuntimeError(f"LLM(plan) HTTP {r.status_code}: {r.text[:2000]}")
     data = r.json()
@@ -274,6 +329,146 @@ def call_llm_trip_plan(instruction: str, model: str) -> Dict:
     return parse_llm_response(content)
 
 
+# ---------------- plan cache ----------------
+
+
+def _plan_cache_dir() -> str:
+    return os.path.expanduser(os.getenv("LLM_PLAN_CACHE_DIR", "~/.cache/cfl_watch/plans"))
+
+
+def normalize_instruction(instruction: str) -> str:
+    return re.sub(r"\s+", " ", _norm(instruction))
+
+
+def plan_cache_key(instruction: str, source: str, model: str = "") -> str:
+    """
+    source: "heuristic" or "llm". Versions are part of the key, so bumping
+    PLAN_PARSER_VERSION or editing the plan prompt (PLAN_PROMPT_VERSION is its
+    hash) naturally invalidates old entries.
+    """
+    if source == "llm":
+        raw = f"llm|p{PLAN_PARSER_VERSION}|q{PLAN_PROMPT_VERSION}|{model}|{normalize_instruction(instruction)}"
+    else:
+        raw = f"heuristic|p{PLAN_PARSER_VERSION}|{normalize_instruction(instruction)}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def load_plan_by_key(key: str) -> Optional[Dict]:
+    path = os.path.join(_plan_cache_dir(), f"{key}.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if entry.get("parser_version") != PLAN_PARSER_VERSION:
+        return None
+    if entry.get("source") == "llm" and entry.get("prompt_version") != PLAN_PROMPT_VERSION:
+        return None
+    plan = entry.get("plan")
+    return plan if isinstance(plan, dict) else None
+
+
+def store_plan(key: str, instruction: str, source: str, plan: Dict, model: str = "") -> None:
+    d = _plan_cache_dir()
+    os.makedirs(d, exist_ok=True)
+    entry = {
+        "key": key,
+        "instruction": instruction,
+        "source": source,
+        "model": model,
+        "parser_version": PLAN_PARSER_VERSION,
+        "prompt_version": PLAN_PROMPT_VERSION,
+        "ts": _utc_iso(),
+        "plan": plan,
+    }
+    tmp = os.path.join(d, f".{key}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp, os.path.join(d, f"{key}.json"))
+
+
+def get_plan(instruction: str, model: str, use_llm: bool = False) -> Tuple[Dict, str]:
+    """
+    Cached plan lookup. Prefers a precompiled LLM plan, then the heuristic one.
+    With use_llm, a missing LLM plan is computed (fallback: heuristic, not cached as llm).
+    Returns (plan, source).
+    """
+    cache_on = os.getenv("LLM_PLAN_CACHE", "1") != "0"
+
+    lkey = plan_cache_key(instruction, "llm", model)
+    if cache_on:
+        plan = load_plan_by_key(lkey)
+        if plan is not None:
+            return plan, "llm"
+
+    if use_llm:
+        try:
+            plan = call_llm_trip_plan(instruction, model)
+            if cache_on:
+                store_plan(lkey, instruction, "llm", plan, model)
+            return plan, "llm"
+        except Exception as e:
+            warn(f"Plan LLM failed, fallback to heuristic: {e}")
+
+    hkey = plan_cache_key(instruction, "heuristic")
+    if cache_on:
+        plan = load_plan_by_key(hkey)
+        if plan is not None:
+            return plan, "heuristic"
+    plan = build_trip_plan(instruction)
+    if cache_on:
+        store_plan(hkey, instruction, "heuristic", plan)
+    return plan, "heuristic"
+
+
+def read_instructions(path: str) -> List[str]:
+    """
+    Accepts data/trips.txt lines (START|TARGET[|VIA][|SNAP]) or one free-text
+    instruction per line. Blank lines and # comments are skipped.
+    """
+    out: List[str] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if "|" in line:
+                ins = trip_line_instruction(line)
+                if not ins:
+                    warn(f"Skipping invalid trip line: {line}")
+                    continue
+                line = ins
+            out.append(line)
+    return out
+
+
+def trip_line_instruction(line: str) -> str:
+    """
+    START|TARGET[|VIA][|SNAP] -> "START -> TARGET[ via VIA]" (same rules as
+    batch_trips.sh: a numeric 3rd field is SNAP). Empty string if invalid.
+    """
+    parts = [p.strip() for p in line.split("|")]
+    if len(parts) < 2 or not parts[0] or not parts[1]:
+        return ""
+    via = parts[2] if len(parts) > 2 and not parts[2].isdigit() else ""
+    return f"{parts[0]} -> {parts[1]}" + (f" via {via}" if via else "")
+
+
+def compile_plans(instructions: List[str], model: str, use_llm: bool, jobs: int) -> List[Dict]:
+    """Precompile plans for many instructions (bounded-parallel LLM calls)."""
+    uniq: Dict[str, str] = {}
+    for ins in instructions:
+        uniq.setdefault(normalize_instruction(ins), ins)
+
+    def one(ins: str) -> Dict:
+        plan, source = get_plan(ins, model, use_llm=use_llm)
+        key = plan_cache_key(ins, source, model)
+        return {"key": key, "source": source, "instruction": ins, "plan": plan}
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        return list(pool.map(one, uniq.values()))
+
+
 # ---------------- UI model ----------------
 
 
@@ -292,6 +487,9 @@ class Candidate:
     focused: bool
     bounds: str
     center: Optional[Tuple[int, int]]
+    scrollable: bool = False
+    subtree_end: int = 0  # idx of the first node after this node's subtree (preorder)
+    window: int = 0  # top-level <node> under <hierarchy> (one per window in multi-window dumps)
 
 
 def is_ime_candidate_pkg(pkg: str) -> bool:
@@ -344,49 +542,86 @@ def _derive_label(node: ET.Element) -> str:
 
 
 def extract_candidates(xml_path: str) -> Tuple[List[Candidate], Dict[str, int], str]:
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-
-    candidates: List[Candidate] = []
-    max_x, max_y = 0, 0
-    packages: List[str] = []
-
-    for idx, node in enumerate(root.iter("node")):
-        a = node.attrib
-        bounds = a.get("bounds", "")
-        parsed = parse_bounds(bounds)
-        center = None
-        if parsed:
-            x1, y1, x2, y2 = parsed
-            center = ((x1 + x2) // 2, (y1 + y2) // 2)
-            max_x, max_y = max(max_x, x2), max(max_y, y2)
-
-        pkg = a.get("package", "") or a.get("packageName", "")
-        if pkg:
-            packages.append(pkg)
-
-        txt = a.get("text", "") or ""
-        desc = a.get("content-desc", "") or ""
-        label = _derive_label(node)
+    from dump_archive import is_archive_ref, load_ref
 
-        candidates.append(
-            Candidate(
-                idx=idx,
-                package=pkg,
-                class_name=a.get("class", ""),
-                resource_id=a.get("resource-id", ""),
-                text=txt,
-                content_desc=desc,
-                label=label,
-                clickable=_bool_attr(a.get("clickable"), default=False),
-                enabled=not (a.get("enabled", "").strip().lower() == "false"),
-                focusable=_bool_attr(a.get("focusable"), default=False),
-                focused=_bool_attr(a.get("focused"), default=False),
-                bounds=bounds,
-                center=center,
-            )
-        )
+    if is_archive_ref(xml_path):
+        # dump stored in a columnar archive (tools/dump_archive.py): no XML parsing
+        return load_ref(xml_path)
+
+    return _candidates_from_root(ET.parse(xml_path).getroot())
+
+
+def extract_candidates_text(xml_text: str) -> Tuple[List[Candidate], Dict[str, int], str]:
+    """extract_candidates() for a dump held in memory (tree_diff frames of a packed run)."""
+    return _candidates_from_root(ET.fromstring(xml_text))
 
+
+def _candidates_from_root(root: ET.Element) -> Tuple[List[Candidate], Dict[str, int], str]:
+    order, subtree_end, window = _tree_shape(root)
+    built = [
+        _build_candidate(idx, node.attrib, _derive_label(node), subtree_end[idx], window[idx])
+        for idx, node in enumerate(order)
+    ]
+    return _summarize(built)
+
+
+def _tree_shape(root: ET.Element) -> Tuple[List[ET.Element], List[int], List[int]]:
+    """Preorder nodes + subtree_end / window per node."""
+    order = list(root.iter("node"))
+    pos = {id(n): i for i, n in enumerate(order)}
+    subtree_end = [0] * len(order)
+    for i in range(len(order) - 1, -1, -1):
+        end = i + 1
+        for child in order[i]:
+            if child.tag == "node":
+                end = max(end, subtree_end[pos[id(child)]])
+        subtree_end[i] = end
+    window = [0] * len(order)
+    for w, top in enumerate(c for c in root if c.tag == "node"):
+        i = pos[id(top)]
+        for j in range(i, subtree_end[i]):
+            window[j] = w
+    return order, subtree_end, window
+
+
+# (candidate, max x, max y) - extents feed the screen size
+Built = Tuple[Candidate, int, int]
+
+
+def _build_candidate(idx: int, a: Dict[str, str], label: str, subtree_end: int, window: int) -> Built:
+    bounds = a.get("bounds", "")
+    parsed = parse_bounds(bounds)
+    center = None
+    x2 = y2 = 0
+    if parsed:
+        x1, y1, x2, y2 = parsed
+        center = ((x1 + x2) // 2, (y1 + y2) // 2)
+
+    cand = Candidate(
+        idx=idx,
+        package=a.get("package", "") or a.get("packageName", ""),
+        class_name=a.get("class", ""),
+        resource_id=a.get("resource-id", ""),
+        text=a.get("text", "") or "",
+        content_desc=a.get("content-desc", "") or "",
+        label=label,
+        clickable=_bool_attr(a.get("clickable"), default=False),
+        enabled=not (a.get("enabled", "").strip().lower() == "false"),
+        focusable=_bool_attr(a.get("focusable"), default=False),
+        focused=_bool_attr(a.get("focused"), default=False),
+        bounds=bounds,
+        center=center,
+        scrollable=_bool_attr(a.get("scrollable"), default=False),
+        subtree_end=subtree_end,
+        window=window,
+    )
+    return cand, x2, y2
+
+
+def _summarize(built: List[Built]) -> Tuple[List[Candidate], Dict[str, int], str]:
+    candidates = [b[0] for b in built]
+    max_x = max((b[1] for b in built), default=0)
+    max_y = max((b[2] for b in built), default=0)
     size = {
         "width": max(max_x, 1080),
         "height": max(max_y, 2400),
@@ -394,6 +629,7 @@ def extract_candidates(xml_path: str) -> Tuple[List[Candidate], Dict[str, int],
         "clickable_nodes": sum(1 for c in candidates if c.clickable),
     }
 
+    packages = [c.package for c in candidates if c.package]
     dominant_pkg = ""
     if packages:
         dominant_pkg = Counter(packages).most_common(1)[0][0]
@@ -401,38 +637,198 @@ def extract_candidates(xml_path: str) -> Tuple[List[Candidate], Dict[str, int],
     return candidates, size, dominant_pkg
 
 
-# ---------------- phase detection ----------------
+# ---------------- incremental extraction (tree delta) ----------------
 
+TREE_CACHE_VERSION = 1
 
-def detect_phase(all_nodes: List[Candidate]) -> str:
-    ids = [c.resource_id for c in all_nodes if c.resource_id]
-    texts = " ".join([c.text for c in all_nodes if c.text])
-    descs = " ".join([c.content_desc for c in all_nodes if c.content_desc])
 
-    # Drawer/menu open
-    if any("drawer_list" in rid for rid in ids) or any("drawer_layout" in rid for rid in ids):
-        return "drawer"
+def _row(b: Built) -> tuple:
+    # Candidate fields in declaration order + extents (marshal-friendly)
+    c, x2, y2 = b
+    return (*c.__dict__.values(), x2, y2)
 
-    # Location picker
-    if any(rid.endswith(":id/input_location_name") for rid in ids):
-        return "picker"
 
-    # Trip planner form (Trip Planner screen)
-    if any(rid.endswith(":id/button_search_default") or rid.endswith(":id/button_search") for rid in ids):
-        return "tripplanner_form"
+def _label_from_built(a: Dict[str, str], built: List[Optional[Built]], i: int, end: int) -> str:
+    """_derive_label() over already built descendants (same preorder rule)."""
+    txt = (a.get("text", "") or "").strip()
+    desc = (a.get("content-desc", "") or "").strip()
+    if txt:
+        return txt
+    if desc:
+        return desc
+    for j in range(i + 1, end):
+        d = built[j][0]
+        if d.text.strip():
+            return d.text.strip()
+        if d.content_desc.strip():
+            return d.content_desc.strip()
+    rid = (a.get("resource-id", "") or "").strip()
+    if rid:
+        return rid.split("/")[-1]
+    return ""
+
 
-    # Home has input_start/input_target too in your dumps
-    if any("id/input_start" in rid for rid in ids) and any("id/input_target" in rid for rid in ids):
-        # If the big SEARCH button is visible, treat as tripplanner_form anyway
-        if "SEARCH" in texts or "SEARCH" in descs:
-            return "tripplanner_form"
-        return "home"
+def _load_tree_cache(path: str) -> Optional[Dict]:
+    try:
+        with open(path, "rb") as f:
+            cache = marshal.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        warn(f"tree cache unreadable ({e}) -> full rebuild")
+        return None
+    if not isinstance(cache, dict) or cache.get("v") != TREE_CACHE_VERSION:
+        return None
+    return cache
 
-    # Date picker-ish (your log showed day cells like "03 January 2026")
-    if re.search(r"\b\d{2}\s+\w+\s+\d{4}\b", descs) and ("January" in descs or "janvier" in descs):
-        return "datetime_picker"
 
-    return "unknown"
+def _store_tree_cache(path: str, cache: Dict) -> None:
+    # tmp + rename: a reader sees the previous cache or the new one, never a torn file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(marshal.dumps(cache))
+        os.replace(tmp, path)
+    except Exception as e:
+        warn(f"tree cache not saved: {e}")
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def extract_candidates_incremental(xml_path: str, cache_path: str) -> Tuple[List[Candidate], Dict[str, int], str]:
+    """
+    Same result as extract_candidates, updated from the previous dump instead of
+    rebuilt: nodes are matched on their tree_diff key and compared on their raw
+    tag, only changed nodes (and the ancestors whose label may move) are parsed.
+    The cache (marshal) holds the previous dump's keys, raw tags and candidate rows.
+    """
+    from tree_diff import parse_attrs, scan_nodes
+
+    with open(xml_path, "rb") as f:
+        raw = f.read()
+    file_digest = [zlib.crc32(raw), len(raw)]
+    prev = _load_tree_cache(cache_path)
+
+    if prev and prev["file"] == file_digest:
+        # same screen as last step (waits, loaders that did not move)
+        log(f"tree delta: identical dump, reused {len(prev['rows'])}/{len(prev['rows'])}")
+        return _summarize([(Candidate(*r[:-2]), r[-2], r[-1]) for r in prev["rows"]])
+
+    scanned = scan_nodes(raw.decode("utf-8"))
+    if scanned is None:
+        warn("tree delta: unexpected markup -> full rebuild")
+        try:
+            os.remove(cache_path)
+        except OSError:
+            pass
+        return extract_candidates(xml_path)
+    keys, tags, subtree_end, window = scanned
+    n = len(tags)
+
+    prev_pos: Dict[str, int] = {k: i for i, k in enumerate(prev["keys"])} if prev else {}
+    old_of = [prev_pos.get(k, -1) for k in keys]
+
+    # changed = new node or different raw tag; a node is reused when nothing changed
+    # in its subtree (labels come from descendants) and the subtree kept its size
+    changed = [1] * n
+    if prev:
+        p_tags = prev["tags"]
+        for i, oi in enumerate(old_of):
+            if oi >= 0 and p_tags[oi] == tags[i]:
+                changed[i] = 0
+    acc = [0] * (n + 1)
+    for i in range(n):
+        acc[i + 1] = acc[i] + changed[i]
+
+    # reverse preorder: descendants are ready when a label has to be derived
+    built: List[Optional[Built]] = [None] * n
+    reused = 0
+    for i in range(n - 1, -1, -1):
+        oi = old_of[i]
+        end = subtree_end[i]
+        if oi >= 0 and acc[end] == acc[i] and prev["subtree_end"][oi] - oi == end - i:
+            r = prev["rows"][oi]
+            built[i] = (Candidate(i, *r[1:-4], end, window[i]), r[-2], r[-1])
+            reused += 1
+        else:
+            a = parse_attrs(tags[i])
+            built[i] = _build_candidate(i, a, _label_from_built(a, built, i, end), end, window[i])
+
+    added = old_of.count(-1)
+    removed = len(prev_pos) - (n - added)
+    log(f"tree delta: +{added} -{removed} ~{sum(changed) - added} reused {reused}/{n}")
+
+    _store_tree_cache(
+        cache_path,
+        {
+            "v": TREE_CACHE_VERSION,
+            "file": file_digest,
+            "keys": keys,
+            "tags": tags,
+            "subtree_end": subtree_end,
+            "rows": [_row(b) for b in built],
+        },
+    )
+    return _summarize(built)
+
+
+# ---------------- occlusion (hit-test) ----------------
+
+OVERLAY_ID_HINTS = ("drawer", "dialog", "bottom_sheet", "parentpanel", "popup")
+
+
+def _is_blocker(c: Candidate) -> bool:
+    """Nodes that swallow a tap at their position (z-order above earlier siblings)."""
+    if c.clickable or c.scrollable:
+        return True
+    rid = _norm(c.resource_id)
+    return any(h in rid for h in OVERLAY_ID_HINTS)
+
+
+class HitGrid:
+    """
+    Uniform grid over node bounds (built once per dump).
+    Preorder idx is the z-order: a later node that is not a descendant is drawn on top.
+    """
+
+    def __init__(self, nodes: List[Candidate], cell: int = 160):
+        self.cell = cell
+        self.nodes = nodes
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        for c in nodes:
+            b = parse_bounds(c.bounds)
+            if not b:
+                continue
+            if not (_is_blocker(c) or c.window > 0):
+                continue
+            x1, y1, x2, y2 = b
+            for gx in range(x1 // cell, (x2 - 1) // cell + 1):
+                for gy in range(y1 // cell, (y2 - 1) // cell + 1):
+                    self.cells.setdefault((gx, gy), []).append(c.idx)
+
+    def occluder(self, c: Candidate) -> Optional[Candidate]:
+        """Topmost node covering c's center that would receive the tap instead of c."""
+        if not c.center:
+            return None
+        x, y = c.center
+        for j in reversed(self.cells.get((x // self.cell, y // self.cell), [])):
+            if j < c.subtree_end:
+                break  # sorted ascending: the rest are c, its ancestors/descendants or drawn below
+            o = self.nodes[j]
+            b = parse_bounds(o.bounds)
+            if b and b[0] <= x < b[2] and b[1] <= y < b[3]:
+                if o.window != c.window or _is_blocker(o):
+                    return o
+        return None
+
+
+def occluded_indices(all_nodes: List[Candidate]) -> set:
+    if os.getenv("LLM_OCCLUSION", "1") == "0":
+        return set()
+    grid = HitGrid(all_nodes)
+    return {c.idx for c in all_nodes if c.clickable and c.center and grid.occluder(c) is not None}
 
 
 # ---------------- state shaping ----------------
@@ -507,112 +903,241 @@ def state_signature(compact: Dict) -> str:
     return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
 
 
-# ---------------- rule-based fast path ----------------
-
+# ---------------- rules (declarative) ----------------
+#
+# Screens, finders and actions are data. A FeatureIndex is shared by phase
+# detection and the action rules: joined resid/text/desc blobs, tappables,
+# resid suffix map and normalized label blobs are each built at most once per
+# dump (on first use), so no rule rescans the tree.
+#
+# Phase rule keys (all given keys must match):
+#   resid_contains_any / resid_contains_all : substrings of any resource-id
+#   resid_suffix_any                        : ":id/<suffix>" present
+#   text_or_desc_contains_any               : substring of joined text/desc
+#   desc_regex + desc_contains_any          : on joined content-desc
+#
+# Finder specs (first spec that finds a node wins):
+#   {"resid": s}     first node ":id/s" with center + enabled
+#   {"resid_any": s} first node ":id/s" with center
+#   {"label": s}     tappable whose label/text/desc/resid blob contains s (longest label wins)
+#   {"city": var}    tappable non-IME entry containing the context var (longest label wins)
+#
+# Action rule keys: "if" (context conditions), "tap"/"type_into" (finders),
+# "placeholder" (found node must still show it), "key", "done", "reason".
+
+PHASE_RULES: List[Dict] = [
+    {"phase": "drawer", "resid_contains_any": ["drawer_list", "drawer_layout"]},
+    {"phase": "picker", "resid_suffix_any": ["input_location_name"]},
+    {"phase": "tripplanner_form", "resid_suffix_any": ["button_search_default", "button_search"]},
+    {"phase": "tripplanner_form", "resid_contains_all": ["id/input_start", "id/input_target"], "text_or_desc_contains_any": ["SEARCH"]},
+    {"phase": "home", "resid_contains_all": ["id/input_start", "id/input_target"]},
+    {"phase": "datetime_picker", "desc_regex": r"\b\d{2}\s+\w+\s+\d{4}\b", "desc_contains_any": ["January", "janvier"]},
+    {"phase": "journey_details", "resid_suffix_any": ["journey_details_head"]},
+    {"phase": "connection_details", "resid_suffix_any": ["text_line_name"]},
+    {"phase": "results", "resid_suffix_any": ["haf_connection_view"]},
+]
+
+START_FIELD = [{"resid": "input_start"}, {"label": "select start"}]
+DEST_FIELD = [{"resid": "input_target"}, {"label": "select destination"}]
+SEARCH_BUTTON = [{"resid": "button_search_default"}, {"resid": "button_search"}, {"label": "search"}]
+BURGER = [{"label": "drawer"}, {"label": "navigation"}, {"label": "open"}]
+LOCATION_FIELD = [{"resid_any": "input_location_name"}]
+
+_HOME_RULES: List[Dict] = [
+    {"tap": BURGER, "reason": "Open navigation drawer"},
+    {"if": ["start"], "tap": START_FIELD, "reason": "Open start field to set '{start}'"},
+]
+
+ACTION_RULES: Dict[str, List[Dict]] = {
+    "datetime_picker": [
+        {"if": ["when_now"], "key": 4, "reason": "Close date/time picker (BACK), plan is depart now"},
+    ],
+    "drawer": [
+        {"tap": [{"label": "trip planner"}], "reason": "Open Trip Planner from drawer menu"},
+        {"key": 4, "reason": "Close drawer (BACK) - Trip Planner not found"},
+    ],
+    "home": _HOME_RULES,
+    "unknown": _HOME_RULES,
+    "tripplanner_form": [
+        {"if": ["start"], "tap": START_FIELD, "placeholder": "select start", "reason": "Set start='{start}'"},
+        {"if": ["dest"], "tap": DEST_FIELD, "placeholder": "select destination", "reason": "Set destination='{dest}'"},
+        {"tap": SEARCH_BUTTON, "reason": "Launch search"},
+    ],
+    "picker": [
+        {"tap": [{"city": "want"}], "reason": "Select '{want}' from list"},
+        {"if": ["want"], "type_into": LOCATION_FIELD, "reason": "Type '{want}' in location field"},
+        {"if": ["want"], "tap": LOCATION_FIELD, "reason": "Focus location input"},
+        {"if": ["ime_visible"], "key": 4, "reason": "Close keyboard overlay (BACK)"},
+    ],
+    # results / journey_details / connection_details: no rule on purpose, the
+    # LLM decides whether the goal is reached (a rule here would end runs that
+    # still have to open a connection)
+}
+
+
+def _resid_suffix(rid: str) -> str:
+    i = rid.find(":id/")
+    return rid[i + 4:] if i >= 0 else ""
+
+
+class FeatureIndex:
+    """Per-dump features, shared by phase detection and the action rules.
+
+    Everything is materialized on first use: most dumps are classified from
+    the joined resid/text/desc blobs alone, and only the winning phase's
+    action rules need the tappable/suffix/label indexes.
+    """
 
-def _find_by_label(all_nodes: List[Candidate], needle: str) -> Optional[Candidate]:
-    n = _norm(needle)
-    best = None
-    best_score = -1
-    for c in all_nodes:
-        if not (c.clickable and c.enabled and c.center):
-            continue
-        blob = f"{_norm(c.label)} {_norm(c.text)} {_norm(c.content_desc)} {_norm(c.resource_id)}"
-        if n in blob:
-            score = len(c.label or "") + len(c.text or "") + len(c.content_desc or "")
-            if score > best_score:
-                best_score = score
-                best = c
-    return best
-
-
-def _find_start_field(all_nodes: List[Candidate]) -> Optional[Candidate]:
-    # Prefer resource-id if available, else content-desc
-    for c in all_nodes:
-        if c.resource_id.endswith(":id/input_start") and c.center and c.enabled:
-            return c
-    return _find_by_label(all_nodes, "select start")
-
-
-def _find_dest_field(all_nodes: List[Candidate]) -> Optional[Candidate]:
-    for c in all_nodes:
-        if c.resource_id.endswith(":id/input_target") and c.center and c.enabled:
-            return c
-    return _find_by_label(all_nodes, "select destination")
-
-
-def _find_search_button(all_nodes: List[Candidate]) -> Optional[Candidate]:
-    for c in all_nodes:
-        if c.resource_id.endswith(":id/button_search_default") and c.center and c.enabled:
-            return c
-    for c in all_nodes:
-        if c.resource_id.endswith(":id/button_search") and c.center and c.enabled:
-            return c
-    # fallback by visible label
-    return _find_by_label(all_nodes, "search")
-
-
-def _contains_city(c: Candidate, city: str) -> bool:
-    if not city:
-        return False
-    cl = _norm(city)
-    blob = f"{_norm(c.label)} {_norm(c.text)} {_norm(c.content_desc)}"
-    return cl in blob
+    def __init__(self, all_nodes: List[Candidate], hidden: Optional[set] = None):
+        self.all_nodes = all_nodes
+        self.hidden = hidden or set()
+        self._by_suffix: Optional[Dict[str, List[Candidate]]] = None
+        self._tappables: Optional[List[Candidate]] = None
+        self._blobs: Optional[List[Tuple[Candidate, str, str]]] = None  # lazy (node, blob_with_rid, blob)
+        self._ime_visible: Optional[bool] = None
+        self._joined: Dict[str, str] = {}
+        self._label_cache: Dict[str, Optional[Candidate]] = {}
+
+    def _join(self, attr: str, sep: str) -> str:
+        v = self._joined.get(attr)
+        if v is None:
+            v = sep.join(x for x in (getattr(c, attr) for c in self.all_nodes) if x) + sep
+            self._joined[attr] = v
+        return v
+
+    @property
+    def ids_blob(self) -> str:
+        return self._join("resource_id", "\n")
+
+    @property
+    def texts(self) -> str:
+        return self._join("text", " ")
+
+    @property
+    def descs(self) -> str:
+        return self._join("content_desc", " ")
+
+    def has_suffix(self, suffix: str) -> bool:
+        # whole tree (hidden nodes included), answered on the joined blob
+        return f":id/{suffix}\n" in self.ids_blob
+
+    @property
+    def tappables(self) -> List[Candidate]:
+        if self._tappables is None:
+            hidden = self.hidden
+            self._tappables = [
+                c for c in self.all_nodes
+                if c.clickable and c.enabled and c.center and c.idx not in hidden
+            ]
+        return self._tappables
+
+    @property
+    def by_suffix(self) -> Dict[str, List[Candidate]]:
+        if self._by_suffix is None:
+            self._by_suffix = {}
+            for c in self.all_nodes:
+                if c.resource_id and c.idx not in self.hidden:
+                    suffix = _resid_suffix(c.resource_id)
+                    if suffix:
+                        self._by_suffix.setdefault(suffix, []).append(c)
+        return self._by_suffix
+
+    @property
+    def ime_visible(self) -> bool:
+        if self._ime_visible is None:
+            self._ime_visible = any(is_ime_candidate(c) for c in self.all_nodes)
+        return self._ime_visible
+
+    # ---- finders ----
+
+    def blobs(self) -> List[Tuple[Candidate, str, str]]:
+        # normalized once per dump, only if a label/city finder is actually used
+        if self._blobs is None:
+            self._blobs = []
+            for c in self.tappables:
+                blob = f"{_norm(c.label)} {_norm(c.text)} {_norm(c.content_desc)}"
+                self._blobs.append((c, f"{blob} {_norm(c.resource_id)}", blob))
+        return self._blobs
+
+    def by_label(self, needle: str) -> Optional[Candidate]:
+        n = _norm(needle)
+        if n in self._label_cache:
+            return self._label_cache[n]
+        best, best_score = None, -1
+        for c, blob_rid, _ in self.blobs():
+            if n in blob_rid:
+                score = len(c.label or "") + len(c.text or "") + len(c.content_desc or "")
+                if score > best_score:
+                    best, best_score = c, score
+        self._label_cache[n] = best
+        return best
+
+    def by_city(self, city: str) -> Optional[Candidate]:
+        if not city:
+            return None
+        cl = _norm(city)
+        matching = [c for c, _, blob in self.blobs() if cl in blob and not is_ime_candidate(c)]
+        if not matching:
+            return None
+        matching.sort(key=lambda c: (len(c.label or c.content_desc or c.text), c.idx), reverse=True)
+        return matching[0]
+
+    def find(self, specs: List[Dict], ctx: Dict[str, str]) -> Optional[Candidate]:
+        for spec in specs:
+            if "resid" in spec:
+                hit = next((c for c in self.by_suffix.get(spec["resid"], []) if c.center and c.enabled), None)
+            elif "resid_any" in spec:
+                hit = next((c for c in self.by_suffix.get(spec["resid_any"], []) if c.center), None)
+            elif "label" in spec:
+                hit = self.by_label(spec["label"])
+            elif "city" in spec:
+                hit = self.by_city(ctx.get(spec["city"], ""))
+            else:
+                raise ValueError(f"Unknown finder spec: {spec}")
+            if hit:
+                return hit
+        return None
 
 
-def rule_based_action(all_nodes: List[Candidate], phase: str, plan: Dict) -> Optional[Dict]:
-    start = (plan.get("start") or "").strip()
-    dest = (plan.get("destination") or "").strip()
+def _phase_rule_matches(rule: Dict, f: FeatureIndex) -> bool:
+    if "resid_contains_any" in rule and not any(s in f.ids_blob for s in rule["resid_contains_any"]):
+        return False
+    if "resid_contains_all" in rule and not all(s in f.ids_blob for s in rule["resid_contains_all"]):
+        return False
+    if "resid_suffix_any" in rule and not any(f.has_suffix(s) for s in rule["resid_suffix_any"]):
+        return False
+    if "text_or_desc_contains_any" in rule and not any(
+        s in f.texts or s in f.descs for s in rule["text_or_desc_contains_any"]
+    ):
+        return False
+    if "desc_regex" in rule and not re.search(rule["desc_regex"], f.descs):
+        return False
+    if "desc_contains_any" in rule and not any(s in f.descs for s in rule["desc_contains_any"]):
+        return False
+    return True
 
-    # If date picker popped and plan is "now": escape it.
-    if phase == "datetime_picker" and (plan.get("when") == "now"):
-        return {"action": "key", "keycode": 4, "reason": "Close date/time picker (BACK), plan is depart now"}
-
-    # If drawer open, pick Trip Planner
-    if phase == "drawer":
-        tp = _find_by_label(all_nodes, "trip planner")
-        if tp:
-            return {"action": "tap", "target_idx": tp.idx, "reason": "Open Trip Planner from drawer menu"}
-        return {"action": "key", "keycode": 4, "reason": "Close drawer (BACK) - Trip Planner not found"}
-
-    # On home/unknown, prefer opening drawer then Trip Planner if visible
-    if phase in {"home", "unknown"}:
-        # Burger icon often has content-desc like "Open navigation drawer"
-        burger = _find_by_label(all_nodes, "drawer") or _find_by_label(all_nodes, "navigation") or _find_by_label(all_nodes, "open")
-        if burger:
-            return {"action": "tap", "target_idx": burger.idx, "reason": "Open navigation drawer"}
-        # Or just use start field on Home card if present
-        sf = _find_start_field(all_nodes)
-        if sf and start:
-            return {"action": "tap", "target_idx": sf.idx, "reason": f"Open start field to set '{start}'"}
-        return None
 
-    # Trip Planner form: set start -> set dest -> search
-    if phase == "tripplanner_form":
-        sf = _find_start_field(all_nodes)
-        df = _find_dest_field(all_nodes)
-        sb = _find_search_button(all_nodes)
+def detect_phase(all_nodes: List[Candidate], features: Optional[FeatureIndex] = None) -> str:
+    f = features or FeatureIndex(all_nodes)
+    for rule in PHASE_RULES:
+        if _phase_rule_matches(rule, f):
+            return rule["phase"]
+    return "unknown"
 
-        def looks_placeholder(c: Optional[Candidate], placeholder: str) -> bool:
-            if not c:
-                return True
-            blob = f"{_norm(c.text)} {_norm(c.content_desc)} {_norm(c.label)}"
-            return placeholder in blob
-
-        if sf and start and looks_placeholder(sf, "select start"):
-            return {"action": "tap", "target_idx": sf.idx, "reason": f"Set start='{start}'"}
-        if df and dest and looks_placeholder(df, "select destination"):
-            return {"action": "tap", "target_idx": df.idx, "reason": f"Set destination='{dest}'"}
-        if sb:
-            return {"action": "tap", "target_idx": sb.idx, "reason": "Launch search"}
-        return None
 
-    # Picker: select visible match, else type, else back
+def _rule_context(f: FeatureIndex, phase: str, plan: Dict) -> Dict[str, str]:
+    start = (plan.get("start") or "").strip()
+    dest = (plan.get("destination") or "").strip()
+    ctx = {
+        "start": start,
+        "dest": dest,
+        "when_now": "1" if plan.get("when") == "now" else "",
+        "want": "",
+    }
     if phase == "picker":
+        # Picker header tells whether we're selecting start or destination
         want = start or dest
-
-        # If we can infer whether we're selecting start/destination from header label, do it:
-        header = _find_by_label(all_nodes, "select start") or _find_by_label(all_nodes, "select destination")
+        header = f.by_label("select start") or f.by_label("select destination")
         header_blob = ""
         if header:
             header_blob = f"{_norm(header.text)} {_norm(header.content_desc)} {_norm(header.label)}"
@@ -620,27 +1145,46 @@ def rule_based_action(all_nodes: List[Candidate], phase: str, plan: Dict) -> Opt
             want = start
         elif "destination" in header_blob:
             want = dest
+        ctx["want"] = want
+    return ctx
 
-        # Select visible list entry
-        tappables = [c for c in all_nodes if c.clickable and c.enabled and c.center and not is_ime_candidate(c)]
-        matching = [c for c in tappables if want and _contains_city(c, want)]
-        if matching:
-            matching.sort(key=lambda c: (len(c.label or c.content_desc or c.text), c.idx), reverse=True)
-            best = matching[0]
-            return {"action": "tap", "target_idx": best.idx, "reason": f"Select '{want}' from list"}
-
-        # Focus field and type
-        field = next((c for c in all_nodes if c.resource_id.endswith(":id/input_location_name") and c.center), None)
-        if field and want:
-            if field.focused:
-                return {"action": "type", "text": want, "reason": f"Type '{want}' in location field"}
-            return {"action": "tap", "target_idx": field.idx, "reason": "Focus location input"}
-
-        # If keyboard overlay exists, close it
-        if any(is_ime_candidate(c) for c in all_nodes):
-            return {"action": "key", "keycode": 4, "reason": "Close keyboard overlay (BACK)"}
 
-        return None
+def rule_based_action(
+    all_nodes: List[Candidate], phase: str, plan: Dict, features: Optional[FeatureIndex] = None
+) -> Optional[Dict]:
+    f = features or FeatureIndex(all_nodes)
+    ctx = _rule_context(f, phase, plan)
+
+    def holds(cond: str) -> bool:
+        # ime_visible is evaluated lazily (only the picker rules need it)
+        return f.ime_visible if cond == "ime_visible" else bool(ctx.get(cond))
+
+    for rule in ACTION_RULES.get(phase, []):
+        if not all(holds(cond) for cond in rule.get("if", [])):
+            continue
+        reason = rule.get("reason", "").format(**ctx)
+
+        if "tap" in rule:
+            c = f.find(rule["tap"], ctx)
+            if not c:
+                continue
+            if "placeholder" in rule:
+                blob = f"{_norm(c.text)} {_norm(c.content_desc)} {_norm(c.label)}"
+                if rule["placeholder"] not in blob:
+                    continue
+            return {"action": "tap", "target_idx": c.idx, "reason": reason}
+
+        if "type_into" in rule:
+            c = f.find(rule["type_into"], ctx)
+            if c and c.focused:
+                return {"action": "type", "text": ctx["want"], "reason": reason}
+            continue
+
+        if "key" in rule:
+            return {"action": "key", "keycode": rule["key"], "reason": reason}
+
+        if rule.get("done"):
+            return {"action": "done", "reason": reason}
 
     return None
 
@@ -731,7 +1275,6 @@ def _sanitize_action_obj(obj: Dict) -> Dict:
 
 
 def call_llm(prompt: str, model: str) -> Dict:
-    url = _chat_completions_url()
     api_key = os.getenv("OPENAI_API_KEY", "dummy")
 
     timeout = float(os.getenv("OPENAI_TIMEOUT", "60"))
@@ -760,14 +1303,13 @@ def call_llm(prompt: str, model: str) -> Dict:
         "response_format": {"type": "json_object"},
     }
 
-    with requests.Session() as sess:
-        r = sess.post(
-            url,
-            headers={"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"},
-            json=payload,
-            timeout=timeout,
-        )
+    r = _post_chat(payload, api_key, timeout)
 
+    if "X-Gateway-Queue-Ms" in r.headers:
+        log(
+            f"llm gateway: queue={r.headers['X-Gateway-Queue-Ms']}ms service={r.headers.get('X-Gateway-Service-Ms')}ms"
+            + (" (coalesced)" if r.headers.get("X-Gateway-Coalesced") == "1" else "")
+        )
     if not r.ok:
         raise RuntimeError(f"LLM HTTP {r.status_code}: {r.text[:2000]}")
     data = r.json()
@@ -841,7 +1383,7 @@ def validate_action(action: Dict, size: Dict[str, int], surfaced_by_idx: Dict[in
 
 def main() -> int:
     parser = argparse.ArgumentParser(description="CFL Trip Planner LLM explorer (disciplined)")
-    parser.add_argument("--instruction", required=True, help="Goal in natural language")
+    parser.add_argument("--instruction", default="", help="Goal in natural language")
     parser.add_argument("--xml", default="", help="Path to uiautomator dump XML (required unless --emit_plan)")
     parser.add_argument("--model", default=os.environ.get("LLM_MODEL", "local-model"))
     parser.add_argument("--limit", type=int, default=90, help="How many nodes to surface before compacting")
@@ -850,20 +1392,54 @@ def main() -> int:
     parser.add_argument("--no_llm", action="store_true", help="Disable LLM fallback (rule-based only)")
     parser.add_argument("--emit_plan", action="store_true", help="Output only the extracted trip plan JSON and exit")
     parser.add_argument("--plan_llm", action="store_true", help="Use LLM to extract plan (fallback to heuristic)")
+    parser.add_argument("--plan_key", default="", help="Load a precompiled plan by cache key")
+    parser.add_argument(
+        "--resolve_plan",
+        action="store_true",
+        help="Look up (or build and cache) the plan for --instruction, print its cache key and exit",
+    )
+    parser.add_argument(
+        "--compile_plans",
+        default="",
+        help="Precompile plans for a trips.txt / instruction list file, print JSONL (key, source, plan) and exit",
+    )
+    parser.add_argument("--jobs", type=int, default=int(os.environ.get("LLM_PLAN_JOBS", "4")), help="Parallel LLM plan requests")
+    parser.add_argument(
+        "--tree_cache",
+        default=os.environ.get("LLM_TREE_CACHE", ""),
+        help="Previous-dump cache: reuse candidates of unchanged subtrees (tree delta) instead of a full rebuild",
+    )
     args = parser.parse_args()
 
-    # Build trip plan first
-    plan = build_trip_plan(args.instruction)
-    if args.plan_llm and not args.emit_plan:
-        # (for stepper we still prefer deterministic; plan_llm is mainly for emit_plan usage)
-        pass
+    if args.compile_plans:
+        for item in compile_plans(read_instructions(args.compile_plans), args.model, args.plan_llm, args.jobs):
+            print(json.dumps(item, ensure_ascii=False))
+        return 0
+
+    if "|" in args.instruction:
+        # trips.txt line: same instruction (and plan key) as --compile_plans
+        args.instruction = trip_line_instruction(args.instruction) or args.instruction
+
+    if args.resolve_plan:
+        if not args.instruction:
+            raise SystemExit("Missing --instruction.")
+        _, source = get_plan(args.instruction, args.model, use_llm=args.plan_llm)
+        if os.getenv("LLM_PLAN_CACHE", "1") != "0":
+            print(plan_cache_key(args.instruction, source, args.model))
+        return 0
+
+    # Build trip plan first (cached; for stepper we still prefer deterministic unless precompiled)
+    plan = None
+    if args.plan_key:
+        plan = load_plan_by_key(args.plan_key)
+        if plan is None:
+            warn(f"Plan key not found or stale: {args.plan_key}")
+    if plan is None:
+        if not args.instruction:
+            raise SystemExit("Missing --instruction (or a valid --plan_key).")
+        plan, _ = get_plan(args.instruction, args.model, use_llm=args.plan_llm and args.emit_plan)
 
     if args.emit_plan:
-        if args.plan_llm:
-            try:
-                plan = call_llm_trip_plan(args.instruction, args.model)
-            except Exception as e:
-                warn(f"Plan LLM failed, fallback to heuristic: {e}")
         print(json.dumps(plan, ensure_ascii=False))
         return 0
 
@@ -873,10 +1449,23 @@ def main() -> int:
     hist = load_history(args.history_file, limit=args.history_limit)
     hist_text = history_for_prompt(hist)
 
-    all_nodes, size, dominant_pkg = extract_candidates(args.xml)
-    phase = detect_phase(all_nodes)
+    from dump_archive import is_archive_ref
+
+    if args.tree_cache and not is_archive_ref(args.xml):
+        all_nodes, size, dominant_pkg = extract_candidates_incremental(args.xml, args.tree_cache)
+    else:
+        all_nodes, size, dominant_pkg = extract_candidates(args.xml)
+
+    # Drop clickables hidden under a dialog/drawer/keyboard (center not hit-testable)
+    hidden = occluded_indices(all_nodes)
+    visible_nodes = [c for c in all_nodes if c.idx not in hidden] if hidden else all_nodes
+    if hidden:
+        log(f"occluded clickables dropped: {len(hidden)}")
+
+    features = FeatureIndex(all_nodes, hidden)
+    phase = detect_phase(all_nodes, features)
 
-    surfaced = surface_candidates(all_nodes, dominant_pkg, limit=args.limit)
+    surfaced = surface_candidates(visible_nodes, dominant_pkg, limit=args.limit)
     compact = compact_state(surfaced, phase, plan, size)
     sig = state_signature(compact)
 
@@ -887,7 +1476,7 @@ def main() -> int:
     log(json.dumps(compact, ensure_ascii=False, indent=2))
 
     # Rule-based first (fast, reliable)
-    rb = rule_based_action(all_nodes, phase, plan)
+    rb = rule_based_action(visible_nodes, phase, plan, features)
     if rb:
         raw = rb
     else:
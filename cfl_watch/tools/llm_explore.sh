@@ -8,6 +8,11 @@ SNAP_MODE_SET=0
 if [ "${SNAP_MODE+set}" = "set" ]; then
   SNAP_MODE_SET=1
 fi
+# no explicit SNAP_MODE: ring of the last dumps, written to the run dir only
+# on failure / timeout / loop breaker (lib/flight_recorder.sh)
+if [ "$SNAP_MODE_SET" -eq 0 ]; then
+  FLIGHT_RECORDER="${FLIGHT_RECORDER:-1}"
+fi
 
 CFL_CODE_DIR="${CFL_CODE_DIR:-$(cd "$SCRIPT_DIR/.." && pwd)}"
 CFL_CODE_DIR="$(expand_tilde_path "$CFL_CODE_DIR")"
@@ -26,6 +31,7 @@ CFL_BASE_DIR="${CFL_BASE_DIR:-$CFL_CODE_DIR}"
 . "$CFL_CODE_DIR/lib/snap.sh"
 
 if [ "$SNAP_MODE_SET" -eq 0 ]; then
+  # png + xml per step; with the flight recorder on they only reach the ring
   SNAP_MODE=3
 fi
 
@@ -41,17 +47,46 @@ ensure_dirs
 run_name="llm_explore_$(safe_name "$instruction")"
 snap_init "$run_name"
 
+# Per-step candidates are updated from the previous dump (tree delta); one cache
+# per run so parallel sessions never read each other's (removed in finish)
+export LLM_TREE_CACHE="$CFL_TMP_DIR/llm_explore_tree.$$.bin"
+rm -f "$LLM_TREE_CACHE"
+# 1 = route LLM calls through the shared local gateway (coalescing, micro-batching,
+# concurrency limit), started on first use and exiting once idle
+if [ "${LLM_GATEWAY:-0}" = "1" ] && [ -z "${LLM_GATEWAY_URL:-}" ]; then
+  if LLM_GATEWAY_URL="$(python "$CFL_CODE_DIR/tools/llm_gateway.py" ensure --log "$CFL_LOG_DIR/llm_gateway.log")"; then
+    export LLM_GATEWAY_URL
+    log "LLM gateway: $LLM_GATEWAY_URL"
+  else
+    warn "LLM gateway unavailable, calling OPENAI_BASE_URL directly"
+    unset LLM_GATEWAY_URL
+  fi
+fi
+# 1 = successful runs keep xml/frames.jsonl (keyframe + deltas) instead of one XML per step.
+# Only runs that write per-step XML to the run dir: FLIGHT_RECORDER=0 or an explicit
+# SNAP_MODE. The default (flight recorder) leaves nothing to pack on success.
+CFL_XML_DELTA="${CFL_XML_DELTA:-1}"
+
 finish(){
   local rc=$?
   trap - EXIT
-  if [ "$rc" -ne 0 ]; then
-    warn "llm_explore FAILED (rc=$rc) -> viewer"
+  rm -f "$LLM_TREE_CACHE"
+  if flight_finish "$rc" || [ "$rc" -ne 0 ]; then
+    if [ "$rc" -ne 0 ]; then
+      warn "llm_explore FAILED (rc=$rc) -> viewer"
+    else
+      # rc=0 with a flight mark: not a failure, say why the snapshots were kept
+      log "llm_explore ended rc=0, flight mark ($(sed -n 's/^reason=//p' "$SNAP_DIR/flight.txt" 2>/dev/null)) -> viewer"
+    fi
     "$CFL_CODE_DIR/lib/viewer.sh" "$SNAP_DIR" >/dev/null 2>&1 || true
     log "Viewer: $SNAP_DIR/viewers/index.html"
+  elif [ "$CFL_XML_DELTA" = "1" ] && ! flight_enabled; then
+    python "$CFL_CODE_DIR/tools/tree_diff.py" pack "$SNAP_DIR" --prune || warn "tree_diff pack failed (xml kept)"
   fi
   exit "$rc"
 }
 trap finish EXIT
+flight_trap_signals
 
 log "Instruction: $instruction"
 log "CFL_TMP_DIR=$CFL_TMP_DIR"
@@ -63,9 +98,23 @@ kill_switch="/sdcard/cfl_watch/STOP"
 maybe cfl_launch
 sleep_s 1.0
 
+# Resolve the plan once (precompiled by --compile_plans, else built and cached),
+# then every step loads it by key. LLM_PLAN_KEY = key printed by --compile_plans.
+plan_key="${LLM_PLAN_KEY:-}"
+if [ -z "$plan_key" ]; then
+  plan_key="$(python "$CFL_CODE_DIR/tools/llm_explore.py" --instruction "$instruction" --resolve_plan)" || plan_key=""
+fi
+plan_args=()
+if [ -n "$plan_key" ]; then
+  plan_args=(--plan_key "$plan_key")
+  log "Plan key: $plan_key"
+fi
+
+stopped=0
 for step in $(seq 1 30); do
   if inject test -f "$kill_switch" >/dev/null 2>&1; then
     warn "Kill switch detected ($kill_switch), stopping loop."
+    stopped=1
     break
   fi
 
@@ -76,15 +125,19 @@ for step in $(seq 1 30); do
 
   if ! inject test -s "$dump_path" >/dev/null 2>&1; then
     warn "UI dump missing/empty, aborting."
+    flight_mark "dump_failed"
+    stopped=1
     break
   fi
 
-  snap "$(printf '%02d' "$step")" "$SNAP_MODE"
+  # archive the exact dump the explorer parses (no second uiautomator dump)
+  snap_from_dump "$(printf '%02d' "$step")" "$dump_path" "$SNAP_MODE"
 
   log "Calling LLM explorer (step $step)"
   action_json="$(
     python "$CFL_CODE_DIR/tools/llm_explore.py" \
       --instruction "$instruction" \
+      "${plan_args[@]}" \
       --xml "$dump_path"
   )"
 
@@ -99,13 +152,15 @@ def val(k):
     v = d.get(k, "")
     return "" if v is None else str(v)
 
-print("|".join([d.get("action",""), val("x"), val("y"), val("text"), val("keycode")]))
+loop = "1" if val("reason").startswith("Loop breaker") else "0"
+print("|".join([d.get("action",""), val("x"), val("y"), val("text"), val("keycode"), loop]))
 PY
 )"
 
 
 
-  IFS="|" read -r act x y text keycode <<<"$action"
+  IFS="|" read -r act x y text keycode loop <<<"$action"
+  [ "$loop" = "1" ] && flight_mark "loop_breaker"
 
   case "$act" in
     tap)
@@ -122,10 +177,13 @@ PY
       ;;
     done)
       log "LLM -> done, stopping loop."
+      stopped=1
       break
       ;;
     *)
       warn "Unknown action: $act"
+      flight_mark "unknown_action"
+      stopped=1
       break
       ;;
   esac
@@ -133,4 +191,6 @@ PY
   sleep_s 0.5
 done
 
+[ "$stopped" -eq 1 ] || flight_mark "step_limit"
+
 log "llm_explore finished."
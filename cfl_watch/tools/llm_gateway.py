@@ -0,0 +1,698 @@
+#!/usr/bin/env python3
+"""
+Local gateway in front of the model server (OPENAI_BASE_URL), shared by
+concurrent llm_explore sessions (several emulators / instructions).
+
+POST /v1/chat/completions:
+- coalescing: identical in-flight requests (same body + key, temperature 0)
+  share one upstream call
+- micro-batching: requests arriving within --batch-ms (up to --batch-max) are
+  released to the upstream together, so its batch scheduler sees them in the
+  same step instead of one by one
+- concurrency limit: at most --concurrency upstream calls in flight, the rest
+  wait in the gateway queue
+- metrics: GET /metrics (queue wait / service time percentiles, batch sizes,
+  coalesced count); each response carries X-Gateway-Queue-Ms,
+  X-Gateway-Service-Ms and X-Gateway-Coalesced
+Other paths are forwarded as-is. GET /health answers locally.
+
+Usage:
+  python tools/llm_gateway.py serve [--listen 127.0.0.1:8002] [--upstream URL]
+  python tools/llm_gateway.py ensure     # start in background unless already up (same upstream), print URL
+  python tools/llm_gateway.py metrics
+  python tools/llm_gateway.py fake --listen 127.0.0.1:8001 --step-ms 300 --slots 4
+  python tools/llm_gateway.py bench --url http://127.0.0.1:8002 --clients 6 --requests 4 --distinct 3
+
+llm_explore.py talks to LLM_GATEWAY_URL when set (llm_explore.sh sets it with LLM_GATEWAY=1).
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict, List, Optional, Tuple
+
+import requests
+
+DEFAULT_LISTEN = "127.0.0.1:8002"
+CHAT_PATH = "/v1/chat/completions"
+
+
+# ---------------- logging ----------------
+
+
+def log(msg: str) -> None:
+    print(f"[*] {msg}", file=sys.stderr)
+
+
+def warn(msg: str) -> None:
+    print(f"[!] {msg}", file=sys.stderr)
+
+
+# ---------------- helpers ----------------
+
+
+def _norm_base(url: str) -> str:
+    url = (url or "").rstrip("/")
+    if url.endswith("/v1"):
+        url = url[:-3]
+    return url
+
+
+def _split_listen(listen: str) -> Tuple[str, int]:
+    host, _, port = listen.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def _pct(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, int(q * len(s)))]
+
+
+def _dist(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"n": 0, "avg": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    return {
+        "n": len(values),
+        "avg": round(sum(values) / len(values), 1),
+        "p50": round(_pct(values, 0.50), 1),
+        "p95": round(_pct(values, 0.95), 1),
+        "max": round(max(values), 1),
+    }
+
+
+def _json_bytes(obj: Dict) -> bytes:
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+# ---------------- metrics ----------------
+
+
+class Metrics:
+    """Counters + the last `window` samples of queue wait / service time (ms)."""
+
+    def __init__(self, window: int = 2048) -> None:
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+        self.batches = 0
+        self.queue_ms: Deque[float] = deque(maxlen=window)
+        self.service_ms: Deque[float] = deque(maxlen=window)
+        self.batch_sizes: Deque[int] = deque(maxlen=window)
+
+    def request(self, coalesced: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            if coalesced:
+                self.coalesced += 1
+
+    def batch(self, size: int) -> None:
+        with self._lock:
+            self.batches += 1
+            self.batch_sizes.append(size)
+
+    def call(self, queue_ms: float, service_ms: float, ok: bool) -> None:
+        with self._lock:
+            self.upstream_calls += 1
+            if not ok:
+                self.upstream_errors += 1
+            self.queue_ms.append(queue_ms)
+            self.service_ms.append(service_ms)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            sizes = list(self.batch_sizes)
+            return {
+                "uptime_s": round(time.time() - self.started, 1),
+                "requests": self.requests,
+                "coalesced": self.coalesced,
+                "upstream_calls": self.upstream_calls,
+                "upstream_errors": self.upstream_errors,
+                "batches": self.batches,
+                "batch_size_avg": round(sum(sizes) / len(sizes), 2) if sizes else 0.0,
+                "batch_size_max": max(sizes) if sizes else 0,
+                "queue_ms": _dist(list(self.queue_ms)),
+                "service_ms": _dist(list(self.service_ms)),
+            }
+
+
+# ---------------- gateway ----------------
+
+
+class Flight:
+    """One upstream call, shared by every coalesced waiter."""
+
+    __slots__ = ("key", "body", "headers", "t_enq", "done", "status", "resp", "ctype", "queue_ms", "service_ms")
+
+    def __init__(self, key: str, body: bytes, headers: Dict[str, str]) -> None:
+        self.key = key
+        self.body = body
+        self.headers = headers
+        self.t_enq = time.monotonic()
+        self.done = threading.Event()
+        self.status = 502
+        self.resp = b""
+        self.ctype = "application/json"
+        self.queue_ms = 0.0
+        self.service_ms = 0.0
+
+
+class Gateway:
+    def __init__(
+        self,
+        upstream: str,
+        concurrency: int = 2,
+        batch_ms: float = 10.0,
+        batch_max: int = 8,
+        timeout: float = 120.0,
+        coalesce: str = "deterministic",
+    ) -> None:
+        self.upstream = _norm_base(upstream)
+        self.batch_s = max(0.0, batch_ms) / 1000.0
+        self.batch_max = max(1, batch_max)
+        self.timeout = timeout
+        self.coalesce = coalesce
+        self.metrics = Metrics()
+
+        self._cond = threading.Condition()
+        self._pending: List[Flight] = []
+        self._inflight: Dict[str, Flight] = {}
+        self._active = 0
+        self._last_activity = time.monotonic()
+        self._stop = False
+        # pool size = concurrency limit; queued work waits in the pool queue
+        self._pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="upstream")
+        self._local = threading.local()
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="dispatch", daemon=True)
+        self._dispatcher.start()
+
+    # ---- public ----
+
+    def submit(self, body: bytes, headers: Dict[str, str]) -> Tuple[Flight, bool]:
+        key = ""
+        if self._coalescable(body):
+            key = hashlib.sha256(headers.get("Authorization", "").encode() + b"\0" + self._canonical(body)).hexdigest()
+        with self._cond:
+            self._last_activity = time.monotonic()
+            if key and key in self._inflight:
+                flight = self._inflight[key]
+                self.metrics.request(coalesced=True)
+                return flight, True
+            flight = Flight(key, body, headers)
+            if key:
+                self._inflight[key] = flight
+            self._active += 1
+            self._pending.append(flight)
+            self._cond.notify()
+        self.metrics.request(coalesced=False)
+        return flight, False
+
+    def idle_for(self) -> float:
+        with self._cond:
+            if self._active:
+                return 0.0
+            return time.monotonic() - self._last_activity
+
+    def status(self) -> Dict:
+        snap = self.metrics.snapshot()
+        with self._cond:
+            snap["queued"] = len(self._pending)
+            snap["in_flight"] = self._active
+        snap["upstream"] = self.upstream
+        return snap
+
+    def close(self) -> None:
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._pool.shutdown(wait=False)
+
+    # ---- internals ----
+
+    @staticmethod
+    def _canonical(body: bytes) -> bytes:
+        try:
+            return json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode("utf-8")
+        except ValueError:
+            return body
+
+    def _coalescable(self, body: bytes) -> bool:
+        if self.coalesce == "off":
+            return False
+        if self.coalesce == "all":
+            return True
+        # sampled requests (temperature > 0) are expected to differ: only share greedy ones
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return False
+        if not isinstance(payload, dict) or payload.get("stream"):
+            return False
+        try:
+            return float(payload.get("temperature", 1.0)) == 0.0
+        except (TypeError, ValueError):
+            return False
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._stop:
+                    self._cond.wait(0.5)
+                if self._stop:
+                    return
+                # window opens at the first arrival
+                deadline = self._pending[0].t_enq + self.batch_s
+                while len(self._pending) < self.batch_max and not self._stop:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                batch = self._pending[: self.batch_max]
+                del self._pending[: self.batch_max]
+            self.metrics.batch(len(batch))
+            for flight in batch:
+                self._pool.submit(self._run, flight)
+
+    def _session(self) -> requests.Session:
+        sess = getattr(self._local, "sess", None)
+        if sess is None:
+            # one keep-alive connection per upstream worker
+            sess = self._local.sess = requests.Session()
+        return sess
+
+    def _run(self, flight: Flight) -> None:
+        t0 = time.monotonic()
+        flight.queue_ms = (t0 - flight.t_enq) * 1000.0
+        ok = False
+        try:
+            r = self._session().post(
+                self.upstream + CHAT_PATH, data=flight.body, headers=flight.headers, timeout=self.timeout
+            )
+            flight.status = r.status_code
+            flight.resp = r.content
+            flight.ctype = r.headers.get("Content-Type", "application/json")
+            ok = r.ok
+        except requests.RequestException as e:
+            flight.status = 502
+            flight.resp = _json_bytes({"error": {"message": f"gateway: upstream error: {e}", "type": "upstream"}})
+        flight.service_ms = (time.monotonic() - t0) * 1000.0
+        self.metrics.call(flight.queue_ms, flight.service_ms, ok)
+        with self._cond:
+            if flight.key and self._inflight.get(flight.key) is flight:
+                del self._inflight[flight.key]
+            self._active -= 1
+            self._last_activity = time.monotonic()
+        flight.done.set()
+
+
+# ---------------- HTTP front ----------------
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "cfl-llm-gateway"
+    gateway: Gateway = None  # type: ignore[assignment]
+    verbose = False
+
+    def log_message(self, fmt: str, *args) -> None:  # noqa: D401 - http.server hook
+        if self.verbose:
+            log("gateway: " + fmt % args)
+
+    def _reply(self, status: int, body: bytes, ctype: str = "application/json", extra: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (extra or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        n = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(n) if n > 0 else b""
+
+    def _fwd_headers(self) -> Dict[str, str]:
+        h = {"Content-Type": self.headers.get("Content-Type", "application/json")}
+        if self.headers.get("Authorization"):
+            h["Authorization"] = self.headers["Authorization"]
+        return h
+
+    def _passthrough(self, method: str, body: bytes = b"") -> None:
+        gw = self.gateway
+        try:
+            r = requests.request(method, gw.upstream + self.path, data=body or None,
+                                 headers=self._fwd_headers(), timeout=gw.timeout)
+            self._reply(r.status_code, r.content, r.headers.get("Content-Type", "application/json"))
+        except requests.RequestException as e:
+            self._reply(502, _json_bytes({"error": {"message": f"gateway: upstream error: {e}"}}))
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self._reply(200, _json_bytes({"ok": True, "upstream": self.gateway.upstream}))
+        elif self.path == "/metrics":
+            self._reply(200, _json_bytes(self.gateway.status()))
+        else:
+            self._passthrough("GET")
+
+    def do_POST(self) -> None:
+        body = self._read_body()
+        if self.path.rstrip("/") != CHAT_PATH:
+            self._passthrough("POST", body)
+            return
+        gw = self.gateway
+        flight, joined = gw.submit(body, self._fwd_headers())
+        if not flight.done.wait(gw.timeout + 30):
+            self._reply(504, _json_bytes({"error": {"message": "gateway: timed out waiting for upstream"}}))
+            return
+        self._reply(flight.status, flight.resp, flight.ctype, {
+            "X-Gateway-Queue-Ms": f"{flight.queue_ms:.1f}",
+            "X-Gateway-Service-Ms": f"{flight.service_ms:.1f}",
+            "X-Gateway-Coalesced": "1" if joined else "0",
+        })
+
+
+def serve(args: argparse.Namespace) -> int:
+    gw = Gateway(
+        args.upstream,
+        concurrency=args.concurrency,
+        batch_ms=args.batch_ms,
+        batch_max=args.batch_max,
+        timeout=args.timeout,
+        coalesce=args.coalesce,
+    )
+    handler = type("Handler", (GatewayHandler,), {"gateway": gw, "verbose": args.verbose})
+    host, port = _split_listen(args.listen)
+    httpd = ThreadingHTTPServer((host, port), handler)
+    httpd.daemon_threads = True
+
+    if args.idle_exit > 0:
+        # shared by several sessions: whoever started it does not own its lifetime
+        def _idle_watch() -> None:
+            while True:
+                time.sleep(min(5.0, args.idle_exit))
+                if gw.idle_for() >= args.idle_exit:
+                    log(f"gateway: idle for {args.idle_exit:.0f}s, exiting")
+                    httpd.shutdown()
+                    return
+
+        threading.Thread(target=_idle_watch, name="idle", daemon=True).start()
+
+    log(f"gateway: http://{host}:{port} -> {gw.upstream} (concurrency={args.concurrency} "
+        f"batch={args.batch_ms:g}ms/{args.batch_max} coalesce={args.coalesce})")
+    try:
+        httpd.serve_forever(poll_interval=0.2)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        gw.close()
+        log("gateway: " + json.dumps(gw.status(), ensure_ascii=False))
+    return 0
+
+
+# ---------------- CLI helpers ----------------
+
+
+def _health(url: str) -> Optional[Dict]:
+    """/health payload of a running gateway, None if nothing healthy answers."""
+    try:
+        r = requests.get(url + "/health", timeout=1.0)
+        return r.json() if r.ok else None
+    except (requests.RequestException, ValueError):
+        return None
+
+
+def cmd_serve(args: argparse.Namespace) -> int:
+    return serve(args)
+
+
+def cmd_ensure(args: argparse.Namespace) -> int:
+    url = "http://" + args.listen
+    want = _norm_base(args.upstream)
+    health = _health(url)
+    if health is not None and health.get("upstream") != want:
+        # never hand out a gateway that forwards to another model server
+        warn(f"gateway on {args.listen} forwards to {health.get('upstream')}, not {want}; "
+             f"use another --listen / LLM_GATEWAY_LISTEN")
+        return 1
+    if health is None:
+        cmd = [sys.executable, os.path.abspath(__file__), "serve", "--listen", args.listen,
+               "--upstream", args.upstream, "--concurrency", str(args.concurrency),
+               "--batch-ms", str(args.batch_ms), "--batch-max", str(args.batch_max),
+               "--timeout", str(args.timeout), "--coalesce", args.coalesce,
+               "--idle-exit", str(args.idle_exit)]
+        out = open(args.log, "ab") if args.log else subprocess.DEVNULL
+        subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=out, stderr=out, start_new_session=True)
+        t_end = time.monotonic() + 5.0
+        while _health(url) is None:
+            if time.monotonic() > t_end:
+                warn(f"gateway did not come up on {args.listen}")
+                return 1
+            time.sleep(0.1)
+        log(f"gateway started on {url}")
+    print(url)
+    return 0
+
+
+def cmd_metrics(args: argparse.Namespace) -> int:
+    try:
+        r = requests.get("http://" + args.listen + "/metrics", timeout=2.0)
+    except requests.RequestException as e:
+        warn(f"gateway not reachable: {e}")
+        return 1
+    print(json.dumps(r.json(), indent=2, ensure_ascii=False))
+    return 0
+
+
+# ---------------- fake model server ----------------
+
+
+class FakeModel:
+    """
+    Static-batching model server: a step serves up to `slots` waiting requests
+    in `step_ms`; requests arriving mid-step wait for the next one.
+    """
+
+    def __init__(self, step_ms: float, slots: int) -> None:
+        self.step_s = step_ms / 1000.0
+        self.slots = max(1, slots)
+        self._cond = threading.Condition()
+        self._waiting: List[threading.Event] = []
+        self.requests = 0
+        self.steps = 0
+        threading.Thread(target=self._loop, name="fake-steps", daemon=True).start()
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._waiting:
+                    self._cond.wait()
+                batch = self._waiting[: self.slots]
+                del self._waiting[: self.slots]
+                self.steps += 1
+            time.sleep(self.step_s)
+            for ev in batch:
+                ev.set()
+
+    def complete(self) -> None:
+        ev = threading.Event()
+        with self._cond:
+            self.requests += 1
+            self._waiting.append(ev)
+            self._cond.notify()
+        ev.wait()
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    model: FakeModel = None  # type: ignore[assignment]
+
+    def log_message(self, fmt: str, *args) -> None:
+        pass
+
+    def _reply(self, status: int, obj: Dict) -> None:
+        body = _json_bytes(obj)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path == "/stats":
+            self._reply(200, {"requests": self.model.requests, "steps": self.model.steps})
+        elif self.path in ("/v1/models", "/health"):
+            self._reply(200, {"object": "list", "data": [{"id": "fake"}]})
+        else:
+            self._reply(404, {"error": {"message": "not found"}})
+
+    def do_POST(self) -> None:
+        n = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(n) if n > 0 else b""
+        try:
+            payload = json.loads(raw)
+            prompt = json.dumps(payload.get("messages", []), sort_keys=True)
+        except ValueError:
+            self._reply(400, {"error": {"message": "invalid JSON"}})
+            return
+        self.model.complete()
+        tag = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+        content = json.dumps({"action": "done", "reason": f"fake model {tag}"})
+        self._reply(200, {
+            "id": f"fake-{tag}",
+            "object": "chat.completion",
+            "model": payload.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        })
+
+
+def cmd_fake(args: argparse.Namespace) -> int:
+    handler = type("Handler", (FakeHandler,), {"model": FakeModel(args.step_ms, args.slots)})
+    host, port = _split_listen(args.listen)
+    httpd = ThreadingHTTPServer((host, port), handler)
+    httpd.daemon_threads = True
+    log(f"fake model server: http://{host}:{port} (step={args.step_ms:g}ms slots={args.slots})")
+    try:
+        httpd.serve_forever(poll_interval=0.2)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+    return 0
+
+
+# ---------------- bench ----------------
+
+
+def cmd_bench(args: argparse.Namespace) -> int:
+    """`clients` sessions x `requests` calls, prompts drawn from `distinct` variants."""
+    url = _norm_base(args.url) + CHAT_PATH
+    lat: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.clients)
+
+    def client(cid: int) -> None:
+        nonlocal errors
+        with requests.Session() as sess:
+            for i in range(args.requests):
+                if i == 0:
+                    barrier.wait()
+                payload = {
+                    "model": "bench",
+                    "messages": [{"role": "user", "content": f"step {i} variant {(cid + i) % args.distinct}"}],
+                    "temperature": 0,
+                    "max_tokens": 16,
+                    "stream": False,
+                }
+                t0 = time.monotonic()
+                try:
+                    ok = sess.post(url, json=payload, timeout=120).ok
+                except requests.RequestException:
+                    ok = False
+                with lock:
+                    lat.append((time.monotonic() - t0) * 1000.0)
+                    errors += 0 if ok else 1
+
+    t0 = time.monotonic()
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.monotonic() - t0
+
+    out: Dict = {
+        "url": args.url,
+        "clients": args.clients,
+        "requests": len(lat),
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "req_per_s": round(len(lat) / wall, 2) if wall > 0 else 0.0,
+        "latency_ms": _dist(lat),
+    }
+    for name, path in (("gateway", "/metrics"), ("upstream", "/stats")):
+        base = args.url if name == "gateway" else args.upstream
+        if not base:
+            continue
+        try:
+            r = requests.get(_norm_base(base) + path, timeout=2.0)
+            if r.ok:
+                out[name] = r.json()
+        except requests.RequestException:
+            pass
+    print(json.dumps(out, indent=2, ensure_ascii=False))
+    return 0 if errors == 0 else 1
+
+
+# ---------------- CLI ----------------
+
+
+def _gateway_args(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--listen", default=os.environ.get("LLM_GATEWAY_LISTEN", DEFAULT_LISTEN))
+    p.add_argument("--upstream", default=os.environ.get("OPENAI_BASE_URL", "http://127.0.0.1:8001"))
+    p.add_argument("--concurrency", type=int, default=int(os.environ.get("LLM_GATEWAY_CONCURRENCY", "2")),
+                   help="Max upstream calls in flight")
+    p.add_argument("--batch-ms", type=float, default=float(os.environ.get("LLM_GATEWAY_BATCH_MS", "10")),
+                   help="Micro-batch window opened by the first queued request")
+    p.add_argument("--batch-max", type=int, default=int(os.environ.get("LLM_GATEWAY_BATCH_MAX", "8")))
+    p.add_argument("--timeout", type=float, default=float(os.environ.get("OPENAI_TIMEOUT", "60")))
+    p.add_argument("--coalesce", choices=("deterministic", "all", "off"),
+                   default=os.environ.get("LLM_GATEWAY_COALESCE", "deterministic"),
+                   help="deterministic = only temperature 0 requests")
+    p.add_argument("--idle-exit", type=float, default=float(os.environ.get("LLM_GATEWAY_IDLE_EXIT", "0")),
+                   help="Exit after S seconds without requests (0 = never)")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Coalescing / micro-batching gateway for the local LLM server")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("serve", help="Run the gateway in the foreground")
+    _gateway_args(p)
+    p.add_argument("--verbose", action="store_true")
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser("ensure", help="Start the gateway in background unless already up (fails if it forwards elsewhere); print its URL")
+    _gateway_args(p)
+    p.add_argument("--log", default=None, help="Gateway stdout/stderr (default: discarded)")
+    p.set_defaults(func=cmd_ensure, idle_exit=float(os.environ.get("LLM_GATEWAY_IDLE_EXIT", "600")))
+
+    p = sub.add_parser("metrics", help="Print gateway metrics (JSON)")
+    p.add_argument("--listen", default=os.environ.get("LLM_GATEWAY_LISTEN", DEFAULT_LISTEN))
+    p.set_defaults(func=cmd_metrics)
+
+    p = sub.add_parser("fake", help="Fake OpenAI-compatible model server (static batching)")
+    p.add_argument("--listen", default="127.0.0.1:8001")
+    p.add_argument("--step-ms", type=float, default=300.0, help="Time per batch step")
+    p.add_argument("--slots", type=int, default=4, help="Requests served per step")
+    p.set_defaults(func=cmd_fake)
+
+    p = sub.add_parser("bench", help="Concurrent sessions against a gateway or a model server")
+    p.add_argument("--url", default="http://" + DEFAULT_LISTEN)
+    p.add_argument("--upstream", default=None, help="Fake server URL, to include its /stats")
+    p.add_argument("--clients", type=int, default=6)
+    p.add_argument("--requests", type=int, default=4, help="Requests per client")
+    p.add_argument("--distinct", type=int, default=3, help="Prompt variants per step")
+    p.set_defaults(func=cmd_bench)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
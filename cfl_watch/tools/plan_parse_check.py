@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Parse check for the heuristic trip-plan parser (parse_targets_from_instruction).
+
+Heuristic plans are cached on disk (plan cache, PLAN_PARSER_VERSION): run this
+after touching the parser, and bump PLAN_PARSER_VERSION if any output changed.
+
+Usage:
+  python tools/plan_parse_check.py
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from llm_explore import build_trip_plan, parse_targets_from_instruction, trip_line_instruction  # noqa: E402
+
+# instruction -> (start, destination, via)
+CASES: List[Tuple[str, Tuple[str, str, str]]] = [
+    ("Luxembourg -> Arlon", ("Luxembourg", "Arlon", "")),
+    ("Luxembourg → Esch-sur-Alzette", ("Luxembourg", "Esch-sur-Alzette", "")),
+    ("Luxembourg -> Esch via Bettembourg", ("Luxembourg", "Esch", "Bettembourg")),
+    ("Luxembourg -> Esch via Bettembourg, train only", ("Luxembourg", "Esch", "Bettembourg")),
+    ("Luxembourg -> Arlon sans via, train only", ("Luxembourg", "Arlon", "")),
+    ("Luxembourg -> Arlon without via Mersch", ("Luxembourg", "Arlon", "")),
+    ("Go from Luxembourg to Arlon via Mersch tomorrow", ("Luxembourg", "Arlon", "Mersch")),
+    ("Luxembourg -> Arlon at 8:15", ("Luxembourg", "Arlon", "")),
+    ("de Luxembourg à Esch-sur-Alzette demain à 8h", ("Luxembourg", "Esch-sur-Alzette", "")),
+    ("Luxembourg à Arlon", ("Luxembourg", "Arlon", "")),
+    ("Ettelbruck to Stolzembourg", ("Ettelbruck", "Stolzembourg", "")),
+    ("Luxembourg -> Villers-le-Bouillet", ("Luxembourg", "Villers-le-Bouillet", "")),
+    (trip_line_instruction("Luxembourg|Dudelange-Usines|Bettembourg|3"), ("Luxembourg", "Dudelange-Usines", "Bettembourg")),
+]
+
+# instruction -> no_via constraint
+NO_VIA_CASES: List[Tuple[str, bool]] = [
+    ("Luxembourg -> Arlon sans via, train only", True),
+    ("Luxembourg -> Esch via Bettembourg", False),
+]
+
+
+def main() -> int:
+    bad = 0
+    for instruction, want in CASES:
+        t = parse_targets_from_instruction(instruction)
+        got = (t["start"], t["destination"], t["via"])
+        if got != want:
+            bad += 1
+            print(f"[!] {instruction!r}: got {got}, want {want}")
+    for instruction, want in NO_VIA_CASES:
+        got = build_trip_plan(instruction)["no_via"]
+        if got != want:
+            bad += 1
+            print(f"[!] {instruction!r}: no_via={got}, want {want}")
+    n = len(CASES) + len(NO_VIA_CASES)
+    print(f"[*] plan parse: {n - bad}/{n} ok")
+    return 0 if bad == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Benchmark + parity check: declarative rule engine vs the previous imperative
+detect_phase / rule_based_action (frozen copy below) on a replay corpus of
+uiautomator dumps (e.g. /sdcard/cfl_watch/runs/*/xml).
+
+Usage:
+  python tools/rules_bench.py --instruction "Luxembourg -> Arlon" /sdcard/cfl_watch/runs [--repeat 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from llm_explore import (  # noqa: E402
+    FeatureIndex,
+    PHASE_RULES,
+    Candidate,
+    _norm,
+    build_trip_plan,
+    detect_phase,
+    extract_candidates,
+    is_ime_candidate,
+    rule_based_action,
+)
+
+import re  # noqa: E402
+
+# Phases the legacy code did not know about (differences there are expected)
+NEW_PHASES = {r["phase"] for r in PHASE_RULES} - {
+    "drawer", "picker", "tripplanner_form", "home", "datetime_picker",
+}
+
+
+# ---------------- legacy (frozen) ----------------
+
+
+def legacy_detect_phase(all_nodes: List[Candidate]) -> str:
+    ids = [c.resource_id for c in all_nodes if c.resource_id]
+    texts = " ".join([c.text for c in all_nodes if c.text])
+    descs = " ".join([c.content_desc for c in all_nodes if c.content_desc])
+
+    # Drawer/menu open
+    if any("drawer_list" in rid for rid in ids) or any("drawer_layout" in rid for rid in ids):
+        return "drawer"
+
+    # Location picker
+    if any(rid.endswith(":id/input_location_name") for rid in ids):
+        return "picker"
+
+    # Trip planner form (Trip Planner screen)
+    if any(rid.endswith(":id/button_search_default") or rid.endswith(":id/button_search") for rid in ids):
+        return "tripplanner_form"
+
+    # Home has input_start/input_target too in your dumps
+    if any("id/input_start" in rid for rid in ids) and any("id/input_target" in rid for rid in ids):
+        # If the big SEARCH button is visible, treat as tripplanner_form anyway
+        if "SEARCH" in texts or "SEARCH" in descs:
+            return "tripplanner_form"
+        return "home"
+
+    # Date picker-ish (your log showed day cells like "03 January 2026")
+    if re.search(r"\b\d{2}\s+\w+\s+\d{4}\b", descs) and ("January" in descs or "janvier" in descs):
+        return "datetime_picker"
+
+    return "unknown"
+
+
+def _find_by_label(all_nodes: List[Candidate], needle: str) -> Optional[Candidate]:
+    n = _norm(needle)
+    best = None
+    best_score = -1
+    for c in all_nodes:
+        if not (c.clickable and c.enabled and c.center):
+            continue
+        blob = f"{_norm(c.label)} {_norm(c.text)} {_norm(c.content_desc)} {_norm(c.resource_id)}"
+        if n in blob:
+            score = len(c.label or "") + len(c.text or "") + len(c.content_desc or "")
+            if score > best_score:
+                best_score = score
+                best = c
+    return best
+
+
+def _find_start_field(all_nodes: List[Candidate]) -> Optional[Candidate]:
+    # Prefer resource-id if available, else content-desc
+    for c in all_nodes:
+        if c.resource_id.endswith(":id/input_start") and c.center and c.enabled:
+            return c
+    return _find_by_label(all_nodes, "select start")
+
+
+def _find_dest_field(all_nodes: List[Candidate]) -> Optional[Candidate]:
+    for c in all_nodes:
+        if c.resource_id.endswith(":id/input_target") and c.center and c.enabled:
+            return c
+    return _find_by_label(all_nodes, "select destination")
+
+
+def _find_search_button(all_nodes: List[Candidate]) -> Optional[Candidate]:
+    for c in all_nodes:
+        if c.resource_id.endswith(":id/button_search_default") and c.center and c.enabled:
+            return c
+    for c in all_nodes:
+        if c.resource_id.endswith(":id/button_search") and c.center and c.enabled:
+            return c
+    # fallback by visible label
+    return _find_by_label(all_nodes, "search")
+
+
+def _contains_city(c: Candidate, city: str) -> bool:
+    if not city:
+        return False
+    cl = _norm(city)
+    blob = f"{_norm(c.label)} {_norm(c.text)} {_norm(c.content_desc)}"
+    return cl in blob
+
+
+def legacy_rule_based_action(all_nodes: List[Candidate], phase: str, plan: Dict) -> Optional[Dict]:
+    start = (plan.get("start") or "").strip()
+    dest = (plan.get("destination") or "").strip()
+
+    # If date picker popped and plan is "now": escape it.
+    if phase == "datetime_picker" and (plan.get("when") == "now"):
+        return {"action": "key", "keycode": 4, "reason": "Close date/time picker (BACK), plan is depart now"}
+
+    # If drawer open, pick Trip Planner
+    if phase == "drawer":
+        tp = _find_by_label(all_nodes, "trip planner")
+        if tp:
+            return {"action": "tap", "target_idx": tp.idx, "reason": "Open Trip Planner from drawer menu"}
+        return {"action": "key", "keycode": 4, "reason": "Close drawer (BACK) - Trip Planner not found"}
+
+    # On home/unknown, prefer opening drawer then Trip Planner if visible
+    if phase in {"home", "unknown"}:
+        # Burger icon often has content-desc like "Open navigation drawer"
+        burger = _find_by_label(all_nodes, "drawer") or _find_by_label(all_nodes, "navigation") or _find_by_label(all_nodes, "open")
+        if burger:
+            return {"action": "tap", "target_idx": burger.idx, "reason": "Open navigation drawer"}
+        # Or just use start field on Home card if present
+        sf = _find_start_field(all_nodes)
+        if sf and start:
+            return {"action": "tap", "target_idx": sf.idx, "reason": f"Open start field to set '{start}'"}
+        return None
+
+    # Trip Planner form: set start -> set dest -> search
+    if phase == "tripplanner_form":
+        sf = _find_start_field(all_nodes)
+        df = _find_dest_field(all_nodes)
+        sb = _find_search_button(all_nodes)
+
+        def looks_placeholder(c: Optional[Candidate], placeholder: str) -> bool:
+            if not c:
+                return True
+            blob = f"{_norm(c.text)} {_norm(c.content_desc)} {_norm(c.label)}"
+            return placeholder in blob
+
+        if sf and start and looks_placeholder(sf, "select start"):
+            return {"action": "tap", "target_idx": sf.idx, "reason": f"Set start='{start}'"}
+        if df and dest and looks_placeholder(df, "select destination"):
+            return {"action": "tap", "target_idx": df.idx, "reason": f"Set destination='{dest}'"}
+        if sb:
+            return {"action": "tap", "target_idx": sb.idx, "reason": "Launch search"}
+        return None
+
+    # Picker: select visible match, else type, else back
+    if phase == "picker":
+        want = start or dest
+
+        # If we can infer whether we're selecting start/destination from header label, do it:
+        header = _find_by_label(all_nodes, "select start") or _find_by_label(all_nodes, "select destination")
+        header_blob = ""
+        if header:
+            header_blob = f"{_norm(header.text)} {_norm(header.content_desc)} {_norm(header.label)}"
+        if "start" in header_blob:
+            want = start
+        elif "destination" in header_blob:
+            want = dest
+
+        # Select visible list entry
+        tappables = [c for c in all_nodes if c.clickable and c.enabled and c.center and not is_ime_candidate(c)]
+        matching = [c for c in tappables if want and _contains_city(c, want)]
+        if matching:
+            matching.sort(key=lambda c: (len(c.label or c.content_desc or c.text), c.idx), reverse=True)
+            best = matching[0]
+            return {"action": "tap", "target_idx": best.idx, "reason": f"Select '{want}' from list"}
+
+        # Focus field and type
+        field = next((c for c in all_nodes if c.resource_id.endswith(":id/input_location_name") and c.center), None)
+        if field and want:
+            if field.focused:
+                return {"action": "type", "text": want, "reason": f"Type '{want}' in location field"}
+            return {"action": "tap", "target_idx": field.idx, "reason": "Focus location input"}
+
+        # If keyboard overlay exists, close it
+        if any(is_ime_candidate(c) for c in all_nodes):
+            return {"action": "key", "keycode": 4, "reason": "Close keyboard overlay (BACK)"}
+
+        return None
+
+    return None
+
+
+# ---------------- bench ----------------
+
+
+def iter_corpus(paths: List[str]) -> List[str]:
+    out: List[str] = []
+    for p in paths:
+        if os.path.isdir(p):
+            for dirpath, _, filenames in os.walk(p):
+                out.extend(os.path.join(dirpath, fn) for fn in filenames if fn.endswith(".xml"))
+        elif p.endswith(".xml"):
+            out.append(p)
+        elif p.endswith(".cfla"):
+            # columnar archive (tools/dump_archive.py): one ref per packed dump
+            from dump_archive import DumpArchive
+
+            with DumpArchive(p) as arc:
+                out.extend(f"{p}::{i}" for i in range(len(arc)))
+    return sorted(out)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Rule engine benchmark vs legacy implementation")
+    parser.add_argument("paths", nargs="+", help="XML files, directories (recursive) or .cfla archives")
+    parser.add_argument("--instruction", default="Luxembourg -> Arlon")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    plan = build_trip_plan(args.instruction)
+    dumps = []
+    for path in iter_corpus(args.paths):
+        try:
+            dumps.append((path, extract_candidates(path)[0]))
+        except Exception as e:
+            print(f"[!] skip {path}: {e}", file=sys.stderr)
+    if not dumps:
+        print("[!] empty corpus", file=sys.stderr)
+        return 1
+
+    def run_legacy(nodes: List[Candidate]):
+        phase = legacy_detect_phase(nodes)
+        return phase, legacy_rule_based_action(nodes, phase, plan)
+
+    def run_new(nodes: List[Candidate]):
+        f = FeatureIndex(nodes)
+        phase = detect_phase(nodes, f)
+        return phase, rule_based_action(nodes, phase, plan, f)
+
+    timings: Dict[str, float] = {}
+    for name, fn in (("legacy", run_legacy), ("rules", run_new)):
+        t0 = time.perf_counter()
+        for _ in range(max(1, args.repeat)):
+            for _, nodes in dumps:
+                fn(nodes)
+        timings[name] = (time.perf_counter() - t0) / max(1, args.repeat)
+
+    same = expected = mismatch = 0
+    for path, nodes in dumps:
+        lp, la = run_legacy(nodes)
+        np_, na = run_new(nodes)
+        if (lp, la) == (np_, na):
+            same += 1
+        elif np_ in NEW_PHASES:
+            expected += 1
+        else:
+            mismatch += 1
+            print(f"[!] mismatch {os.path.basename(path)}: legacy={lp} {la} rules={np_} {na}")
+
+    n = len(dumps)
+    print(f"[*] dumps={n} repeat={args.repeat}")
+    for name, t in timings.items():
+        print(f"[*] {name:<7} total={t * 1000:.1f}ms per_dump={t / n * 1e6:.0f}us")
+    if timings.get("rules"):
+        print(f"[*] speedup x{timings['legacy'] / timings['rules']:.2f}")
+    print(f"[*] parity: same={same} new_screen={expected} mismatch={mismatch}")
+    return 0 if mismatch == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
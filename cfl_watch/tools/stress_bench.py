@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Reproducible load generator + throughput benchmark for runner.sh.
+
+- Seeded workload: station pairs, optional via (percent), date/time distribution.
+- Warm-up runs (excluded from stats), then a fixed --count or --duration.
+- Per-phase latency: every "Phase: <name>" log line of the scenario is stamped
+  on arrival; time is attributed to the phase until the next phase line.
+- Results: machine-readable JSON; `compare A.json B.json` prints deltas.
+
+Device-agnostic: runner.sh resolves `adb` from PATH, so --adb-dir lets a
+fake adb (simulator) shadow the real one.
+
+Usage:
+  python tools/stress_bench.py run --seed 42 --count 20 --warmup 2 [--out FILE]
+  python tools/stress_bench.py compare before.json after.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import Dict, List, Optional, Tuple
+
+BENCH_VERSION = 2  # 2: workload_hash over window offsets
+
+# upper bounds in ms; last bucket is +inf
+HIST_BUCKETS_MS = [100, 250, 500, 1000, 2500, 5000, 10000, 20000, 30000, 60000, 120000]
+
+PHASE_RE = re.compile(r"\bPhase: ([A-Za-z_]+)\b")
+
+# weights per hour of day for --dt-dist peak (commuter peaks 7-9h / 16-19h)
+PEAK_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 8, 8, 4, 3, 3, 3, 3, 3, 4, 6, 8, 8, 5, 3, 2, 1, 1]
+
+
+# ---------------- logging ----------------
+
+
+def log(msg: str) -> None:
+    print(f"[*] {msg}", file=sys.stderr)
+
+
+def warn(msg: str) -> None:
+    print(f"[!] {msg}", file=sys.stderr)
+
+
+# ---------------- workload ----------------
+
+
+def load_stations(path: str) -> List[str]:
+    out: List[str] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                out.append(line)
+    return out
+
+
+def _dt_window(dist: str, base: datetime) -> Tuple[datetime, int, Optional[List[int]]]:
+    """
+    Same window as stress_stations.sh: base + 30 min .. end of the next day, so
+    departures are never in the past. base is part of the config (reproducible).
+    Returns (first minute, span in minutes, cumulative per-minute weights for "peak").
+    """
+    lo = base.replace(second=0, microsecond=0) + timedelta(minutes=30)
+    hi = datetime.combine(base.date() + timedelta(days=1), datetime.max.time()).replace(second=0, microsecond=0)
+    span = int((hi - lo).total_seconds() // 60)
+    cum = None
+    if dist == "peak":
+        # weight each minute by its hour of day (built once per workload)
+        cum = list(accumulate(PEAK_WEIGHTS[(lo.hour + (lo.minute + m) // 60) % 24] for m in range(span + 1)))
+    return lo, span, cum
+
+
+def _rand_datetime(rng: random.Random, window: Tuple[datetime, int, Optional[List[int]]]) -> Dict[str, str]:
+    lo, span, cum = window
+    if cum is not None:
+        offset = rng.choices(range(span + 1), cum_weights=cum)[0]
+    else:
+        offset = rng.randint(0, span)
+    t = lo + timedelta(minutes=offset)
+    # offset_min: position in the window, what workload_hash compares across days
+    return {"date_ymd": t.date().isoformat(), "time_hm": t.strftime("%H:%M"), "offset_min": str(offset)}
+
+
+def parse_base(value: str) -> datetime:
+    """YYYY-MM-DD (midnight) or YYYY-MM-DDTHH:MM; empty = now (minute)."""
+    if not value:
+        return datetime.now().replace(second=0, microsecond=0)
+    return datetime.fromisoformat(value)
+
+
+def generate_workload(
+    stations: List[str], n: int, seed: int, via_prob: float, dt_dist: str, base: datetime
+) -> List[Dict[str, str]]:
+    """Same (stations, n, seed, via_prob, dt_dist, base) -> same items (dates relative to base)."""
+    if len(stations) < 2:
+        raise ValueError("need at least 2 stations")
+    rng = random.Random(seed)
+    window = _dt_window(dt_dist, base) if dt_dist != "none" else None
+    items: List[Dict[str, str]] = []
+    for _ in range(n):
+        start, target = rng.sample(stations, 2)
+        via = ""
+        if via_prob > 0 and len(stations) >= 3 and rng.random() * 100.0 < via_prob:
+            via = rng.choice([s for s in stations if s not in (start, target)])
+        item = {"start": start, "target": target, "via": via}
+        if dt_dist != "none":
+            item.update(_rand_datetime(rng, window))
+        items.append(item)
+    return items
+
+
+def workload_hash(items: List[Dict[str, str]]) -> str:
+    # dates are relative to the base: hash the offset in the window, not the calendar
+    # date/time, so runs with the same --base-date time of day compare across days
+    stable = [{k: v for k, v in it.items() if k not in ("date_ymd", "time_hm")} for it in items]
+    return hashlib.sha1(json.dumps(stable, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+# ---------------- stats ----------------
+
+
+def histogram(values_ms: List[float]) -> List[int]:
+    counts = [0] * (len(HIST_BUCKETS_MS) + 1)
+    for v in values_ms:
+        for i, ub in enumerate(HIST_BUCKETS_MS):
+            if v <= ub:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    return counts
+
+
+def _pct(sorted_vals: List[float], p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = max(0, min(len(sorted_vals) - 1, int(math.ceil(p / 100.0 * len(sorted_vals))) - 1))
+    return sorted_vals[k]
+
+
+def summarize(values_ms: List[float]) -> Dict:
+    v = sorted(values_ms)
+    return {
+        "n": len(v),
+        "min_ms": round(v[0], 1) if v else 0.0,
+        "mean_ms": round(sum(v) / len(v), 1) if v else 0.0,
+        "p50_ms": round(_pct(v, 50), 1),
+        "p90_ms": round(_pct(v, 90), 1),
+        "p99_ms": round(_pct(v, 99), 1),
+        "max_ms": round(v[-1], 1) if v else 0.0,
+        "hist": histogram(v),
+    }
+
+
+# ---------------- execution ----------------
+
+
+def run_one(runner: str, item: Dict[str, str], snap_mode: str, no_anim: bool, env: Dict[str, str]) -> Dict:
+    args = ["bash", runner]
+    if no_anim:
+        args.append("--no-anim")
+    args += ["--start", item["start"], "--target", item["target"], "--snap-mode", snap_mode]
+    if item.get("via"):
+        args += ["--via", item["via"]]
+
+    run_env = dict(env)
+    if item.get("date_ymd"):
+        run_env["DATE_YMD"] = item["date_ymd"]
+        run_env["TIME_HM"] = item["time_hm"]
+
+    phases: Dict[str, float] = {}
+    cur: Optional[str] = None
+    t0 = time.monotonic()
+    t_mark = t0
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=run_env, text=True, errors="replace")
+    assert proc.stdout is not None
+    for line in proc.stdout:
+        m = PHASE_RE.search(line)
+        if not m or m.group(1) == cur:
+            continue
+        now = time.monotonic()
+        if cur:
+            phases[cur] = phases.get(cur, 0.0) + (now - t_mark) * 1000.0
+        cur, t_mark = m.group(1), now
+    rc = proc.wait()
+    t1 = time.monotonic()
+    if cur:
+        phases[cur] = phases.get(cur, 0.0) + (t1 - t_mark) * 1000.0
+    return {"rc": rc, "total_ms": (t1 - t0) * 1000.0, "phases_ms": phases}
+
+
+def cmd_run(args: argparse.Namespace) -> int:
+    stations = load_stations(args.stations)
+    base = parse_base(args.base_date)
+    # with --duration we don't know the count: generate generously, consume in order
+    n_items = args.warmup + (args.count if args.count > 0 else 10000)
+    items = generate_workload(stations, n_items, args.seed, args.via_prob, args.dt_dist, base)
+
+    env = dict(os.environ)
+    if args.adb_dir:
+        env["PATH"] = os.path.abspath(args.adb_dir) + os.pathsep + env.get("PATH", "")
+
+    log(f"bench: seed={args.seed} warmup={args.warmup} count={args.count} duration={args.duration}s")
+    results: List[Dict] = []
+    t_start: Optional[float] = None
+    for i, item in enumerate(items):
+        measured = i >= args.warmup
+        if measured and t_start is None:
+            t_start = time.monotonic()
+        if measured and args.count <= 0 and time.monotonic() - t_start >= args.duration:
+            break
+        if measured and args.count > 0 and len(results) >= args.count:
+            break
+
+        tag = "warmup" if not measured else f"{len(results) + 1}"
+        log(f"({tag}) {item['start']} -> {item['target']}{' via ' + item['via'] if item['via'] else ''}"
+            f" {item.get('date_ymd', '')} {item.get('time_hm', '')}")
+        r = run_one(args.runner, item, args.snap_mode, not args.anim, env)
+        if measured:
+            r["item"] = item
+            results.append(r)
+        if r["rc"] != 0:
+            warn(f"({tag}) FAILED rc={r['rc']}")
+        if args.sleep_between > 0:
+            time.sleep(args.sleep_between)
+
+    wall_s = (time.monotonic() - t_start) if t_start is not None else 0.0
+    ok = [r for r in results if r["rc"] == 0]
+    phase_names = sorted({p for r in ok for p in r["phases_ms"]})
+    report = {
+        "bench_version": BENCH_VERSION,
+        "ts": datetime.now().replace(microsecond=0).isoformat(),
+        "config": {
+            "seed": args.seed, "warmup": args.warmup, "count": args.count, "duration_s": args.duration,
+            "via_prob": args.via_prob, "dt_dist": args.dt_dist, "base_date": base.isoformat(timespec="minutes"),
+            "snap_mode": args.snap_mode, "stations": os.path.basename(args.stations),
+            "cfl_pkg": os.getenv("CFL_PKG", ""), "adb_dir": args.adb_dir,
+        },
+        "workload_hash": workload_hash([r["item"] for r in results]),
+        "hist_buckets_ms": HIST_BUCKETS_MS,
+        "runs": len(results),
+        "ok": len(ok),
+        "fail": len(results) - len(ok),
+        "wall_s": round(wall_s, 2),
+        "runs_per_hour": round(len(ok) * 3600.0 / wall_s, 2) if wall_s > 0 else 0.0,
+        "total": summarize([r["total_ms"] for r in ok]),
+        "phases": {p: summarize([r["phases_ms"][p] for r in ok if p in r["phases_ms"]]) for p in phase_names},
+        "samples": [
+            {"rc": r["rc"], "total_ms": round(r["total_ms"], 1),
+             "phases_ms": {k: round(v, 1) for k, v in r["phases_ms"].items()}, "item": r["item"]}
+            for r in results
+        ],
+    }
+
+    out = args.out or os.path.join(
+        os.path.expanduser(os.getenv("CFL_ARTIFACT_DIR", "/sdcard/cfl_watch")),
+        "bench", f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}_seed{args.seed}.json",
+    )
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    log(f"DONE: ok={report['ok']} fail={report['fail']} runs/h={report['runs_per_hour']}"
+        f" p50={report['total']['p50_ms']}ms p90={report['total']['p90_ms']}ms")
+    print(out)
+    return 0 if report["fail"] == 0 else 1
+
+
+# ---------------- compare ----------------
+
+
+def _delta(a: float, b: float) -> str:
+    if not a:
+        return "n/a"
+    return f"{(b - a) / a * 100.0:+.1f}%"
+
+
+def cmd_compare(args: argparse.Namespace) -> int:
+    with open(args.a, "r", encoding="utf-8") as f:
+        a = json.load(f)
+    with open(args.b, "r", encoding="utf-8") as f:
+        b = json.load(f)
+    if a.get("workload_hash") != b.get("workload_hash"):
+        warn(f"workloads differ ({a.get('workload_hash')} vs {b.get('workload_hash')}): compare with care")
+        ca, cb = a.get("config", {}), b.get("config", {})
+        if ca.get("base_date", "")[10:] != cb.get("base_date", "")[10:]:
+            # the window (and so every departure) depends on the base time of day
+            warn(f"base dates {ca.get('base_date')} vs {cb.get('base_date')}: pass the same --base-date to both runs")
+
+    print(f"{'metric':<22}{'A':>12}{'B':>12}{'delta':>10}")
+    print(f"{'runs_per_hour':<22}{a['runs_per_hour']:>12}{b['runs_per_hour']:>12}{_delta(a['runs_per_hour'], b['runs_per_hour']):>10}")
+    print(f"{'ok/fail':<22}{str(a['ok']) + '/' + str(a['fail']):>12}{str(b['ok']) + '/' + str(b['fail']):>12}")
+    rows = [("total", a["total"], b["total"])]
+    for p in sorted(set(a["phases"]) | set(b["phases"])):
+        rows.append((p, a["phases"].get(p, {}), b["phases"].get(p, {})))
+    for name, sa, sb in rows:
+        for q in ("p50_ms", "p90_ms"):
+            va, vb = sa.get(q, 0.0), sb.get(q, 0.0)
+            print(f"{name + ' ' + q:<22}{va:>12}{vb:>12}{_delta(va, vb):>10}")
+    return 0
+
+
+# ---------------- main ----------------
+
+
+def main() -> int:
+    here = os.path.dirname(os.path.abspath(__file__))
+    code_dir = os.path.dirname(here)
+
+    parser = argparse.ArgumentParser(description="CFL runner benchmark (seeded workload)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_run = sub.add_parser("run", help="Run a seeded benchmark and write JSON results")
+    p_run.add_argument("--seed", type=int, default=int(os.environ.get("SEED", "1")))
+    p_run.add_argument("--count", type=int, default=int(os.environ.get("N", "10")), help="Measured runs (0 = use --duration)")
+    p_run.add_argument("--duration", type=float, default=float(os.environ.get("DURATION", "0")), help="Seconds (with --count 0)")
+    p_run.add_argument("--warmup", type=int, default=int(os.environ.get("WARMUP", "1")))
+    p_run.add_argument(
+        "--via-prob", dest="via_prob", type=float,
+        default=float(os.environ.get("VIA_PROB", "50")) if os.environ.get("ALLOW_VIA", "0") == "1" else 0.0,
+        help="Percent chance to add a via (default: VIA_PROB if ALLOW_VIA=1, else 0)",
+    )
+    p_run.add_argument("--dt-dist", dest="dt_dist", choices=["uniform", "peak", "none"], default=os.environ.get("DT_DIST", "uniform"))
+    p_run.add_argument("--base-date", dest="base_date", default=os.environ.get("BASE_DATE", ""), help="YYYY-MM-DD[THH:MM], start of the departure window (default: now)")
+    p_run.add_argument("--stations", default=os.environ.get("STATIONS_FILE", os.path.join(code_dir, "data", "stations.txt")))
+    p_run.add_argument("--runner", default=os.environ.get("RUNNER", os.path.join(code_dir, "runner.sh")))
+    p_run.add_argument("--snap-mode", dest="snap_mode", default=os.environ.get("SNAP_MODE", "3"),
+                       help="Default 3, like stress_stations.sh")
+    p_run.add_argument("--anim", action="store_true", help="Keep animations (default: --no-anim)")
+    p_run.add_argument("--sleep-between", dest="sleep_between", type=float, default=float(os.environ.get("SLEEP_BETWEEN", "0")))
+    p_run.add_argument("--adb-dir", dest="adb_dir", default=os.environ.get("BENCH_ADB_DIR", ""), help="Dir prepended to PATH (fake adb)")
+    p_run.add_argument("--out", default="", help="Result JSON path")
+
+    p_cmp = sub.add_parser("compare", help="Compare two result files")
+    p_cmp.add_argument("a")
+    p_cmp.add_argument("b")
+
+    args = parser.parse_args()
+    if args.cmd == "run":
+        if args.count <= 0 and args.duration <= 0:
+            raise SystemExit("Need --count > 0 or --duration > 0")
+        return cmd_run(args)
+    return cmd_compare(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -6,6 +6,12 @@ set -u
 # App & scenario selection handled by runner.sh
 # - mono-run via CFL_PKG
 # - multi-run via CFL_MULTI_RUN=1
+#
+# Benchmark mode (seeded, reproducible, JSON results):
+#   bash stress_stations.sh bench --seed 42 --count 20 --warmup 2 [--out FILE]
+#   bash stress_stations.sh compare before.json after.json
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 
 STATIONS_FILE="${STATIONS_FILE:-$HOME/termux-scripts/cfl_watch/stations.txt}"
 RUNNER="${RUNNER:-$HOME/termux-scripts/cfl_watch/runner.sh}"
@@ -23,6 +29,17 @@ SLEEP_BETWEEN="${SLEEP_BETWEEN:-0}"
 ALLOW_VIA="${ALLOW_VIA:-0}"      # 1 = enable via
 VIA_PROB="${VIA_PROB:-50}"       # % chance to add a via when enabled
 
+# bench/compare: same defaults as the stress loop (stress_bench.py reads them from env)
+case "${1:-}" in
+  bench)
+    shift
+    export STATIONS_FILE RUNNER ADB_TCP_PORT CFL_REMOTE_TMP_DIR CFL_TMP_DIR SNAP_MODE N SLEEP_BETWEEN ALLOW_VIA VIA_PROB
+    [ "$NO_ANIM" = "1" ] || set -- --anim "$@"
+    exec python "$SCRIPT_DIR/stress_bench.py" run "$@"
+    ;;
+  compare) shift; exec python "$SCRIPT_DIR/stress_bench.py" compare "$@" ;;
+esac
+
 # ------------------------------------------------------------
 # Helpers
 # ------------------------------------------------------------
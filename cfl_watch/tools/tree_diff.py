@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+Tree-diff between consecutive uiautomator dumps + keyframe/delta storage.
+
+Node identity is stable across dumps: the key is the parent's key plus
+"class#resource-id#n" (n = ordinal among siblings sharing class + resource-id),
+so a focused field, typed text or a loader only touches a handful of records.
+
+A dump is a preorder list of records [depth, attrs] (keys are recomputed, not
+stored). A delta against the previous dump is:
+  ops: [["=", n] | ["-", n] | ["+", [rec, ...]], ...]  (walk over the old list)
+  set: {"<new index>": {attr: value | null}}           (changed attrs on "=" nodes)
+
+Run storage (xml/frames.jsonl): one keyframe, then deltas; a new keyframe every
+--keyframe-every frames or when a delta is not worth it.
+
+Usage:
+  python tools/tree_diff.py diff a.xml b.xml
+  python tools/tree_diff.py pack <run_dir> [--prune] [--keyframe-every 20]
+  python tools/tree_diff.py unpack <run_dir> [--out DIR]
+"""
+
+from __future__ import annotations
+
+import argparse
+import html
+import json
+import os
+import re
+import sys
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import quoteattr
+
+FRAMES_NAME = "frames.jsonl"
+FORMAT_VERSION = 1
+
+Rec = list  # [depth, attrs]
+
+ATTR_RE = re.compile(r'([\w:.-]+)="([^"]*)"')
+
+
+def log(msg: str) -> None:
+    print(f"[*] {msg}", file=sys.stderr)
+
+
+def warn(msg: str) -> None:
+    print(f"[!] {msg}", file=sys.stderr)
+
+
+# ---------------- identity ----------------
+
+def parse_attrs(raw: str) -> Dict[str, str]:
+    """Attributes of a raw node tag (as returned by scan_nodes), unescaped like ElementTree."""
+    return {k: (html.unescape(v) if "&" in v else v) for k, v in ATTR_RE.findall(raw)}
+
+
+def _attr(name: str, raw: str) -> str:
+    # name = ' class="' style needle; cheaper than a regex per node
+    i = raw.find(name)
+    if i < 0:
+        return ""
+    i += len(name)
+    v = raw[i:raw.index('"', i)]
+    return html.unescape(v) if "&" in v else v
+
+
+def scan_nodes(text: str) -> Optional[Tuple[List[str], List[str], List[int], List[int]]]:
+    """
+    Tokenize a uiautomator dump without building a tree: (keys, raw attribute
+    strings, subtree_end, window) per node in preorder, keys as rec_keys().
+    None when the markup is not the plain nesting uiautomator writes.
+    """
+    keys: List[str] = []
+    tags: List[str] = []
+    subtree_end: List[int] = []
+    window: List[int] = []
+    stack: List[int] = []
+    seen: List[Dict[Tuple[str, str], int]] = [{}]
+    top = -1
+    # '<' is always escaped inside attribute values: splitting on it yields one piece per tag
+    for piece in text.split("<"):
+        if piece.startswith("/node"):
+            if not stack:
+                return None
+            i = stack.pop()
+            seen.pop()
+            subtree_end[i] = len(tags)
+            continue
+        if not piece.startswith("node") or piece[4:5] not in (" ", "/", ">", "\n", "\t"):
+            continue
+        raw = piece[4:piece.rindex(">")].rstrip()
+        closed = raw.endswith("/")
+        if closed:
+            raw = raw[:-1]
+        ident = (_attr(' class="', raw), _attr(' resource-id="', raw))
+        counts = seen[-1]
+        n = counts.get(ident, 0)
+        counts[ident] = n + 1
+        parent_key = keys[stack[-1]] if stack else ""
+        if not stack:
+            top += 1
+        i = len(tags)
+        keys.append(f"{parent_key}/{ident[0]}#{ident[1]}#{n}")
+        tags.append(raw)
+        subtree_end.append(i + 1)
+        window.append(top)
+        if not closed:
+            stack.append(i)
+            seen.append({})
+    if stack or not tags:
+        return None
+    return keys, tags, subtree_end, window
+
+
+def flatten(root: ET.Element) -> List[Rec]:
+    recs: List[Rec] = []
+
+    def walk(parent: ET.Element, depth: int) -> None:
+        for child in parent:
+            if child.tag != "node":
+                continue
+            recs.append([depth, dict(child.attrib)])
+            walk(child, depth + 1)
+
+    walk(root, 1)
+    return recs
+
+
+def rec_keys(recs: List[Rec]) -> List[str]:
+    """Identity key of every record (see module docstring)."""
+    keys: List[str] = []
+    parents: List[str] = [""]
+    seen: List[Dict[Tuple[str, str], int]] = [{}]
+    for depth, a in recs:
+        del parents[depth:], seen[depth:]
+        ident = (a.get("class", ""), a.get("resource-id", ""))
+        n = seen[-1].get(ident, 0)
+        seen[-1][ident] = n + 1
+        key = f"{parents[-1]}/{ident[0]}#{ident[1]}#{n}"
+        keys.append(key)
+        parents.append(key)
+        seen.append({})
+    return keys
+
+
+def load_xml(path: str) -> Tuple[Dict[str, str], List[Rec]]:
+    root = ET.parse(path).getroot()
+    return dict(root.attrib), flatten(root)
+
+
+# ---------------- diff / apply ----------------
+
+def diff(old: List[Rec], new: List[Rec]) -> Dict:
+    old_keys, new_keys = rec_keys(old), rec_keys(new)
+    old_index = {k: i for i, k in enumerate(old_keys)}
+    ops: List[list] = []
+    sets: Dict[str, Dict[str, Optional[str]]] = {}
+    p = 0
+
+    def emit(op: str, arg) -> None:
+        if ops and ops[-1][0] == op and op != "+":
+            ops[-1][1] += arg
+        elif ops and ops[-1][0] == op == "+":
+            ops[-1][1].extend(arg)
+        else:
+            ops.append([op, arg])
+
+    for i, rec in enumerate(new):
+        oi = old_index.get(new_keys[i])
+        if oi is None or oi < p or old[oi][0] != rec[0]:
+            emit("+", [rec])  # new, moved backwards or re-parented
+            continue
+        if oi > p:
+            emit("-", oi - p)
+        emit("=", 1)
+        p = oi + 1
+        a_old, a_new = old[oi][1], rec[1]
+        if a_old != a_new:
+            ch: Dict[str, Optional[str]] = {k: v for k, v in a_new.items() if a_old.get(k) != v}
+            ch.update({k: None for k in a_old if k not in a_new})
+            sets[str(i)] = ch
+    if p < len(old):
+        emit("-", len(old) - p)
+    return {"ops": ops, "set": sets}
+
+
+def apply(old: List[Rec], delta: Dict) -> List[Rec]:
+    out: List[Rec] = []
+    p = 0
+    for op, arg in delta["ops"]:
+        if op == "=":
+            out.extend([r[0], dict(r[1])] for r in old[p:p + arg])
+            p += arg
+        elif op == "-":
+            p += arg
+        else:
+            out.extend([r[0], dict(r[1])] for r in arg)
+    for i, ch in delta.get("set", {}).items():
+        attrs = out[int(i)][1]
+        for k, v in ch.items():
+            if v is None:
+                attrs.pop(k, None)
+            else:
+                attrs[k] = v
+    return out
+
+
+def delta_stats(delta: Dict) -> Dict[str, int]:
+    st = {"kept": 0, "removed": 0, "added": 0, "changed": len(delta.get("set", {}))}
+    for op, arg in delta["ops"]:
+        if op == "=":
+            st["kept"] += arg
+        elif op == "-":
+            st["removed"] += arg
+        else:
+            st["added"] += len(arg)
+    return st
+
+
+def to_xml(root_attrs: Dict[str, str], recs: List[Rec]) -> str:
+    parts = ["<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>"]
+    parts.append("<hierarchy" + "".join(f" {k}={quoteattr(v)}" for k, v in root_attrs.items()) + ">")
+    depth = 0
+    for i, (d, attrs) in enumerate(recs):
+        while depth >= d:
+            parts.append("</node>")
+            depth -= 1
+        nxt = recs[i + 1][0] if i + 1 < len(recs) else 0
+        a = "".join(f" {k}={quoteattr(v)}" for k, v in attrs.items())
+        if nxt > d:
+            parts.append(f"<node{a}>")
+            depth = d
+        else:
+            parts.append(f"<node{a} />")
+            depth = d - 1
+    while depth >= 1:
+        parts.append("</node>")
+        depth -= 1
+    parts.append("</hierarchy>")
+    return "".join(parts)
+
+
+# ---------------- run storage ----------------
+
+def run_xml_files(run_dir: str) -> List[str]:
+    xml_dir = os.path.join(run_dir, "xml")
+    if not os.path.isdir(xml_dir):
+        return []
+    return sorted(os.path.join(xml_dir, fn) for fn in os.listdir(xml_dir) if fn.endswith(".xml"))
+
+
+def pack_run(run_dir: str, keyframe_every: int = 20, prune: bool = False) -> Dict[str, int]:
+    """
+    Pack xml/*.xml into xml/frames.jsonl. An existing frames.jsonl (earlier pack,
+    maybe pruned) is merged, not overwritten: its frames and the XML files not
+    in it are re-encoded together, in name order.
+    """
+    out_path = os.path.join(run_dir, "xml", FRAMES_NAME)
+    st = {"frames": 0, "keyframes": 0, "merged": 0, "xml_bytes": 0, "packed_bytes": 0}
+    old: Dict[str, Tuple[Dict[str, str], List[Rec]]] = {}
+    if os.path.isfile(out_path):
+        old = {name: (root_attrs, recs) for name, root_attrs, recs in iter_frames(run_dir)}
+    files: List[str] = []
+    for p in run_xml_files(run_dir):
+        if os.path.basename(p) not in old:
+            files.append(p)
+        elif prune:
+            os.remove(p)  # already in frames.jsonl (packed earlier without --prune)
+    if not files:
+        # nothing new (an already packed run keeps its frames.jsonl as is)
+        if old:
+            st["frames"] = st["merged"] = len(old)
+            st["packed_bytes"] = os.path.getsize(out_path)
+        return st
+
+    sources: List[Tuple[str, Optional[str]]] = [(name, None) for name in old]
+    sources += [(os.path.basename(p), p) for p in files]
+    sources.sort(key=lambda x: x[0])
+
+    prev: Optional[List[Rec]] = None
+    since_key = 0
+    packed: List[str] = []
+    tmp = f"{out_path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for name, path in sources:
+            if path is None:
+                root_attrs, recs = old[name]
+                st["merged"] += 1
+                st["xml_bytes"] += len(to_xml(root_attrs, recs).encode("utf-8"))
+            else:
+                try:
+                    root_attrs, recs = load_xml(path)
+                except ET.ParseError as e:
+                    warn(f"skip {path}: {e}")
+                    continue
+                st["xml_bytes"] += os.path.getsize(path)
+                packed.append(path)
+            frame = None
+            if prev is not None and since_key < keyframe_every:
+                d = diff(prev, recs)
+                frame = {"name": name, "root": root_attrs, **d}
+                line = json.dumps(frame, ensure_ascii=False, separators=(",", ":"))
+                # a delta touching most of the tree is not worth it
+                if delta_stats(d)["added"] > len(recs) // 2:
+                    frame = None
+            if frame is None:
+                frame = {"v": FORMAT_VERSION, "name": name, "root": root_attrs, "key": True, "recs": recs}
+                line = json.dumps(frame, ensure_ascii=False, separators=(",", ":"))
+                since_key = 0
+                st["keyframes"] += 1
+            f.write(line + "\n")
+            prev = recs
+            since_key += 1
+            st["frames"] += 1
+    os.replace(tmp, out_path)
+    st["packed_bytes"] = os.path.getsize(out_path)
+
+    if prune:
+        for path in packed:
+            os.remove(path)
+    return st
+
+
+def iter_frames(run_dir: str) -> Iterator[Tuple[str, Dict[str, str], List[Rec]]]:
+    """(name, root_attrs, recs) for every frame of xml/frames.jsonl."""
+    path = os.path.join(run_dir, "xml", FRAMES_NAME)
+    recs: List[Rec] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            frame = json.loads(line)
+            recs = frame["recs"] if frame.get("key") else apply(recs, frame)
+            yield frame["name"], frame.get("root", {}), recs
+
+
+def iter_run_xml(run_dir: str) -> Iterator[Tuple[str, str]]:
+    """
+    (name, xml text) for every dump of a run, packed or not: frames of
+    xml/frames.jsonl first, then the xml/*.xml files not in it. Readers of run
+    dumps (dump_archive, viewer) go through this, since a pruned run has no XML
+    files left (trip_ingest reads the frame records directly).
+    """
+    packed = set()
+    if os.path.isfile(os.path.join(run_dir, "xml", FRAMES_NAME)):
+        for name, root_attrs, recs in iter_frames(run_dir):
+            packed.add(name)
+            yield name, to_xml(root_attrs, recs)
+    for path in run_xml_files(run_dir):
+        name = os.path.basename(path)
+        if name in packed:
+            continue
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            yield name, f.read()
+
+
+def unpack_run(run_dir: str, out_dir: Optional[str] = None) -> int:
+    out_dir = out_dir or os.path.join(run_dir, "xml")
+    os.makedirs(out_dir, exist_ok=True)
+    n = 0
+    for name, root_attrs, recs in iter_frames(run_dir):
+        with open(os.path.join(out_dir, name), "w", encoding="utf-8") as f:
+            f.write(to_xml(root_attrs, recs))
+        n += 1
+    return n
+
+
+# ---------------- cli ----------------
+
+def cmd_diff(args: argparse.Namespace) -> int:
+    _, a = load_xml(args.a)
+    _, b = load_xml(args.b)
+    d = diff(a, b)
+    log(f"nodes {len(a)} -> {len(b)}: " + " ".join(f"{k}={v}" for k, v in delta_stats(d).items()))
+    print(json.dumps(d, ensure_ascii=False, indent=None if args.compact else 2))
+    return 0
+
+
+def cmd_pack(args: argparse.Namespace) -> int:
+    st = pack_run(args.run_dir, keyframe_every=args.keyframe_every, prune=args.prune)
+    if not st["frames"]:
+        warn(f"no xml under {args.run_dir}/xml")
+        return 1
+    if not st["xml_bytes"]:
+        log(f"already packed: {st['frames']} frames in {FRAMES_NAME}, no new xml")
+        return 0
+    ratio = st["packed_bytes"] / max(st["xml_bytes"], 1)
+    log(f"frames={st['frames']} keyframes={st['keyframes']} xml={st['xml_bytes']}B "
+        f"packed={st['packed_bytes']}B ({ratio:.0%})" + (" [xml pruned]" if args.prune else "")
+        + (f" [{st['merged']} frames kept from the existing {FRAMES_NAME}]" if st["merged"] else ""))
+    return 0
+
+
+def cmd_unpack(args: argparse.Namespace) -> int:
+    n = unpack_run(args.run_dir, args.out)
+    log(f"restored {n} xml -> {args.out or os.path.join(args.run_dir, 'xml')}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Tree-diff + keyframe/delta storage for uiautomator dumps")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("diff", help="Delta between two dumps (JSON)")
+    p.add_argument("a")
+    p.add_argument("b")
+    p.add_argument("--compact", action="store_true")
+    p.set_defaults(func=cmd_diff)
+
+    p = sub.add_parser("pack", help="xml/*.xml -> xml/frames.jsonl (keyframe + deltas)")
+    p.add_argument("run_dir")
+    p.add_argument("--keyframe-every", type=int, default=int(os.environ.get("CFL_XML_KEYFRAME_EVERY", "20")))
+    p.add_argument("--prune", action="store_true", help="Delete the packed XML files")
+    p.set_defaults(func=cmd_pack)
+
+    p = sub.add_parser("unpack", help="xml/frames.jsonl -> xml files")
+    p.add_argument("run_dir")
+    p.add_argument("--out", default=None)
+    p.set_defaults(func=cmd_unpack)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
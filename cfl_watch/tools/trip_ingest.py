@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+Incremental trip-result ingestion (uiautomator XML -> SQLite).
+
+Parses journey rows out of run snapshots exactly once:
+- results screen: every `:id/haf_connection_view` (content-desc = summary)
+- detail screens: `:id/journey_details_head` ("Travel with R E 414 To X")
+
+A checkpoint table (path + size + mtime) makes re-runs skip already
+ingested dumps, so the command can be called after every batch trip.
+Packed runs (tools/tree_diff.py pack, xml/frames.jsonl) are read frame by
+frame without rebuilding the XML; frames.jsonl is one checkpoint unit.
+Station names come from `<run>/trip.txt` (raw scenario args) when present,
+else from the safe_name'd run dir name; routes are keyed with the same
+safe_name rule so both (and accented query args) match.
+Flight-recorder runs only keep dumps on failure: batch_trips.sh turns the
+recorder off when CFL_INGEST=1.
+
+Usage:
+  python tools/trip_ingest.py ingest [--root /sdcard/cfl_watch] [--db PATH]
+  python tools/trip_ingest.py query --start Luxembourg --target Arlon --since 2026-01-12
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import xml.etree.ElementTree as ET
+
+SCHEMA_VERSION = 1
+
+RUN_DIR_RE = re.compile(r"^(\d{8}_\d{6})_(.+)$")
+TRIP_TAG_RE = re.compile(
+    r"^trip_(?P<start>.+?)_to_(?P<target>.+?)"
+    r"(?:_via_(?P<via>.+?))?(?:_d_(?P<date>\d{4}-\d{2}-\d{2}))?(?:_t_(?P<time>\d{3,4}))?$"
+)
+
+# "Trip at 2:50pm; . with arrival at 4:54pm; . Duration: 2 hours 4 minutes. with R E 414;0 changes."
+DEP_RE = re.compile(r"\bTrip at (\d{1,2}):(\d{2})\s*([ap]m)?", re.IGNORECASE)
+ARR_RE = re.compile(r"\barrival at (\d{1,2}):(\d{2})\s*([ap]m)?", re.IGNORECASE)
+DUR_H_RE = re.compile(r"(\d+)\s*hours?", re.IGNORECASE)
+DUR_M_RE = re.compile(r"(\d+)\s*min(?:ute)?s?", re.IGNORECASE)
+LINES_RE = re.compile(r"Duration:[^.]*\.\s*with (.+?);\s*(\w+) changes?", re.IGNORECASE)
+DELAY_RE = re.compile(r"(?:delay(?:ed)?|late)\D{0,20}(\d+)\s*min|\+(\d+)\s*min", re.IGNORECASE)
+HEAD_RE = re.compile(r"^Travel with (.+?) To (.+)$", re.IGNORECASE)
+
+NEEDLES = (b":id/haf_connection_view", b":id/journey_details_head")
+TRIP_ARGS_NAME = "trip.txt"  # written by the trip scenarios next to xml/
+FRAMES_NAME = "frames.jsonl"  # tree_diff.FRAMES_NAME (imported lazily, packed runs only)
+FRAME_NAME_RE = re.compile(r'"name":"([^"]*)"')
+
+WORD_NUMBERS = {"no": 0, "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5}
+
+
+# ---------------- logging ----------------
+
+
+def log(msg: str) -> None:
+    print(f"[*] {msg}", file=sys.stderr)
+
+
+def warn(msg: str) -> None:
+    print(f"[!] {msg}", file=sys.stderr)
+
+
+# ---------------- helpers ----------------
+
+
+def _default_root() -> str:
+    return os.path.expanduser(os.getenv("CFL_ARTIFACT_DIR", "/sdcard/cfl_watch"))
+
+
+def _default_db() -> str:
+    # SQLite on /sdcard (FUSE) is slow and lock-unfriendly: keep the store in Termux home.
+    return os.path.expanduser(os.getenv("CFL_TRIPS_DB", "~/.cache/cfl_watch/trips.sqlite"))
+
+
+def _safe_name(s: str) -> str:
+    # lib/common.sh safe_name (run dir names): ' ' and '/' -> '_', anything else non [A-Za-z0-9._-] dropped
+    return re.sub(r"[^A-Za-z0-9._-]", "", (s or "").replace(" ", "_").replace("/", "_"))
+
+
+def _route_key(start: str, target: str) -> str:
+    # same rule as the run dir names, so raw names (trip.txt, query args with accents)
+    # and names parsed back from older dir names give the same key
+    def norm(s: str) -> str:
+        return re.sub(r"[\s_]+", " ", _safe_name(s)).strip().lower()
+
+    return f"{norm(start)}->{norm(target)}"
+
+
+def _clock(h: str, m: str, ampm: Optional[str]) -> Tuple[int, int]:
+    hh, mm = int(h), int(m)
+    if ampm:
+        ampm = ampm.lower()
+        if ampm == "pm" and hh < 12:
+            hh += 12
+        elif ampm == "am" and hh == 12:
+            hh = 0
+    return hh, mm
+
+
+def _one_line(s: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"[\r\n]+", " | ", s or "")).strip()
+
+
+# ---------------- parsing ----------------
+
+
+def parse_run_dir(name: str) -> Optional[Dict]:
+    m = RUN_DIR_RE.match(name)
+    if not m:
+        return None
+    run_ts = datetime.strptime(m.group(1), "%Y%m%d_%H%M%S")
+    t = TRIP_TAG_RE.match(m.group(2))
+    if not t:
+        return None
+    trip_date = run_ts.date()
+    if t.group("date"):
+        trip_date = datetime.strptime(t.group("date"), "%Y-%m-%d").date()
+    return {
+        "run_ts": run_ts,
+        "trip_date": trip_date,
+        "start": t.group("start").replace("_", " "),
+        "target": t.group("target").replace("_", " "),
+        "via": (t.group("via") or "").replace("_", " "),
+    }
+
+
+def parse_connection_desc(desc: str, trip_date, run_ts: datetime) -> Optional[Dict]:
+    dm = DEP_RE.search(desc)
+    if not dm:
+        return None
+    dh, dmin = _clock(*dm.groups())
+    dep = datetime.combine(trip_date, datetime.min.time()).replace(hour=dh, minute=dmin)
+    # no explicit date: a departure "earlier" than the run belongs to the next day
+    if trip_date == run_ts.date() and dep < run_ts - timedelta(hours=1):
+        dep += timedelta(days=1)
+
+    arr = None
+    am = ARR_RE.search(desc)
+    if am:
+        ah, amin = _clock(*am.groups())
+        arr = dep.replace(hour=ah, minute=amin)
+        if arr < dep:
+            arr += timedelta(days=1)
+
+    duration = None
+    if "Duration" in desc:
+        tail = desc.split("Duration", 1)[1].split(".", 1)[0]
+        h = DUR_H_RE.search(tail)
+        mi = DUR_M_RE.search(tail)
+        if h or mi:
+            duration = (int(h.group(1)) * 60 if h else 0) + (int(mi.group(1)) if mi else 0)
+
+    lines, changes = "", None
+    lm = LINES_RE.search(desc)
+    if lm:
+        lines = lm.group(1).strip()
+        word = lm.group(2).lower()
+        changes = int(word) if word.isdigit() else WORD_NUMBERS.get(word)
+
+    delay = None
+    dl = DELAY_RE.search(desc)
+    if dl:
+        delay = int(dl.group(1) or dl.group(2))
+
+    return {
+        "dep_ts": dep.strftime("%Y-%m-%d %H:%M"),
+        "arr_ts": arr.strftime("%Y-%m-%d %H:%M") if arr else None,
+        "duration_min": duration,
+        "changes": changes,
+        "lines": lines,
+        "delay_min": delay,
+        "cancelled": 1 if re.search(r"cancel", desc, re.IGNORECASE) else 0,
+    }
+
+
+def extract_rows(xml_path: str) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """Return (connection descs, (line, direction) detail heads) from one dump."""
+    with open(xml_path, "rb") as f:
+        data = f.read()
+    if not any(n in data for n in NEEDLES):
+        return [], []
+    try:
+        root = ET.fromstring(data)
+    except ET.ParseError as e:
+        warn(f"XML invalide: {xml_path}: {e}")
+        return [], []
+    return _rows_from_attrs(node.attrib for node in root.iter("node"))
+
+
+def extract_rows_frames(run_dir: str) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """extract_rows() over every frame of a packed run (xml/frames.jsonl)."""
+    from tree_diff import iter_frames
+
+    conns: List[str] = []
+    heads: List[Tuple[str, str]] = []
+    try:
+        for _, _, recs in iter_frames(run_dir):
+            c, h = _rows_from_attrs(a for _, a in recs)
+            conns.extend(c)
+            heads.extend(h)
+    except (OSError, ValueError, KeyError, IndexError) as e:
+        warn(f"frames invalides: {run_dir}: {e}")
+    return conns, heads
+
+
+def _rows_from_attrs(nodes: Iterator[Dict[str, str]]) -> Tuple[List[str], List[Tuple[str, str]]]:
+    conns: List[str] = []
+    heads: List[Tuple[str, str]] = []
+    for a in nodes:
+        rid = a.get("resource-id", "")
+        if rid.endswith(":id/haf_connection_view"):
+            desc = _one_line(a.get("content-desc", ""))
+            if desc:
+                conns.append(desc)
+        elif rid.endswith(":id/journey_details_head"):
+            hm = HEAD_RE.match(_one_line(a.get("content-desc", "")))
+            if hm:
+                heads.append((hm.group(1).strip(), hm.group(2).strip()))
+    return conns, heads
+
+
+# ---------------- store ----------------
+
+
+def open_db(path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS checkpoint (
+          path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, rows INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS runs (
+          id INTEGER PRIMARY KEY,
+          run_dir TEXT UNIQUE, app TEXT, route TEXT, start TEXT, target TEXT, via TEXT, run_ts TEXT
+        );
+        CREATE TABLE IF NOT EXISTS connections (
+          run_id INTEGER REFERENCES runs(id),
+          route TEXT, run_ts TEXT, dep_ts TEXT, arr_ts TEXT,
+          duration_min INTEGER, changes INTEGER, lines TEXT, delay_min INTEGER, cancelled INTEGER,
+          desc_hash TEXT, raw TEXT,
+          UNIQUE(run_id, desc_hash)
+        );
+        CREATE TABLE IF NOT EXISTS details (
+          run_id INTEGER REFERENCES runs(id), line TEXT, direction TEXT,
+          UNIQUE(run_id, line, direction)
+        );
+        CREATE INDEX IF NOT EXISTS idx_conn_route_dep ON connections(route, dep_ts);
+        CREATE INDEX IF NOT EXISTS idx_conn_dep ON connections(dep_ts);
+        CREATE INDEX IF NOT EXISTS idx_conn_run_ts ON connections(run_ts);
+        CREATE INDEX IF NOT EXISTS idx_runs_route_ts ON runs(route, run_ts);
+        """
+    )
+    db.execute("INSERT OR IGNORE INTO meta(key, value) VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+    return db
+
+
+def _packed_names(frames_path: str) -> set:
+    # frame names sit at the head of each line: no need to decode the deltas
+    names = set()
+    with open(frames_path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            m = FRAME_NAME_RE.search(line, 0, 512)
+            if m:
+                names.add(m.group(1))
+    return names
+
+
+def iter_dump_files(root: str) -> Iterator[Tuple[str, str, str]]:
+    """
+    Yield (path, run_dir, app) for every `<run>/xml/frames.jsonl` and every
+    `<run>/xml/*.xml` below root (XML already packed in frames.jsonl skipped).
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in {"png", "viewers", "logs", "tmp"}]
+        if os.path.basename(dirpath) != "xml":
+            continue
+        run_dir = os.path.dirname(dirpath)
+        # multi-run layout: RUN_<ts>/<APP>/runs/<run>
+        parts = run_dir.split(os.sep)
+        app = parts[-3] if len(parts) >= 4 and parts[-4].startswith("RUN_") else ""
+        packed: set = set()
+        if FRAMES_NAME in filenames:
+            frames_path = os.path.join(dirpath, FRAMES_NAME)
+            try:
+                packed = _packed_names(frames_path)
+            except OSError:
+                continue
+            yield frames_path, run_dir, app
+        for fn in sorted(filenames):
+            if fn.endswith(".xml") and fn not in packed:
+                yield os.path.join(dirpath, fn), run_dir, app
+
+
+def read_trip_args(run_dir: str) -> Dict[str, str]:
+    """Raw scenario args (`<run>/trip.txt`, key=value), {} for runs without it."""
+    out: Dict[str, str] = {}
+    try:
+        with open(os.path.join(run_dir, TRIP_ARGS_NAME), "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                k, sep, v = line.rstrip("\n").partition("=")
+                if sep:
+                    out[k.strip()] = v.strip()
+    except OSError:
+        pass
+    return out
+
+
+def _run_id(db: sqlite3.Connection, cache: Dict[str, Optional[Tuple[int, Dict]]], run_dir: str, app: str):
+    if run_dir in cache:
+        return cache[run_dir]
+    info = parse_run_dir(os.path.basename(run_dir))
+    if not info:
+        cache[run_dir] = None
+        return None
+    # the dir name is safe_name'd (accents dropped): prefer the names the scenario got
+    args = read_trip_args(run_dir)
+    for k in ("start", "target", "via"):
+        if args.get(k) or (k == "via" and "via" in args):
+            info[k] = args[k]
+    route = _route_key(info["start"], info["target"])
+    db.execute(
+        "INSERT OR IGNORE INTO runs(run_dir, app, route, start, target, via, run_ts) VALUES (?,?,?,?,?,?,?)",
+        (run_dir, app, route, info["start"], info["target"], info["via"], info["run_ts"].isoformat(sep=" ")),
+    )
+    rid = db.execute("SELECT id FROM runs WHERE run_dir=?", (run_dir,)).fetchone()[0]
+    info["route"] = route
+    cache[run_dir] = (rid, info)
+    return cache[run_dir]
+
+
+def ingest(root: str, db_path: str, commit_every: int = 500) -> Dict[str, int]:
+    db = open_db(db_path)
+    seen = {p: (s, m) for p, s, m in db.execute("SELECT path, size, mtime_ns FROM checkpoint")}
+    runs: Dict[str, Optional[Tuple[int, Dict]]] = {}
+    stats = {"scanned": 0, "skipped": 0, "parsed": 0, "connections": 0, "details": 0}
+    t0 = time.monotonic()
+
+    for xml_path, run_dir, app in iter_dump_files(root):
+        stats["scanned"] += 1
+        try:
+            st = os.stat(xml_path)
+        except OSError:
+            continue
+        if seen.get(xml_path) == (st.st_size, st.st_mtime_ns):
+            stats["skipped"] += 1
+            continue
+
+        rows = 0
+        run = _run_id(db, runs, run_dir, app)
+        if run:
+            rid, info = run
+            if os.path.basename(xml_path) == FRAMES_NAME:
+                conns, heads = extract_rows_frames(run_dir)
+            else:
+                conns, heads = extract_rows(xml_path)
+            for desc in conns:
+                row = parse_connection_desc(desc, info["trip_date"], info["run_ts"])
+                if not row:
+                    continue
+                cur = db.execute(
+                    "INSERT OR IGNORE INTO connections(run_id, route, run_ts, dep_ts, arr_ts, duration_min,"
+                    " changes, lines, delay_min, cancelled, desc_hash, raw) VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+                    (
+                        rid, info["route"], info["run_ts"].isoformat(sep=" "), row["dep_ts"], row["arr_ts"],
+                        row["duration_min"], row["changes"], row["lines"], row["delay_min"], row["cancelled"],
+                        hashlib.sha1(desc.encode("utf-8")).hexdigest()[:16], desc,
+                    ),
+                )
+                rows += cur.rowcount
+                stats["connections"] += cur.rowcount
+            for line, direction in heads:
+                cur = db.execute(
+                    "INSERT OR IGNORE INTO details(run_id, line, direction) VALUES (?,?,?)", (rid, line, direction)
+                )
+                rows += cur.rowcount
+                stats["details"] += cur.rowcount
+
+        db.execute(
+            "INSERT OR REPLACE INTO checkpoint(path, size, mtime_ns, rows) VALUES (?,?,?,?)",
+            (xml_path, st.st_size, st.st_mtime_ns, rows),
+        )
+        stats["parsed"] += 1
+        if stats["parsed"] % commit_every == 0:
+            db.commit()
+
+    db.commit()
+    db.close()
+    log(
+        f"ingest: scanned={stats['scanned']} skipped={stats['skipped']} parsed={stats['parsed']}"
+        f" connections+={stats['connections']} details+={stats['details']} in {time.monotonic() - t0:.2f}s"
+    )
+    return stats
+
+
+def query(db_path: str, start: str, target: str, since: str, until: str, limit: int) -> List[Dict]:
+    db = open_db(db_path)
+    db.row_factory = sqlite3.Row
+    sql = "SELECT dep_ts, arr_ts, duration_min, changes, lines, delay_min, cancelled, run_ts FROM connections WHERE route=?"
+    params: List = [_route_key(start, target)]
+    if since:
+        sql += " AND dep_ts >= ?"
+        params.append(since)
+    if until:
+        sql += " AND dep_ts < ?"
+        params.append(until)
+    sql += " ORDER BY dep_ts, run_ts LIMIT ?"
+    params.append(limit)
+    out = [dict(r) for r in db.execute(sql, params)]
+    db.close()
+    return out
+
+
+# ---------------- main ----------------
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="CFL trip results -> SQLite (incremental)")
+    parser.add_argument("--db", default=_default_db(), help="SQLite path (env CFL_TRIPS_DB)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_ing = sub.add_parser("ingest", help="Parse new run XML dumps into the store")
+    p_ing.add_argument("--root", default=_default_root(), help="Artifacts root (env CFL_ARTIFACT_DIR)")
+
+    p_q = sub.add_parser("query", help="List departures for a route (JSON lines)")
+    p_q.add_argument("--start", required=True)
+    p_q.add_argument("--target", required=True)
+    p_q.add_argument("--since", default="", help="YYYY-MM-DD[ HH:MM] (inclusive)")
+    p_q.add_argument("--until", default="", help="YYYY-MM-DD[ HH:MM] (exclusive)")
+    p_q.add_argument("--limit", type=int, default=1000)
+
+    args = parser.parse_args()
+
+    if args.cmd == "ingest":
+        if not os.path.isdir(args.root):
+            warn(f"root introuvable: {args.root}")
+            return 1
+        ingest(os.path.abspath(args.root), args.db)
+        return 0
+
+    for row in query(args.db, args.start, args.target, args.since, args.until, args.limit):
+        print(json.dumps(row, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())